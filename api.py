@@ -0,0 +1,440 @@
+"""Обращения к API Stalcraft: адреса, ограничение частоты и устойчивое выполнение запросов"""
+import random
+import threading
+import time
+from collections import deque
+
+import profiling
+
+API_BASE = "https://eapi.stalcraft.net"
+DEFAULT_REGION = "ru"
+REGIONS = ("ru", "eu", "na", "sea")
+LOTS_PAGE_LIMIT = 200
+HISTORY_PAGE_LIMIT = 200
+DEFAULT_SCAN_RATE = 300  # запросов в минуту
+PAGE_WORKERS = 8
+
+# Повторы: не больше RETRY_ATTEMPTS попыток, пауза перед n-й - случайная
+# в [0, min(BACKOFF_CAP, BACKOFF_BASE * 2^n)] ("full jitter")
+RETRY_ATTEMPTS = 4
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 8.0
+RETRY_AFTER_CAP = 60
+# Бюджет повторов: каждый первый запрос добавляет RETRY_RATIO повтора,
+# RETRY_MIN повторов доступны всегда
+RETRY_RATIO = 0.2
+RETRY_MIN = 5
+# Размыкатель: после BREAKER_FAILURES неудач подряд конечная точка не
+# опрашивается BREAKER_OPEN секунд, затем пропускается один пробный запрос
+BREAKER_FAILURES = 5
+BREAKER_OPEN = 30
+# Дублирующий запрос отправляется, если ответа нет дольше p95 задержки
+# (не меньше HEDGE_MIN секунд); до HEDGE_SAMPLES замеров дублей нет
+HEDGE_MIN = 1.0
+HEDGE_SAMPLES = 20
+REQUEST_WORKERS = 64
+
+# Классы ошибок запроса
+RATE_LIMITED = 'rate_limited'  # 429
+SERVER = 'server'              # 5xx
+TIMEOUT = 'timeout'
+NETWORK = 'network'            # соединение, DNS, обрыв ответа
+AUTH = 'auth'                  # 401/403 - повтор не поможет
+CLIENT = 'client'              # прочие 4xx
+CIRCUIT_OPEN = 'circuit_open'  # конечная точка временно не опрашивается
+BUDGET = 'budget'              # бюджет повторов исчерпан
+RETRYABLE = (RATE_LIMITED, SERVER, TIMEOUT, NETWORK)
+# Эти ошибки говорят о недоступности API и размыкают цепь
+OUTAGE = (SERVER, TIMEOUT, NETWORK)
+
+_session = None
+_executors = {}
+_request_executor = None
+_shared_lock = threading.Lock()
+
+
+def lots_url(item_id, offset=0, limit=LOTS_PAGE_LIMIT, region=DEFAULT_REGION):
+    return f"{API_BASE}/{region}/auction/{item_id}/lots?sort=buyout_price&order=asc&limit={limit}&offset={offset}&additional=true"
+
+
+def history_url(item_id, region=DEFAULT_REGION):
+    return f"{API_BASE}/{region}/auction/{item_id}/history"
+
+
+def auth_headers(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+def session():
+    """Общая сессия requests с пулом соединений на все потоки"""
+    global _session
+    with _shared_lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            _session = requests.Session()
+            _session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=REQUEST_WORKERS))
+        return _session
+
+
+def use_session(replacement):
+    """Подменить общую сессию (повтор ответов из архива); возвращает прежнюю"""
+    global _session
+    with _shared_lock:
+        previous, _session = _session, replacement
+        return previous
+
+
+def page_executor(region=DEFAULT_REGION):
+    """Пул для параллельной загрузки страниц региона.
+
+    У каждого региона свой пул: задачи, ждущие лимита одного региона, не
+    занимают потоки другого. Соединения при этом общие (session()).
+    """
+    with _shared_lock:
+        executor = _executors.get(region)
+        if executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+
+            executor = ThreadPoolExecutor(max_workers=PAGE_WORKERS, thread_name_prefix=f"lots-page-{region}")
+            _executors[region] = executor
+        return executor
+
+
+class RateLimiter:
+    """Потокобезопасное ведро токенов: rate_per_minute запросов с запасом burst"""
+    def __init__(self, rate_per_minute, burst=None):
+        self.lock = threading.Lock()
+        self.set_rate(rate_per_minute, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+
+    def set_rate(self, rate_per_minute, burst=None):
+        with self.lock:
+            self.rate = max(rate_per_minute, 1) / 60.0
+            self.burst = burst if burst is not None else max(1, int(rate_per_minute // 10))
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, reserve=0):
+        """Взять токен без ожидания, оставив в ведре не меньше reserve токенов"""
+        with self.lock:
+            self._refill()
+            if self.tokens >= 1 + reserve:
+                self.tokens -= 1
+                return True
+            return False
+
+    def acquire(self, cancelled=None):
+        """Дождаться токена. cancelled() -> True прерывает ожидание (возвращает False)"""
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            if cancelled is not None and cancelled():
+                return False
+            time.sleep(min(wait, 0.5))
+
+
+class ApiError(Exception):
+    """Неудачный запрос к API с классом ошибки (kind) и кодом ответа, если он был"""
+    def __init__(self, kind, message, status=None, retry_after=None):
+        super().__init__(message)
+        self.kind = kind
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self):
+        return self.kind in RETRYABLE
+
+
+class RequestCancelled(Exception):
+    """Ожидание лимита или паузы перед повтором прервано отменой"""
+
+
+def classify_response(response):
+    """ApiError для неуспешного ответа, None для успешного"""
+    status = response.status_code
+    if status < 400:
+        return None
+    if status == 429:
+        try:
+            retry_after = min(max(float(response.headers.get('Retry-After', 5)), 0), RETRY_AFTER_CAP)
+        except ValueError:
+            retry_after = 5
+        return ApiError(RATE_LIMITED, f"лимит запросов (429), пауза {retry_after:.0f} с", status, retry_after)
+    if status >= 500:
+        return ApiError(SERVER, f"ошибка сервера {status}", status)
+    if status in (401, 403):
+        return ApiError(AUTH, f"доступ запрещён ({status}), проверьте токен", status)
+    return ApiError(CLIENT, f"ошибка запроса {status}", status)
+
+
+def classify_exception(error):
+    """ApiError для исключения requests"""
+    import requests
+
+    if isinstance(error, requests.exceptions.Timeout):
+        return ApiError(TIMEOUT, f"нет ответа: {error}")
+    return ApiError(NETWORK, f"ошибка сети: {error}")
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_CAP, rnd=random):
+    """Пауза перед повтором attempt (1, 2, ...): экспонента с полным джиттером"""
+    return rnd.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class RetryBudget:
+    """Ограничение повторов: доля от числа первых запросов плюс постоянный запас.
+
+    Пока API отвечает, повторов мало и бюджет не мешает; при сбое повторы
+    быстро его исчерпывают, и запросы перестают умножаться.
+    """
+    def __init__(self, ratio=RETRY_RATIO, minimum=RETRY_MIN):
+        self.lock = threading.Lock()
+        self.ratio = ratio
+        self.tokens = float(minimum)
+        self.retries = 0
+        self.refused = 0
+
+    def deposit(self):
+        with self.lock:
+            self.tokens += self.ratio
+
+    def withdraw(self):
+        """Взять повтор; False - бюджет исчерпан"""
+        with self.lock:
+            if self.tokens >= 1:
+                self.tokens -= 1
+                self.retries += 1
+                return True
+            self.refused += 1
+            return False
+
+
+class CircuitBreaker:
+    """Размыкатель цепи одной конечной точки (регион, вид запроса)"""
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failures=BREAKER_FAILURES, open_seconds=BREAKER_OPEN, clock=time.monotonic):
+        self.lock = threading.Lock()
+        self.failure_limit = failures
+        self.open_seconds = open_seconds
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened = 0.0
+
+    def allow(self):
+        """Можно ли отправить запрос; в полуоткрытом состоянии - только один пробный"""
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and self.clock() - self.opened >= self.open_seconds:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def is_open(self):
+        """Цепь разомкнута и время пробного запроса ещё не пришло"""
+        with self.lock:
+            return self.state != self.CLOSED and self.clock() - self.opened < self.open_seconds
+
+    def retry_in(self):
+        with self.lock:
+            return max(0.0, self.opened + self.open_seconds - self.clock())
+
+    def record_success(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        """Учесть сбой; True - цепь только что разомкнулась"""
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_limit):
+                self.state = self.OPEN
+                self.opened = self.clock()
+                return True
+            return False
+
+    def release(self):
+        """Пробный запрос не дал ответа о состоянии API (429, отмена) - разрешить новый"""
+        with self.lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+                self.opened = self.clock() - self.open_seconds
+
+
+class RequestExecutor:
+    """GET к API с классификацией ошибок, повторами, размыкателем и дублями.
+
+    Запрос выполняется в общем пуле потоков, вызывающий поток ждёт ответа.
+    Если ответа нет дольше p95 задержки конечной точки, отправляется дубль
+    (при свободном токене лимита и повторе в бюджете) и берётся первый
+    успешный ответ. Отмена (cancelled() -> True) прерывает ожидание лимита
+    и паузы перед повтором исключением RequestCancelled.
+    """
+    def __init__(self, attempts=RETRY_ATTEMPTS, workers=REQUEST_WORKERS, clock=time.monotonic, pause=True):
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.attempts = attempts
+        # clock - часы размыкателей; pause=False - повторы без пауз (повтор архива)
+        self.clock = clock
+        self.pause = pause
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="api-request")
+        self.lock = threading.Lock()
+        self.breakers = {}
+        self.latencies = {}
+        self.hedge_delays = {}
+        # Бюджет запросов вне циклов проверки (история, скринер)
+        self.budget = RetryBudget()
+        self.hedges = 0
+
+    def breaker(self, endpoint):
+        with self.lock:
+            breaker = self.breakers.get(endpoint)
+            if breaker is None:
+                breaker = self.breakers[endpoint] = CircuitBreaker(clock=self.clock)
+            return breaker
+
+    def hedge_delay(self, endpoint):
+        """Задержка до дубля (None - замеров пока мало)"""
+        with self.lock:
+            return self.hedge_delays.get(endpoint)
+
+    def _record_latency(self, endpoint, seconds):
+        with self.lock:
+            samples = self.latencies.get(endpoint)
+            if samples is None:
+                samples = self.latencies[endpoint] = deque(maxlen=200)
+            samples.append(seconds)
+            # p95 пересчитывается раз в несколько замеров, а не на каждый запрос
+            if len(samples) >= HEDGE_SAMPLES and len(samples) % 10 == 0:
+                ordered = sorted(samples)
+                self.hedge_delays[endpoint] = max(HEDGE_MIN, ordered[int(len(ordered) * 0.95)])
+
+    def _send(self, url, headers, params, timeout):
+        started = time.monotonic()
+        try:
+            response = session().get(url, headers=headers, params=params, timeout=timeout)
+        finally:
+            profiling.timers.add('api.request', time.monotonic() - started)
+        return response, time.monotonic() - started
+
+    def _attempt(self, url, headers, params, timeout, endpoint, limiter, budget, cancelled, observe):
+        """Один запрос (возможно, с дублем): ответ или ApiError"""
+        from concurrent.futures import FIRST_COMPLETED, wait
+
+        futures = [self.pool.submit(self._send, url, headers, params, timeout)]
+        delay = self.hedge_delay(endpoint)
+        if delay is not None:
+            done, _ = wait(futures, timeout=delay)
+            if not done and not (cancelled is not None and cancelled()) and \
+                    (limiter is None or limiter.try_acquire()) and budget.withdraw():
+                futures.append(self.pool.submit(self._send, url, headers, params, timeout))
+                with self.lock:
+                    self.hedges += 1
+
+        error = None
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    response, elapsed = future.result()
+                except Exception as e:
+                    error = error or classify_exception(e)
+                    continue
+                if observe is not None:
+                    observe(response)
+                failure = classify_response(response)
+                if failure is None:
+                    self._record_latency(endpoint, elapsed)
+                    # Оставшийся дубль досчитается в пуле, его ответ не нужен
+                    return response
+                if error is None or error.kind in OUTAGE:
+                    error = failure
+        raise error
+
+    def get(self, url, headers=None, params=None, endpoint=None, limiter=None, budget=None,
+            cancelled=None, observe=None, timeout=15):
+        """Успешный ответ (код < 400) или ApiError.
+
+        endpoint - ключ размыкателя и статистики задержек, например
+        (регион, 'lots'); budget - бюджет повторов цикла (по умолчанию общий);
+        observe(response) вызывается для каждого полученного ответа, включая
+        неуспешные и дубли.
+        """
+        budget = budget or self.budget
+        breaker = self.breaker(endpoint)
+        budget.deposit()
+        error = None
+        for attempt in range(self.attempts):
+            if attempt:
+                if not error.retryable:
+                    break
+                if not budget.withdraw():
+                    raise ApiError(BUDGET, f"{error}; бюджет повторов исчерпан", error.status)
+                pause = error.retry_after if error.kind == RATE_LIMITED else backoff_delay(attempt)
+                self._sleep(pause if self.pause else 0, cancelled)
+            if not breaker.allow():
+                raise ApiError(CIRCUIT_OPEN, f"API недоступен, следующая попытка через {breaker.retry_in():.0f} с",
+                               error.status if error else None)
+            with profiling.measure('api.rate_wait'):
+                acquired = limiter is None or limiter.acquire(cancelled)
+            if not acquired:
+                breaker.release()
+                raise RequestCancelled()
+            try:
+                response = self._attempt(url, headers, params, timeout, endpoint, limiter, budget, cancelled, observe)
+            except ApiError as e:
+                error = e
+                if e.kind in OUTAGE:
+                    breaker.record_failure()
+                elif e.kind == RATE_LIMITED:
+                    breaker.release()
+                else:
+                    # Сервер ответил - цепь исправна
+                    breaker.record_success()
+                continue
+            breaker.record_success()
+            return response
+        raise error
+
+    @staticmethod
+    def _sleep(seconds, cancelled):
+        end = time.monotonic() + seconds
+        while True:
+            if cancelled is not None and cancelled():
+                raise RequestCancelled()
+            left = end - time.monotonic()
+            if left <= 0:
+                return
+            time.sleep(min(left, 0.25))
+
+
+def executor():
+    """Общий исполнитель запросов: размыкатели и задержки общие для всех потоков"""
+    global _request_executor
+    with _shared_lock:
+        if _request_executor is None:
+            _request_executor = RequestExecutor()
+        return _request_executor
+
+
+def use_executor(replacement):
+    """Подменить общий исполнитель запросов; возвращает прежний"""
+    global _request_executor
+    with _shared_lock:
+        previous, _request_executor = _request_executor, replacement
+        return previous
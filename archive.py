@@ -0,0 +1,392 @@
+"""Архив сырых ответов API (страницы лотов и истории) для разбора и повтора.
+
+Ответы пишутся фоновым потоком в сегменты segment-<N>.zst: каждый ответ -
+отдельный кадр zstd, поэтому любой читается без распаковки соседних.
+Страницы почти одинаковы по структуре, поэтому после первых DICT_SAMPLES
+ответов обучается словарь, и каждый следующий сегмент сжимается словарём,
+обученным на ответах предыдущего. Индекс (время, регион, предмет, вид,
+смещение страницы, сегмент, позиция) хранится в index.db рядом с
+сегментами. При превышении max_bytes удаляются самые старые сегменты.
+
+Архив не должен замедлять проверку цен: record() только кладёт ответ в
+очередь; если писатель не успевает, ответы отбрасываются (dropped).
+"""
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from collections import namedtuple
+from urllib.parse import parse_qs, urlparse
+
+DIRECTORY = 'archive'
+SEGMENT_BYTES = 16 * 1024 * 1024
+SEGMENT_SECONDS = 86400
+DICT_SIZE = 64 * 1024
+DICT_SAMPLES = 256
+LEVEL = 3
+QUEUE_LIMIT = 2000
+FLUSH_SECONDS = 1.0
+
+# Строка индекса
+Entry = namedtuple('Entry', 'id time region item_id kind page status segment offset length raw_length')
+
+_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS segments (
+        id INTEGER PRIMARY KEY,
+        file TEXT NOT NULL,
+        dict_id INTEGER NOT NULL,
+        created INTEGER NOT NULL,
+        bytes INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS records (
+        id INTEGER PRIMARY KEY,
+        time REAL NOT NULL,
+        region TEXT NOT NULL,
+        item_id TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        page INTEGER NOT NULL,
+        status INTEGER NOT NULL,
+        segment INTEGER NOT NULL,
+        offset INTEGER NOT NULL,
+        length INTEGER NOT NULL,
+        raw_length INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_records_item_time ON records (item_id, region, kind, time);
+    CREATE INDEX IF NOT EXISTS idx_records_time ON records (time);
+    CREATE INDEX IF NOT EXISTS idx_records_segment ON records (segment);
+'''
+
+
+def default_directory():
+    """Каталог архива рядом с программой (как listing.json и лог)"""
+    if getattr(sys, 'frozen', False):
+        base = os.path.dirname(sys.executable)
+    else:
+        base = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(base, DIRECTORY)
+
+
+def _dict_path(directory, dict_id):
+    return os.path.join(directory, f'dict-{dict_id}.zdict')
+
+
+class ResponseArchive:
+    """Запись ответов в сегменты; все операции с файлами - в потоке писателя"""
+    def __init__(self, directory, max_bytes):
+        import zstandard
+
+        self.zstd = zstandard
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # Лимит соблюдается с точностью до сегмента - при маленьком лимите сегменты мельче
+        self.segment_bytes = max(min(SEGMENT_BYTES, max_bytes // 4), 256 * 1024)
+        self.queue = queue.Queue(maxsize=QUEUE_LIMIT)
+        self.dropped = 0
+        self.written = 0
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+        os.makedirs(directory, exist_ok=True)
+        self.thread = threading.Thread(target=self._run, name="response-archive", daemon=True)
+        self.thread.start()
+
+    def record(self, kind, region, item_id, page, status, body):
+        """Поставить ответ в очередь записи (kind: 'lots' или 'history')"""
+        try:
+            self.queue.put_nowait((time.time(), region, item_id, kind, page, status, body))
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        """Дописать очередь и закрыть сегмент"""
+        self.queue.put(None)
+        self.thread.join()
+
+    # --- поток писателя ---
+
+    def _run(self):
+        conn = sqlite3.connect(os.path.join(self.directory, 'index.db'))
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(_SCHEMA)
+        self.conn = conn
+        self.samples = []
+        self.segment = None
+        try:
+            self._open_segment(self._last_dict())
+            flushed = time.monotonic()
+            while True:
+                try:
+                    item = self.queue.get(timeout=FLUSH_SECONDS)
+                except queue.Empty:
+                    item = ()
+                if item is None:
+                    break
+                if item:
+                    self._write(*item)
+                if time.monotonic() - flushed >= FLUSH_SECONDS:
+                    self.file.flush()
+                    conn.commit()
+                    flushed = time.monotonic()
+        finally:
+            if self.segment is not None:
+                self.file.close()
+                self._update_segment_size()
+            conn.commit()
+            conn.close()
+
+    def _last_dict(self):
+        """Словарь последнего сегмента (после перезапуска обучение не повторяется)"""
+        row = self.conn.execute('SELECT dict_id FROM segments ORDER BY id DESC LIMIT 1').fetchone()
+        if row and row[0] and os.path.exists(_dict_path(self.directory, row[0])):
+            with open(_dict_path(self.directory, row[0]), 'rb') as f:
+                return self.zstd.ZstdCompressionDict(f.read())
+        return None
+
+    def _open_segment(self, dictionary):
+        self.dictionary = dictionary
+        dict_id = dictionary.dict_id() if dictionary is not None else 0
+        self.compressor = self.zstd.ZstdCompressor(level=LEVEL, dict_data=dictionary, write_content_size=True)
+        cursor = self.conn.execute('INSERT INTO segments (file, dict_id, created) VALUES (?, ?, ?)',
+                                   ('', dict_id, int(time.time())))
+        self.segment = cursor.lastrowid
+        self.segment_file = f'segment-{self.segment:06d}.zst'
+        self.conn.execute('UPDATE segments SET file = ? WHERE id = ?', (self.segment_file, self.segment))
+        self.conn.commit()
+        self.file = open(os.path.join(self.directory, self.segment_file), 'ab')
+        self.segment_started = time.time()
+
+    def _write(self, when, region, item_id, kind, page, status, body):
+        frame = self.compressor.compress(body)
+        offset = self.file.tell()
+        self.file.write(frame)
+        self.conn.execute('''
+            INSERT INTO records (time, region, item_id, kind, page, status, segment, offset, length, raw_length)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (when, region, item_id, kind, page, status, self.segment, offset, len(frame), len(body)))
+        self.written += 1
+        self.raw_bytes += len(body)
+        self.stored_bytes += len(frame)
+
+        # Выборка ответов сегмента для словаря следующего: первые DICT_SAMPLES,
+        # дальше каждый седьмой ответ заменяет один из образцов
+        if len(self.samples) < DICT_SAMPLES:
+            self.samples.append(body)
+        elif self.written % 7 == 0:
+            self.samples[self.written % DICT_SAMPLES] = body
+
+        untrained = self.dictionary is None and len(self.samples) >= DICT_SAMPLES
+        if untrained or offset + len(frame) >= self.segment_bytes or time.time() - self.segment_started >= SEGMENT_SECONDS:
+            self._roll()
+
+    def _roll(self):
+        """Закрыть сегмент, обучить словарь на его ответах и начать новый"""
+        self.file.close()
+        self._update_segment_size()
+        dictionary = self.dictionary
+        if len(self.samples) >= DICT_SAMPLES:
+            try:
+                dictionary = self.zstd.train_dictionary(DICT_SIZE, self.samples, level=LEVEL)
+                with open(_dict_path(self.directory, dictionary.dict_id()), 'wb') as f:
+                    f.write(dictionary.as_bytes())
+            except self.zstd.ZstdError:
+                # Слишком однообразные ответы - остаётся прежний словарь
+                dictionary = self.dictionary
+        self.samples = []
+        self._open_segment(dictionary)
+        self._enforce_cap()
+
+    def _update_segment_size(self):
+        size = os.path.getsize(os.path.join(self.directory, self.segment_file))
+        self.conn.execute('UPDATE segments SET bytes = ? WHERE id = ?', (size, self.segment))
+        self.conn.commit()
+
+    def _enforce_cap(self):
+        """Удалить самые старые закрытые сегменты сверх max_bytes"""
+        segments = self.conn.execute('SELECT id, file, bytes FROM segments ORDER BY id').fetchall()
+        total = sum(size for _, _, size in segments)
+        for segment, name, size in segments:
+            if total <= self.max_bytes or segment == self.segment:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            self.conn.execute('DELETE FROM records WHERE segment = ?', (segment,))
+            self.conn.execute('DELETE FROM segments WHERE id = ?', (segment,))
+            total -= size
+        used = {row[0] for row in self.conn.execute('SELECT DISTINCT dict_id FROM segments')}
+        for name in os.listdir(self.directory):
+            if name.startswith('dict-') and name.endswith('.zdict') and int(name[5:-6]) not in used:
+                os.remove(os.path.join(self.directory, name))
+        self.conn.commit()
+
+
+class ArchiveReader:
+    """Поиск и чтение ответов архива (можно читать, пока идёт запись)"""
+    def __init__(self, directory):
+        import zstandard
+
+        self.zstd = zstandard
+        self.directory = directory
+        path = os.path.join(directory, 'index.db')
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Архив не найден: {directory}")
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.decompressors = {}
+        self.segment_files = {}
+
+    def find(self, item_id=None, region=None, kind=None, since=None, until=None, page=None, limit=-1):
+        """Строки индекса (Entry) по возрастанию времени"""
+        query = 'SELECT id, time, region, item_id, kind, page, status, segment, offset, length, raw_length FROM records WHERE 1'
+        params = []
+        for column, value in (('item_id', item_id), ('region', region), ('kind', kind), ('page', page)):
+            if value is not None:
+                query += f' AND {column} = ?'
+                params.append(value)
+        if since is not None:
+            query += ' AND time >= ?'
+            params.append(since)
+        if until is not None:
+            query += ' AND time < ?'
+            params.append(until)
+        query += ' ORDER BY time LIMIT ?'
+        params.append(limit)
+        with self.lock:
+            return [Entry(*row) for row in self.conn.execute(query, params).fetchall()]
+
+    def read(self, entry):
+        """Исходное тело ответа"""
+        with self.lock:
+            name, dict_id = self.segment_files.get(entry.segment, (None, None))
+            if name is None:
+                row = self.conn.execute('SELECT file, dict_id FROM segments WHERE id = ?', (entry.segment,)).fetchone()
+                if row is None:
+                    raise KeyError(f"Сегмент {entry.segment} удалён")
+                name, dict_id = self.segment_files[entry.segment] = row
+            decompressor = self.decompressors.get(dict_id)
+            if decompressor is None:
+                dictionary = None
+                if dict_id:
+                    with open(_dict_path(self.directory, dict_id), 'rb') as f:
+                        dictionary = self.zstd.ZstdCompressionDict(f.read())
+                decompressor = self.decompressors[dict_id] = self.zstd.ZstdDecompressor(dict_data=dictionary)
+        with open(os.path.join(self.directory, name), 'rb') as f:
+            f.seek(entry.offset)
+            frame = f.read(entry.length)
+        return decompressor.decompress(frame, max_output_size=entry.raw_length)
+
+    def stats(self):
+        """(ответов, байт исходных, байт сжатых, сегментов)"""
+        with self.lock:
+            records, raw, stored = self.conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(raw_length), 0), COALESCE(SUM(length), 0) FROM records').fetchone()
+            segments = self.conn.execute('SELECT COUNT(*) FROM segments').fetchone()[0]
+        return records, raw, stored, segments
+
+
+class _ReplayResponse:
+    """Ответ из архива с интерфейсом requests.Response, нужным сканеру"""
+    def __init__(self, status_code, content):
+        self.status_code = status_code
+        self.content = content
+        self.headers = {}
+
+    def json(self):
+        import json
+
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            import requests
+
+            raise requests.exceptions.HTTPError(f"{self.status_code} (из архива)", response=self)
+
+
+class ReplaySession:
+    """Заменяет api.session() при повторе: отдаёт архивные ответы на тот же
+    запрос в окне [start, end) по порядку - повторные попытки получают
+    следующие ответы, как при записи"""
+    def __init__(self, reader):
+        self.reader = reader
+        self.start = 0
+        self.end = 0
+        self.served = {}
+
+    def set_window(self, start, end):
+        self.start = start
+        self.end = end
+        self.served.clear()
+
+    def get(self, url, headers=None, params=None, timeout=None):
+        parsed = urlparse(url)
+        query = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+        query.update({key: str(value) for key, value in (params or {}).items()})
+        # /<регион>/auction/<item_id>/<lots|history>
+        region, _, item_id, kind = parsed.path.strip('/').split('/')[:4]
+        page = int(query.get('offset', 0))
+        key = (kind, region, item_id, page)
+        attempt = self.served.get(key, 0)
+        self.served[key] = attempt + 1
+        entries = self.reader.find(item_id, region, kind, since=self.start, until=self.end,
+                                   page=page, limit=attempt + 1)
+        if not entries:
+            return _ReplayResponse(404, b'{}')
+        entry = entries[min(attempt, len(entries) - 1)]
+        return _ReplayResponse(entry.status, self.reader.read(entry))
+
+
+def replay_scans(reader, targets, since=None, until=None, on_event=print):
+    """Прогнать архивные страницы лотов через PageChecker.
+
+    Каждая архивная первая страница предмета - отдельная проверка; остальные
+    страницы берутся из ответов до следующей первой страницы. on_event
+    получает (время, вид, данные) для минимальных цен и оповещений.
+    """
+    from PyQt5.QtCore import QObject, pyqtSignal
+
+    import api
+    import index
+    import liquidity
+    import scan
+
+    class ReplaySink(QObject):
+        profitable_stack_found = pyqtSignal(str, int, int, int, int, int, str, str, int, str)
+        price_anomaly_found = pyqtSignal(str, int, int, int, int, int, float, str, int, str)
+        error_occurred = pyqtSignal(str)
+        request_finished = pyqtSignal(object)
+
+    sink = ReplaySink()
+    sink.lot_tracker = liquidity.LotTracker()
+    sink.archive = None
+    session = ReplaySession(reader)
+    clock = [0]
+    sink.profitable_stack_found.connect(lambda *args: on_event(clock[0], 'lot', args))
+    sink.price_anomaly_found.connect(lambda *args: on_event(clock[0], 'anomaly', args))
+    sink.error_occurred.connect(lambda message: on_event(clock[0], 'error', message))
+
+    # Ограничитель без ожидания: запросы обслуживает архив
+    limiter = api.RateLimiter(10 ** 9)
+    previous = api.use_session(session)
+    # Повторы без пауз, размыкатели - по времени архива
+    previous_executor = api.use_executor(api.RequestExecutor(clock=lambda: clock[0], pause=False))
+    checks = 0
+    try:
+        for target in targets:
+            starts = [entry.time for entry in reader.find(target.item_id, target.region, 'lots', since, until, page=0)]
+            for i, start in enumerate(starts):
+                session.set_window(start, starts[i + 1] if i + 1 < len(starts) else start + SEGMENT_SECONDS)
+                clock[0] = start
+                # Лоты судятся по времени архивного ответа, а не по текущему
+                cycle = scan.ScanCycle([target], '', SEGMENT_SECONDS, {target.region: limiter},
+                                       clock=lambda start=start: start)
+                index.PageChecker(cycle, target, sink).run()
+                for row_id, price, lots in cycle.mins.items():
+                    on_event(start, 'min', (target.item_id, target.region, target.rarity, price, lots))
+                checks += 1
+    finally:
+        api.use_session(previous)
+        api.use_executor(previous_executor)
+    return checks, sink.lot_tracker.drain()
@@ -0,0 +1,127 @@
+"""Проверка порогов оповещений на сохранённой истории сделок.
+
+Каждая сделка из price_history считается лотом, выставленным по этой цене.
+Для сетки параметров считается, сколько раз сработало бы оповещение и
+какую прибыль оно принесло бы при перепродаже по средневзвешенной цене
+сделок следующих horizon секунд.
+
+Режимы:
+    target  - цена за штуку <= моей цены; при min_amount > 1 - только стаки
+              (как стандартная проверка стаков в PageChecker)
+    percent - цена за штуку ниже VWAP за reference секунд до сделки на pct %.
+              PageChecker считает процент от минимальной цены текущей
+              страницы лотов, а её в истории сделок нет - режим оценивает
+              близкую по смыслу настройку, а не повторяет живую проверку
+
+Лотов в агрегатах нет, поэтому читаются только отдельные сделки: период
+старше их срока хранения (history_raw_days) обрезается, run_backtest
+возвращает фактическое начало.
+
+Условие "значение <= порог" считается для всей сетки сразу: сделки
+сортируются по значению, число попаданий и прибыль берутся из префиксных
+сумм, позиция порога - через searchsorted.
+"""
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from api import DEFAULT_REGION
+from database import db, DAY
+
+# threshold - моя цена (target) или процент ниже средней (percent)
+Result = namedtuple('Result', 'mode item_id qlt min_amount threshold hits units profit')
+
+AUTO_TARGETS = 50
+
+
+def load_sales(item_id, since, qlt=None, region=DEFAULT_REGION):
+    """Сделки предмета по редкостям: {qlt: (time, price, amount)}, по возрастанию времени"""
+    rows = db.get_price_history(item_id, limit=-1, qlt_filter=qlt, since=since, region=region)
+    if not rows:
+        return {}
+    data = np.array(rows, dtype=np.int64)[::-1]
+    sales = {}
+    for value in np.unique(data[:, 3]).tolist():
+        part = data[data[:, 3] == value]
+        order = np.argsort(part[:, 0], kind='stable')
+        part = part[order]
+        sales[value] = (part[:, 0], part[:, 1], np.maximum(part[:, 2], 1))
+    return sales
+
+
+def window_vwap(times, prices, amounts, before, after):
+    """VWAP за штуку в окне вокруг каждой сделки.
+
+    before > 0: сделки [t - before, t); after > 0: сделки (t, t + after].
+    Где в окне нет сделок - NaN.
+    """
+    volume = np.concatenate(([0], np.cumsum(amounts)))
+    turnover = np.concatenate(([0], np.cumsum(prices)))
+    if before:
+        lo = np.searchsorted(times, times - before, side='left')
+        hi = np.searchsorted(times, times, side='left')
+    else:
+        lo = np.searchsorted(times, times, side='right')
+        hi = np.searchsorted(times, times + after, side='right')
+    window_volume = volume[hi] - volume[lo]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(window_volume > 0, (turnover[hi] - turnover[lo]) / window_volume, np.nan)
+
+
+def sweep_thresholds(values, units, gains, thresholds):
+    """Для каждого порога: (сделок с value <= порог, штук в них, прибыль)"""
+    order = np.argsort(values, kind='stable')
+    sorted_values = values[order]
+    cum_units = np.concatenate(([0], np.cumsum(units[order])))
+    cum_gains = np.concatenate(([0.0], np.cumsum(gains[order])))
+    hits = np.searchsorted(sorted_values, thresholds, side='right')
+    return hits, cum_units[hits], cum_gains[hits]
+
+
+def auto_targets(unit_prices, count=AUTO_TARGETS):
+    """Сетка моих цен по перцентилям 1..50 истории предмета"""
+    return np.unique(np.percentile(unit_prices, np.linspace(1, 50, count)).astype(np.int64))
+
+
+def backtest_item(item_id, sales, targets=None, percentages=(), min_amounts=(1,), reference=7 * DAY, horizon=DAY):
+    """Результаты по всей сетке для сделок одного предмета (см. load_sales)"""
+    results = []
+    percentages = np.asarray(percentages, dtype=np.float64)
+    for qlt, (times, prices, amounts) in sorted(sales.items()):
+        units = prices // amounts
+        resale = window_vwap(times, prices, amounts, 0, horizon)
+        # Прибыль сделки: перепродажа по средней цене следующего окна
+        gains = np.nan_to_num((resale - units) * amounts)
+        ratio = units / window_vwap(times, prices, amounts, reference, 0)
+        grid = np.asarray(targets if targets is not None else auto_targets(units), dtype=np.int64)
+
+        for min_amount in min_amounts:
+            selected = amounts >= min_amount
+            if not selected.any():
+                continue
+            if len(grid):
+                hits, lot_units, profit = sweep_thresholds(units[selected], amounts[selected], gains[selected], grid)
+                results.extend(Result('target', item_id, qlt, min_amount, int(t), int(h), int(u), float(p))
+                               for t, h, u, p in zip(grid.tolist(), hits.tolist(), lot_units.tolist(), profit.tolist()))
+            known = selected & ~np.isnan(ratio)
+            if len(percentages) and known.any():
+                hits, lot_units, profit = sweep_thresholds(ratio[known], amounts[known], gains[known],
+                                                           1 - percentages / 100)
+                results.extend(Result('percent', item_id, qlt, min_amount, float(pct), int(h), int(u), float(p))
+                               for pct, h, u, p in zip(percentages.tolist(), hits.tolist(), lot_units.tolist(), profit.tolist()))
+    return results
+
+
+def run_backtest(item_ids, days=90, qlt=None, region=DEFAULT_REGION, targets=None, percentages=(), min_amounts=(1,),
+                 reference=7 * DAY, horizon=DAY, now=None):
+    """Прогнать сетку по предметам. Возвращает (результаты, сделок, секунд, начало периода)"""
+    started = time.perf_counter()
+    since = max(int(now if now is not None else time.time()) - days * DAY, db.get_raw_history_since())
+    results = []
+    sales_count = 0
+    for item_id in item_ids:
+        sales = load_sales(item_id, since, qlt, region)
+        sales_count += sum(len(times) for times, _, _ in sales.values())
+        results += backtest_item(item_id, sales, targets, percentages, min_amounts, reference, horizon)
+    return results, sales_count, time.perf_counter() - started, since
@@ -0,0 +1,119 @@
+"""Размер и накладные расходы архива ответов API.
+
+Генерирует синтетические страницы лотов в формате API (по --lots лотов,
+случайные цены, время и дополнительные поля), затем замеряет:
+    - разбор JSON страницы (то, что сканер делает в любом случае)
+    - время record() в потоке проверки (постановка в очередь)
+    - пропускную способность потока записи (сжатие + индекс)
+    - степень сжатия без словаря и со словарём
+    - время чтения случайного ответа по индексу
+
+Запуск из корня репозитория:
+    python benchmarks/archive.py [--pages 5000] [--lots 200] [--dir bench_archive]
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import zstandard
+
+import archive
+
+
+def synthetic_page(rnd, item_id, offset, now, count=200):
+    """Страница лотов, похожая на ответ /lots"""
+    lots = []
+    price = rnd.randrange(1000, 50000)
+    for i in range(count):
+        price += rnd.randrange(0, 500)
+        amount = rnd.choice((1, 1, 1, 2, 5, 10, 50, 100))
+        start = now - rnd.randrange(0, 86400 * 2)
+        lot = {
+            'itemId': item_id,
+            'amount': amount,
+            'startPrice': price * amount // 2,
+            'buyoutPrice': price * amount,
+            'startTime': datetime.datetime.fromtimestamp(start, datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'endTime': datetime.datetime.fromtimestamp(start + 86400 * 2, datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'additional': {'qlt': rnd.randrange(6), 'ptn': rnd.randrange(16)} if rnd.random() < 0.7 else {},
+        }
+        if rnd.random() < 0.3:
+            lot['currentPrice'] = lot['startPrice'] + rnd.randrange(1, 1000)
+        lots.append(lot)
+    return json.dumps({'total': 200 + offset + rnd.randrange(1000), 'lots': lots}).encode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', type=int, default=5000)
+    parser.add_argument('--items', type=int, default=300)
+    parser.add_argument('--lots', type=int, default=200, help="Лотов на странице (у редких предметов страницы короткие)")
+    parser.add_argument('--dir', default='bench_archive')
+    args = parser.parse_args()
+
+    rnd = random.Random(1)
+    now = int(time.time())
+    pages = [(f"it{rnd.randrange(args.items):04d}", rnd.choice((0, 0, 200, 400))) for _ in range(args.pages)]
+    bodies = [synthetic_page(rnd, item_id, offset, now, args.lots) for item_id, offset in pages]
+    raw = sum(len(body) for body in bodies)
+    print(f"Страниц: {len(bodies)}, исходно {raw / 2 ** 20:.1f} МБ, в среднем {raw // len(bodies)} байт")
+
+    started = time.perf_counter()
+    for body in bodies:
+        json.loads(body)
+    parse_us = (time.perf_counter() - started) / len(bodies) * 1e6
+    print(f"Разбор JSON страницы (сканер): {parse_us:.0f} мкс")
+
+    # Сжатие кадрами по одному ответу: без словаря и со словарём по первым страницам
+    plain = zstandard.ZstdCompressor(level=archive.LEVEL)
+    plain_size = sum(len(plain.compress(body)) for body in bodies)
+    dictionary = zstandard.train_dictionary(archive.DICT_SIZE, bodies[:archive.DICT_SAMPLES], level=archive.LEVEL)
+    with_dict = zstandard.ZstdCompressor(level=archive.LEVEL, dict_data=dictionary)
+    dict_size = sum(len(with_dict.compress(body)) for body in bodies[archive.DICT_SAMPLES:])
+    dict_raw = sum(len(body) for body in bodies[archive.DICT_SAMPLES:])
+    print(f"Сжатие без словаря: x{raw / plain_size:.1f}; со словарём: x{dict_raw / dict_size:.1f}")
+
+    shutil.rmtree(args.dir, ignore_errors=True)
+    store = archive.ResponseArchive(args.dir, 1024 * 2 ** 20)
+    record_times = []
+    started = time.perf_counter()
+    for (item_id, offset), body in zip(pages, bodies):
+        t = time.perf_counter()
+        store.record('lots', 'ru', item_id, offset, 200, body)
+        record_times.append(time.perf_counter() - t)
+        # Темп как у проверки: очередь не должна переполняться
+        while store.queue.qsize() > archive.QUEUE_LIMIT // 2:
+            time.sleep(0.001)
+    store.close()
+    elapsed = time.perf_counter() - started
+    print(f"record() в потоке проверки: медиана {statistics.median(record_times) * 1e6:.1f} мкс, "
+          f"макс. {max(record_times) * 1e6:.0f} мкс")
+    print(f"Запись: {len(bodies) / elapsed:.0f} страниц/с ({raw / elapsed / 2 ** 20:.1f} МБ/с), "
+          f"отброшено: {store.dropped}")
+
+    reader = archive.ArchiveReader(args.dir)
+    records, raw_total, stored, segments = reader.stats()
+    on_disk = sum(os.path.getsize(os.path.join(args.dir, name)) for name in os.listdir(args.dir))
+    print(f"Архив: {records} ответов в {segments} сегментах, сжато x{raw_total / stored:.1f}, "
+          f"на диске вместе с индексом и словарями {on_disk / 2 ** 20:.2f} МБ")
+
+    entries = reader.find()
+    sample = random.Random(2).sample(entries, min(500, len(entries)))
+    started = time.perf_counter()
+    for entry in sample:
+        found = reader.find(entry.item_id, entry.region, entry.kind, since=entry.time, page=entry.page, limit=1)
+        reader.read(found[0])
+    print(f"Поиск и чтение случайного ответа: {(time.perf_counter() - started) / len(sample) * 1e6:.0f} мкс")
+    shutil.rmtree(args.dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
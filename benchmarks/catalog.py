@@ -0,0 +1,145 @@
+"""Память и скорость каталога предметов: словари listing.json против catalog.Catalog.
+
+Для каждого представления в отдельном процессе замеряется:
+    - время загрузки listing.json
+    - память, которая остаётся занятой после загрузки (tracemalloc) и прирост RSS
+    - открытие окна поиска: раньше каждое открытие строило список
+      (название, словарь) по всему каталогу, теперь окно использует общий Catalog
+    - поиск по подстроке из одной буквы
+
+Запуск из корня репозитория:
+    python benchmarks/catalog.py [--listing listing.json] [--repeat 20]
+"""
+import argparse
+import gc
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+QUERY = 'а'
+
+
+def rss_mb():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+
+
+def median_ms(func, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - started)
+    return sorted(times)[len(times) // 2] * 1000
+
+
+def measure(mode, listing, repeat):
+    """Замер одного представления; печатает JSON для родительского процесса"""
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt5.QtWidgets import QApplication
+
+    app = QApplication(sys.argv[:1])
+    import catalog
+    import dialogs
+
+    base_dir = os.path.dirname(os.path.abspath(listing))
+    gc.collect()
+    rss_before = rss_mb()
+    tracemalloc.start()
+    started = time.perf_counter()
+    if mode == 'dicts':
+        items = catalog.load_listing(listing, base_dir)
+        # Раньше рядом с каталогом жил ещё словарь item_id -> название
+        names = {}
+        for item in items:
+            try:
+                names.setdefault(item['id'], item['name']['lines']['ru'])
+            except (KeyError, TypeError):
+                continue
+    else:
+        items = catalog.load_catalog(listing, base_dir)
+    load_ms = (time.perf_counter() - started) * 1000
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_after = rss_mb()
+
+    if mode == 'dicts':
+        def open_dialog():
+            # Что делал ItemSearchDialog при каждом открытии
+            all_items = []
+            for item in items:
+                try:
+                    all_items.append((item['name']['lines']['ru'], item))
+                except (KeyError, TypeError):
+                    continue
+            # Виджеты окна те же, что сейчас
+            dialogs.ItemSearchDialog(catalog.Catalog()).deleteLater()
+            return all_items
+
+        all_items = open_dialog()
+
+        def search():
+            return [name for name, item in all_items if QUERY in name.lower()]
+    else:
+        def open_dialog():
+            dialogs.ItemSearchDialog(items).deleteLater()
+
+        items.search(QUERY)
+
+        def search():
+            return items.search(QUERY)
+
+    result = {
+        'items': len(items), 'load_ms': load_ms, 'retained_mb': retained / 2 ** 20, 'peak_mb': peak / 2 ** 20,
+        'rss_mb': rss_after - rss_before, 'open_ms': median_ms(open_dialog, repeat),
+        'search_ms': median_ms(search, repeat), 'found': len(search()),
+    }
+    app.processEvents()
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--listing', default=os.path.join(ROOT, 'listing.json'))
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--mode', choices=('dicts', 'compact'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        measure(args.mode, args.listing, args.repeat)
+        return
+
+    results = {}
+    for mode in ('dicts', 'compact'):
+        # Отдельный процесс: RSS не зависит от уже освобождённой памяти другого замера
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), '--mode', mode,
+                               '--listing', args.listing, '--repeat', str(args.repeat)],
+                              capture_output=True, text=True, cwd=ROOT)
+        if proc.returncode != 0:
+            sys.stderr.write(proc.stderr)
+            return 1
+        results[mode] = json.loads(proc.stdout.strip().splitlines()[-1])
+
+    print(f"Предметов: {results['compact']['items']}")
+    print(f"{'':32}{'словари':>12}{'Catalog':>12}")
+    rows = [
+        ("Загрузка, мс", 'load_ms', "{:.0f}"),
+        ("Занято после загрузки, МБ", 'retained_mb', "{:.2f}"),
+        ("Пик при загрузке, МБ", 'peak_mb', "{:.2f}"),
+        ("Прирост RSS, МБ", 'rss_mb', "{:.1f}"),
+        ("Открытие окна поиска, мс", 'open_ms', "{:.2f}"),
+        (f"Поиск '{QUERY}', мс", 'search_ms', "{:.2f}"),
+    ]
+    for title, key, fmt in rows:
+        print(f"{title:32}{fmt.format(results['dicts'][key]):>12}{fmt.format(results['compact'][key]):>12}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
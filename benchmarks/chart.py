@@ -0,0 +1,82 @@
+"""Время перерисовки графика истории при прокрутке и масштабировании.
+
+Строит ряд из N точек (по умолчанию 100 000 на каждую из трёх редкостей),
+затем имитирует прокрутку и масштабирование: на каждый кадр окно
+сдвигается или меняет ширину, график выбирает уровень пирамиды и
+перерисовывается в буфер. Для 60 кадров/с кадр должен укладываться в 16 мс.
+
+Запуск из корня репозитория (без экрана - QT_QPA_PLATFORM=offscreen):
+    python benchmarks/chart.py [--points 100000] [--frames 300]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from PyQt5.QtWidgets import QApplication
+
+import chart
+
+
+def synthetic_rows(points, qlts=3, seed=1):
+    """Строки в формате get_price_series: (time, qlt, count, volume, turnover, min, max)"""
+    rnd = np.random.default_rng(seed)
+    start = int(time.time()) - 180 * 86400
+    rows = []
+    for qlt in range(qlts):
+        times = start + np.cumsum(rnd.integers(1, 300, points))
+        prices = np.maximum(1000 * (qlt + 1) + np.cumsum(rnd.normal(0, 20, points)), 1).astype(np.int64)
+        rows += [(int(t), qlt, 1, 1, int(p), int(p), int(p)) for t, p in zip(times, prices)]
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--points', type=int, default=100000, help="Точек на редкость")
+    parser.add_argument('--frames', type=int, default=300)
+    args = parser.parse_args()
+
+    app = QApplication(sys.argv)
+    rows = synthetic_rows(args.points)
+
+    started = time.perf_counter()
+    pyramids = chart.build_pyramids(rows)
+    print(f"Построение пирамид: {(time.perf_counter() - started) * 1000:.0f} мс "
+          f"({len(rows)} точек, уровней: {len(pyramids[0].levels)})")
+
+    widget = chart.PriceChart()
+    widget.resize(1200, 600)
+    widget.show()
+    widget.set_series(pyramids)
+    app.processEvents()
+
+    x0, x1, _, _ = pyramids[0].bounds()
+    span = x1 - x0
+    frames = []
+    vertices = []
+    for frame in range(args.frames):
+        # Первая половина - прокрутка при приближении, вторая - масштабирование
+        if frame < args.frames // 2:
+            width = span / 20
+            left = x0 + (span - width) * frame / (args.frames // 2)
+        else:
+            width = span * (frame - args.frames // 2 + 1) / (args.frames - args.frames // 2)
+            left = x0 + (span - width) / 2
+        started = time.perf_counter()
+        widget.setXRange(left, left + width, padding=0)
+        widget.grab()  # отрисовка кадра
+        frames.append((time.perf_counter() - started) * 1000)
+        vertices.append(sum(len(curve.xData) for curve in widget.curves.values()))
+
+    frames.sort()
+    print(f"Кадр: медиана {statistics.median(frames):.1f} мс, 95% {frames[int(len(frames) * 0.95)]:.1f} мс, "
+          f"макс. {frames[-1]:.1f} мс")
+    print(f"Вершин на кадр: до {max(vertices)} (ширина графика {widget.getViewBox().width():.0f} пикс.)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+"""Отзывчивость окна под потоком результатов проверки.
+
+PriceTracker запускается на offscreen-платформе Qt во временном каталоге
+(своя base.db, лог и синтетический listing.json) с --rows строками. Потоки
+-генераторы, как рабочие потоки проверки, шлют сигналы с заданной частотой:
+    price_checked          - новая минимальная цена строки
+    profitable_stack_found - выгодный стак (уведомление и запись в лог)
+    log_message            - строка лога
+    request_finished       - раз в --cycle-every секунд полный цикл по всем
+                             строкам, завершающийся on_check_complete
+
+Замеряется:
+    - задержка очереди событий: проба из отдельного потока, время от
+      отправки до выполнения слота в потоке GUI
+    - паузы кадра: таймер с периодом 16 мс, интервалы длиннее --stall-ms
+    - рост notifications_list, лога в окне (log_view) и памяти процесса
+    - время on_check_complete и остальных слотов (profiling.timers)
+
+Запуск из корня репозитория:
+    python benchmarks/gui_flood.py [--rows 1000] [--seconds 20] [--stacks 600] [--logs 1200]
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+FRAME_MS = 16
+
+
+def rss_mb():
+    """Текущая память процесса (Linux /proc; иначе пиковая по getrusage)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 1024
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * p), len(ordered) - 1)]
+
+
+class Emitter(threading.Thread):
+    """Вызывать emit(n) с частотой per_minute в минуту до остановки"""
+    def __init__(self, per_minute, emit, stop):
+        super().__init__(daemon=True)
+        self.interval = 60.0 / per_minute if per_minute > 0 else None
+        self.emit = emit
+        self.stop = stop
+        self.sent = 0
+
+    def run(self):
+        if self.interval is None:
+            return
+        next_time = time.perf_counter()
+        while not self.stop.is_set():
+            self.emit(self.sent)
+            self.sent += 1
+            next_time += self.interval
+            delay = next_time - time.perf_counter()
+            if delay > 0:
+                self.stop.wait(delay)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--stacks', type=int, default=600, help="Выгодных стаков в минуту")
+    parser.add_argument('--logs', type=int, default=1200, help="Строк лога в минуту")
+    parser.add_argument('--prices', type=int, default=3000, help="Обновлений цены строки в минуту")
+    parser.add_argument('--cycle-every', type=float, default=5, help="Полный цикл по всем строкам раз в N секунд")
+    parser.add_argument('--stall-ms', type=float, default=50, help="Пауза кадра длиннее этого считается зависанием")
+    parser.add_argument('--probe-ms', type=float, default=50, help="Период пробы задержки очереди событий")
+    args = parser.parse_args()
+
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    workdir = tempfile.mkdtemp(prefix='gui_flood_')
+    # База открывается по относительному пути base.db
+    os.chdir(workdir)
+    item_ids = [f"it{i:04d}" for i in range(args.rows)]
+    with open(os.path.join(workdir, 'listing.json'), 'w', encoding='utf-8') as f:
+        json.dump([{'id': item_id, 'name': {'lines': {'ru': f"Предмет {item_id}"}}, 'color': 'DEFAULT'}
+                   for item_id in item_ids], f)
+
+    from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+    from PyQt5.QtWidgets import QApplication
+
+    app = QApplication(sys.argv[:1])
+
+    import api
+    import index
+    import profiling
+    import scan
+    import watchlist
+    from database import db
+
+    window = index.PriceTracker(base_dir=workdir)
+    window.show()
+    loaded = []
+    window.catalog_loaded.connect(lambda _: loaded.append(True))
+    deadline = time.perf_counter() + 30
+    while not loaded and time.perf_counter() < deadline:
+        app.processEvents()
+        time.sleep(0.01)
+    # Без токена циклы проверки не запускаются; подогрев истории не нужен
+    window.warm_timer.stop()
+
+    started = time.perf_counter()
+    entries = [watchlist.WatchEntry(item_id, i % 6, 1000 + i, api.REGIONS[i % 2], None) for i, item_id in enumerate(item_ids)]
+    db.import_tracked_items(entries)
+    window.reload_tracked_items()
+    app.processEvents()
+    print(f"Строк: {window.table.rowCount()}, загрузка таблицы {time.perf_counter() - started:.2f} с")
+
+    targets = []
+    for row in range(window.table.rowCount()):
+        data = window.table.item(row, 0).data(index.Qt.UserRole)
+        targets.append(scan.ScanTarget(data['id'], data['item_id'], data['rarity'], data['target_price'],
+                                       None, data['region'], None))
+
+    class Probe(QObject):
+        ping = pyqtSignal(float)
+
+    probe = Probe()
+    delays = []
+    probe.ping.connect(lambda sent: delays.append(time.perf_counter() - sent))
+
+    frames = []
+    last_frame = [time.perf_counter()]
+
+    def on_frame():
+        now = time.perf_counter()
+        frames.append(now - last_frame[0])
+        last_frame[0] = now
+
+    heartbeat = QTimer()
+    heartbeat.timeout.connect(on_frame)
+    heartbeat.start(FRAME_MS)
+
+    memory = []
+
+    def sample_memory():
+        memory.append((window.notifications_list.count(), window.log_view.text.document().blockCount(),
+                       window.log_view.text.document().characterCount(), len(window.shown_stacks), rss_mb()))
+
+    memory_timer = QTimer()
+    memory_timer.timeout.connect(sample_memory)
+    memory_timer.start(1000)
+    sample_memory()
+
+    def emit_stack(n):
+        item_id = item_ids[n % len(item_ids)]
+        # Уникальное время выставления - уведомления не отбрасываются как повторы
+        window.profitable_stack_found.emit(item_id, 5000 + n, 5, 1000, n % 200, 1200,
+                                           f"2026-01-01T00:00:{n:08d}Z", "2026-01-03T00:00:00Z", n % 6, api.REGIONS[n % 2])
+
+    def emit_cycle(n):
+        cycle = scan.ScanCycle(targets, '', 60, {})
+        for target in targets:
+            cycle.mins.offer(target.row_id, 900 + n, 10)
+        for _ in targets:
+            window.request_finished.emit(cycle)
+
+    stop = threading.Event()
+    emitters = [
+        Emitter(args.stacks, emit_stack, stop),
+        Emitter(args.logs, lambda n: window.log_message(f"Синтетическая запись лога {n}: " + "x" * 60), stop),
+        Emitter(args.prices, lambda n: window.price_checked.emit(n % len(targets), 1000 + n), stop),
+        Emitter(60 / args.cycle_every, emit_cycle, stop),
+        Emitter(60000 / args.probe_ms, lambda n: probe.ping.emit(time.perf_counter()), stop),
+    ]
+    profiling.timers.reset()
+    frames.clear()
+    last_frame[0] = time.perf_counter()
+    for emitter in emitters:
+        emitter.start()
+    QTimer.singleShot(int(args.seconds * 1000), app.quit)
+    app.exec_()
+    stop.set()
+    for emitter in emitters:
+        emitter.join()
+    sample_memory()
+
+    print(f"За {args.seconds:.0f} с: стаков {emitters[0].sent}, строк лога {emitters[1].sent}, "
+          f"цен {emitters[2].sent}, циклов {emitters[3].sent}")
+    print(f"Задержка очереди событий: медиана {percentile(delays, 0.5) * 1000:.1f} мс, "
+          f"p95 {percentile(delays, 0.95) * 1000:.1f} мс, p99 {percentile(delays, 0.99) * 1000:.1f} мс, "
+          f"макс. {max(delays, default=0) * 1000:.0f} мс ({len(delays)} проб из {emitters[4].sent})")
+    stalls = [frame for frame in frames if frame * 1000 > args.stall_ms]
+    print(f"Кадры по {FRAME_MS} мс: {len(frames)}, медиана {percentile(frames, 0.5) * 1000:.1f} мс, "
+          f"зависаний > {args.stall_ms:.0f} мс: {len(stalls)}, самое долгое {max(frames, default=0) * 1000:.0f} мс")
+    first, last = memory[0], memory[-1]
+    print(f"Уведомлений: {first[0]} -> {last[0]}; строк лога в окне: {first[1]} -> {last[1]} "
+          f"({first[2] / 1024:.0f} -> {last[2] / 1024:.0f} КБ текста); запомненных стаков: {first[3]} -> {last[3]}")
+    print(f"Память процесса: {first[4]:.0f} -> {last[4]:.0f} МБ")
+    print("Слоты (мс): вызовов, среднее, p95, макс.")
+    for name, count, mean, p95, longest, total in profiling.timers.snapshot():
+        if name.startswith('gui.'):
+            print(f"  {name:28} {count:7d} {mean * 1000:8.2f} {p95 * 1000:8.2f} {longest * 1000:8.1f}")
+    window.close()
+    os.chdir(ROOT)
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
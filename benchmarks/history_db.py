@@ -0,0 +1,110 @@
+"""Размер базы и время запросов к price_history до и после миграции схемы.
+
+Создаёт базу в исходной схеме (версия 1, item_id TEXT в каждой строке),
+заполняет синтетической историей, замеряет запросы, затем применяет
+миграции на месте через Database.init_db() и повторяет замеры.
+
+Запуск из корня репозитория:
+    python benchmarks/history_db.py [--rows 10000000] [--items 4000] [--path bench_history.db]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+
+QUERY_REPEATS = 200
+DAY = 86400
+
+
+def fill_baseline(path, rows, items, seed=1):
+    """Заполнить базу в исходной схеме"""
+    conn = sqlite3.connect(path)
+    database._migration_1_baseline(conn.cursor())
+    conn.execute('PRAGMA user_version = 1')
+    rnd = random.Random(seed)
+    now = int(time.time())
+    span = 180 * DAY
+    batch = []
+    for i in range(rows):
+        item_id = f"it{rnd.randrange(items):05d}"
+        batch.append((item_id, now - rnd.randrange(span), rnd.randrange(1000, 500000), rnd.choice((1, 1, 1, 5, 10, 100)), rnd.randrange(6)))
+        if len(batch) == 100000:
+            conn.executemany('INSERT OR IGNORE INTO price_history (item_id, time, price, amount, qlt) VALUES (?, ?, ?, ?, ?)', batch)
+            batch = []
+    if batch:
+        conn.executemany('INSERT OR IGNORE INTO price_history (item_id, time, price, amount, qlt) VALUES (?, ?, ?, ?, ?)', batch)
+    conn.commit()
+    conn.close()
+
+
+def run_queries(path, item_column, items, seed=2):
+    """Медиана времени (мс) для типичных выборок"""
+    rnd = random.Random(seed)
+    conn = sqlite3.connect(path)
+    now = int(time.time())
+    if item_column == 'item_id':
+        key = lambda name: name
+        where = 'item_id = ?'
+        by_time = ''
+    else:
+        key = lambda name: conn.execute('SELECT id FROM items WHERE item_id = ?', (name,)).fetchone()[0]
+        where = 'item = ?'
+        # Без подсказки планировщик выбирает первичный ключ ради GROUP BY qlt
+        by_time = 'INDEXED BY idx_history_item_time'
+    queries = {
+        'последние 1000': (f'SELECT time, price, amount, qlt FROM price_history WHERE {where} ORDER BY time DESC LIMIT 1000', lambda k: (k,)),
+        'последние 1000 по qlt': (f'SELECT time, price, amount, qlt FROM price_history WHERE {where} AND qlt = ? ORDER BY time DESC LIMIT 1000', lambda k: (k, 3)),
+        'агрегат за 7 дней': (f'SELECT qlt, COUNT(*), SUM(amount), MIN(price), MAX(price) FROM price_history {by_time} WHERE {where} AND time >= ? GROUP BY qlt', lambda k: (k, now - 7 * DAY)),
+    }
+    results = {}
+    for label, (sql, params) in queries.items():
+        samples = []
+        for _ in range(QUERY_REPEATS):
+            k = key(f"it{rnd.randrange(items):05d}")
+            t0 = time.perf_counter()
+            conn.execute(sql, params(k)).fetchall()
+            samples.append(time.perf_counter() - t0)
+        results[label] = statistics.median(samples) * 1000
+    conn.close()
+    return results
+
+
+def report(title, path, results):
+    print(f"{title}: {os.path.getsize(path) / 1024 / 1024:.1f} МБ")
+    for label, ms in results.items():
+        print(f"  {label:24} {ms:8.3f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10_000_000)
+    parser.add_argument('--items', type=int, default=4000)
+    parser.add_argument('--path', default='bench_history.db')
+    args = parser.parse_args()
+
+    if os.path.exists(args.path):
+        os.remove(args.path)
+
+    t0 = time.perf_counter()
+    fill_baseline(args.path, args.rows, args.items)
+    print(f"Заполнение {args.rows} строк: {time.perf_counter() - t0:.1f} с")
+    report("Исходная схема", args.path, run_queries(args.path, 'item_id', args.items))
+
+    t0 = time.perf_counter()
+    database.Database(args.path).init_db()
+    print(f"Миграция до версии {database.SCHEMA_VERSION}: {time.perf_counter() - t0:.1f} с")
+    report("Новая схема", args.path, run_queries(args.path, 'item', args.items))
+
+    os.remove(args.path)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
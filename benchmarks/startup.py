@@ -0,0 +1,100 @@
+"""Замер холодного старта приложения.
+
+1. `python -X importtime -c "import index"` - время импорта модулей (самые тяжёлые).
+2. Запуск PriceTracker на offscreen-платформе Qt: время до показа окна,
+   до загрузки базы и до загрузки каталога.
+
+Запуск из корня репозитория:
+    python benchmarks/startup.py [--runs 5] [--top 15]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WINDOW_PROBE = r'''
+import time
+t0 = time.perf_counter()
+import sys
+from PyQt5.QtWidgets import QApplication
+from PyQt5.QtCore import QTimer
+app = QApplication(sys.argv)
+import index
+t_import = time.perf_counter()
+window = index.PriceTracker()
+window.show()
+app.processEvents()
+t_shown = time.perf_counter()
+marks = {}
+window.startup_db_loaded.connect(lambda _: marks.setdefault('db', time.perf_counter()))
+window.catalog_loaded.connect(lambda _: marks.setdefault('catalog', time.perf_counter()))
+def poll():
+    if 'catalog' in marks:
+        app.quit()
+QTimer(app, timeout=poll).start(5)
+QTimer.singleShot(60000, app.quit)
+app.exec_()
+print(t_import - t0, t_shown - t0, marks.get('db', t_shown) - t0, marks.get('catalog', t_shown) - t0)
+'''
+
+
+def import_times(top):
+    """Разобрать вывод -X importtime: (cumulative_us, module) по убыванию"""
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import index'],
+                          cwd=ROOT, capture_output=True, text=True)
+    rows = []
+    for line in proc.stderr.splitlines():
+        # Формат строки: "import time: self_us | cumulative_us | module"
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        parts = line.split('|', 2)
+        if len(parts) != 3:
+            continue
+        try:
+            rows.append((int(parts[1]), parts[2].strip()))
+        except ValueError:
+            continue
+    rows.sort(reverse=True)
+    return rows[:top]
+
+
+def window_times(runs):
+    env = dict(os.environ, QT_QPA_PLATFORM='offscreen')
+    samples = []
+    for _ in range(runs):
+        proc = subprocess.run([sys.executable, '-c', WINDOW_PROBE], cwd=ROOT, env=env,
+                              capture_output=True, text=True)
+        values = proc.stdout.strip().splitlines()
+        if not values:
+            print(proc.stderr, file=sys.stderr)
+            continue
+        samples.append([float(v) for v in values[-1].split()])
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    print("Самые тяжёлые импорты (cumulative, мс):")
+    for cumulative_us, name in import_times(args.top):
+        print(f"  {cumulative_us / 1000:8.1f}  {name}")
+
+    samples = window_times(args.runs)
+    if not samples:
+        print("Не удалось запустить окно")
+        return 1
+    labels = ["импорт index", "окно показано", "база загружена", "каталог загружен"]
+    print(f"\nСтарт окна, медиана по {len(samples)} запускам (мс):")
+    for i, label in enumerate(labels):
+        print(f"  {label:18} {statistics.median(s[i] for s in samples) * 1000:8.1f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,201 @@
+import array
+import json
+import os
+import sys
+
+DEFAULT_LANGUAGE = 'ru'
+LISTING_URL = "https://raw.githubusercontent.com/EXBO-Studio/stalcraft-database/refs/heads/main/ru/listing.json"
+
+
+def merge_uniq_into_listing(base_dir, listing_data):
+    """Объединяет данные из uniq.json в listing_data"""
+    uniq_file = os.path.join(base_dir, "uniq.json")
+    if not os.path.exists(uniq_file):
+        return listing_data
+
+    try:
+        with open(uniq_file, 'r', encoding='utf-8') as f:
+            uniq_data = json.load(f)
+    except Exception:
+        return listing_data
+
+    # Создаем словарь listing по id для быстрого доступа
+    listing_dict = {item['id']: item for item in listing_data}
+
+    # Проходим по uniq и обновляем listing
+    for uniq_item in uniq_data:
+        item_id = uniq_item['itemId']
+        if item_id in listing_dict:
+            # Обновляем существующий элемент
+            existing = listing_dict[item_id]
+            # Добавляем новые поля из uniq, кроме id, itemId, name, color
+            for key, value in uniq_item.items():
+                if key not in ['id', 'itemId', 'name', 'color']:
+                    existing[key] = value
+        else:
+            # Создаем новый элемент на основе uniq
+            new_item = {
+                'id': item_id,
+                'name': {
+                    'lines': {
+                        'ru': uniq_item['name']
+                    }
+                },
+                'color': uniq_item.get('color', 'DEFAULT'),
+                'status': {
+                    'state': 'NON_DROP'  # По умолчанию, как в примере
+                }
+            }
+            # Добавляем остальные поля
+            for key, value in uniq_item.items():
+                if key not in ['id', 'itemId', 'name', 'color']:
+                    new_item[key] = value
+            listing_data.append(new_item)
+            listing_dict[item_id] = new_item
+
+    return listing_data
+
+
+def download_listing(listing_file, base_dir):
+    """Скачать listing.json, объединить с uniq.json и сохранить на диск"""
+    import requests
+
+    response = requests.get(LISTING_URL, timeout=30)
+    response.raise_for_status()
+
+    data = response.json()
+    if not isinstance(data, list):
+        raise ValueError("Некорректный формат данных")
+
+    # Конвертируем данные: удаляем 'data' и 'icon', добавляем 'id'
+    for item in data:
+        if 'data' in item:
+            basename = os.path.basename(item['data'])
+            item_id = os.path.splitext(basename)[0]
+            item['id'] = item_id
+            del item['data']
+        if 'icon' in item:
+            del item['icon']
+
+    # Объединяем с uniq.json
+    data = merge_uniq_into_listing(base_dir, data)
+
+    with open(listing_file, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=4)
+
+    return data
+
+
+def load_listing(listing_file, base_dir):
+    """Прочитать listing.json с диска (объединение с uniq.json только в памяти)"""
+    if not os.path.exists(listing_file) or os.path.getsize(listing_file) < 10:
+        return []
+    with open(listing_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if not isinstance(data, list):
+        return []
+    return merge_uniq_into_listing(base_dir, data)
+
+
+def load_catalog(listing_file, base_dir):
+    """Прочитать listing.json в компактный Catalog (словари разбора сразу освобождаются)"""
+    return Catalog.from_items(load_listing(listing_file, base_dir), listing_file)
+
+
+class Catalog:
+    """Каталог предметов: параллельные массивы по позиции предмета.
+
+    Из listing.json хранятся только поля, которые использует программа:
+    item_id, название, категория (type), цвет и auctionItemsMetricId (0 -
+    нет). Категории и цвета повторяются и хранятся в одном экземпляре
+    (sys.intern). В памяти только названия на DEFAULT_LANGUAGE, другой язык
+    читается из файла при первом обращении к names(language). Один объект
+    на приложение - его используют все окна.
+    """
+    __slots__ = ('ids', 'types', 'colors', 'metric_ids', 'source', '_names', '_index', '_search')
+
+    def __init__(self, ids=(), names=(), types=(), colors=(), metric_ids=(), source=None):
+        self.ids = tuple(ids)
+        self.types = tuple(types)
+        self.colors = tuple(colors)
+        self.metric_ids = array.array('q', metric_ids)
+        self.source = source
+        self._names = {DEFAULT_LANGUAGE: tuple(names)}
+        self._index = {item_id: position for position, item_id in enumerate(self.ids)}
+        # Названия в нижнем регистре для поиска - при первом поиске
+        self._search = None
+
+    @classmethod
+    def from_items(cls, items_data, source=None):
+        """Из списка словарей listing.json (повторный item_id - первая запись)"""
+        ids, names, types, colors, metric_ids = [], [], [], [], []
+        seen = set()
+        for item in items_data:
+            item_id = item.get('id')
+            if not item_id or item_id in seen:
+                continue
+            seen.add(item_id)
+            try:
+                name = item['name']['lines'][DEFAULT_LANGUAGE]
+            except (KeyError, TypeError):
+                name = None
+            ids.append(sys.intern(item_id))
+            names.append(name)
+            types.append(sys.intern(str(item.get('type') or '')))
+            colors.append(sys.intern(item.get('color') or ''))
+            metric_ids.append(item.get('auctionItemsMetricId') or 0)
+        return cls(ids, names, types, colors, metric_ids, source)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, item_id):
+        return item_id in self._index
+
+    def position(self, item_id):
+        return self._index.get(item_id)
+
+    def name(self, item_id, default=None, language=DEFAULT_LANGUAGE):
+        position = self._index.get(item_id)
+        if position is None:
+            return default
+        return self.names(language)[position] or default
+
+    def describe(self, item_id):
+        """(название, категория, цвет); неизвестный предмет - (item_id, '', '')"""
+        position = self._index.get(item_id)
+        if position is None:
+            return item_id, '', ''
+        return self.names()[position] or item_id, self.types[position], self.colors[position]
+
+    def names(self, language=DEFAULT_LANGUAGE):
+        """Названия по позициям; нет перевода - название на DEFAULT_LANGUAGE"""
+        names = self._names.get(language)
+        if names is None:
+            names = self._names[language] = self._load_names(language)
+        return names
+
+    def _load_names(self, language):
+        lines = {}
+        if self.source and os.path.exists(self.source):
+            with open(self.source, 'r', encoding='utf-8') as f:
+                for item in json.load(f):
+                    try:
+                        lines.setdefault(item['id'], item['name']['lines'][language])
+                    except (KeyError, TypeError):
+                        continue
+        return tuple(lines.get(item_id) or name for item_id, name in zip(self.ids, self._names[DEFAULT_LANGUAGE]))
+
+    def search(self, text, limit=None):
+        """[(название, item_id)] предметов, в названии которых есть text (без учёта регистра)"""
+        if self._search is None:
+            self._search = tuple((name or '').lower() for name in self.names())
+        text = text.lower()
+        names = self.names()
+        found = []
+        for position, lowered in enumerate(self._search):
+            if text in lowered and names[position]:
+                found.append((names[position], self.ids[position]))
+                if limit and len(found) >= limit:
+                    break
+        return found
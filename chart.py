@@ -0,0 +1,121 @@
+"""График цены за штуку для HistoryDialog (нужен pyqtgraph).
+
+Ряд каждой редкости хранится пирамидой: уровень 0 - исходные точки
+(минимум и максимум цены за штуку), каждый следующий уровень сворачивает
+LEVEL_FACTOR соседних точек в одну. При масштабировании и прокрутке
+берётся только видимое окно самого подробного уровня, у которого в окне
+не больше точек, чем пикселей по ширине графика, и рисуется отрезками
+min-max. На экран уходит не больше двух вершин на пиксель при любой
+длине истории.
+"""
+import numpy as np
+import pyqtgraph as pg
+
+LEVEL_FACTOR = 4
+RARITY_NAMES = ["Обычный", "Необычный", "Особый", "Редкий", "Исключительный", "Легендарный"]
+RARITY_COLORS = ['#808080', '#2e8b57', '#1e6fd9', '#8a2be2', '#d9342b', '#e0a100']
+
+
+class SeriesPyramid:
+    """Многоуровневое min/max-представление одного ряда (время по возрастанию)"""
+    def __init__(self, times, lows, highs):
+        self.levels = [(times, lows, highs)]
+        while len(times) > LEVEL_FACTOR:
+            starts = np.arange(0, len(times), LEVEL_FACTOR)
+            times = times[starts]
+            lows = np.minimum.reduceat(lows, starts)
+            highs = np.maximum.reduceat(highs, starts)
+            self.levels.append((times, lows, highs))
+
+    def __len__(self):
+        return len(self.levels[0][0])
+
+    def bounds(self):
+        times, lows, highs = self.levels[-1]
+        return self.levels[0][0][0], self.levels[0][0][-1], lows.min(), highs.max()
+
+    def window(self, x0, x1, pixels):
+        """Вершины линии для видимого окна [x0, x1]: не больше 2 * pixels точек"""
+        for times, lows, highs in self.levels:
+            # Соседние точки за краями окна - чтобы линия доходила до границы
+            i0 = max(int(np.searchsorted(times, x0, side='left')) - 1, 0)
+            i1 = min(int(np.searchsorted(times, x1, side='right')) + 1, len(times))
+            if i1 - i0 <= pixels:
+                break
+        x = np.repeat(times[i0:i1], 2)
+        y = np.empty(len(x), dtype=np.float64)
+        y[0::2] = lows[i0:i1]
+        y[1::2] = highs[i0:i1]
+        return x, y
+
+
+def build_pyramids(rows):
+    """Пирамиды по редкостям из строк get_price_series: {qlt: SeriesPyramid}"""
+    if not rows:
+        return {}
+    data = np.array([(row[0], row[1], row[5], row[6]) for row in rows], dtype=np.float64)
+    pyramids = {}
+    for qlt in np.unique(data[:, 1]).astype(int).tolist():
+        part = data[data[:, 1] == qlt]
+        part = part[np.argsort(part[:, 0], kind='stable')]
+        pyramids[qlt] = SeriesPyramid(part[:, 0].copy(), part[:, 2].copy(), part[:, 3].copy())
+    return pyramids
+
+
+class PriceChart(pg.PlotWidget):
+    """Цена за штуку по времени; при изменении окна перерисовывается только видимое"""
+    def __init__(self, parent=None):
+        super().__init__(parent, axisItems={'bottom': pg.DateAxisItem()})
+        self.setBackground('w')
+        self.showGrid(x=True, y=True, alpha=0.3)
+        self.setLabel('left', "Цена за шт.")
+        self.legend = self.addLegend()
+        self.pyramids = {}
+        self.curves = {}
+        self.visible_qlt = None  # None - все редкости
+        self.getViewBox().sigXRangeChanged.connect(self.refresh)
+
+    def set_series(self, pyramids):
+        """Заменить ряды; масштаб сбрасывается только при первой загрузке"""
+        first = not self.pyramids
+        for curve in self.curves.values():
+            self.removeItem(curve)
+        self.legend.clear()
+        self.pyramids = pyramids
+        self.curves = {}
+        for qlt in sorted(pyramids):
+            name = RARITY_NAMES[qlt] if qlt < len(RARITY_NAMES) else f"qlt={qlt}"
+            color = RARITY_COLORS[qlt % len(RARITY_COLORS)]
+            self.curves[qlt] = self.plot(pen=pg.mkPen(color, width=1), name=name)
+            self.curves[qlt].setVisible(self.visible_qlt in (None, qlt))
+        if first:
+            self.fit()
+        else:
+            self.refresh()
+
+    def set_filter(self, qlt):
+        self.visible_qlt = qlt
+        for key, curve in self.curves.items():
+            curve.setVisible(qlt is None or key == qlt)
+        self.fit()
+
+    def fit(self):
+        """Показать весь ряд видимых редкостей"""
+        visible = [p.bounds() for qlt, p in self.pyramids.items() if self.visible_qlt in (None, qlt)]
+        if not visible:
+            return
+        x0 = min(b[0] for b in visible)
+        x1 = max(b[1] for b in visible)
+        y0 = min(b[2] for b in visible)
+        y1 = max(b[3] for b in visible)
+        self.getViewBox().disableAutoRange()
+        self.setRange(xRange=(x0, max(x1, x0 + 1)), yRange=(y0, max(y1, y0 + 1)), padding=0.02)
+        self.refresh()
+
+    def refresh(self, *args):
+        (x0, x1), _ = self.viewRange()
+        pixels = max(int(self.getViewBox().width()), 1)
+        for qlt, curve in self.curves.items():
+            if curve.isVisible():
+                x, y = self.pyramids[qlt].window(x0, x1, pixels)
+                curve.setData(x, y)
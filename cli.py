@@ -0,0 +1,290 @@
+"""Команды без графического интерфейса: python index.py <команда> [параметры]"""
+import argparse
+import sys
+
+from api import DEFAULT_REGION, REGIONS
+from database import HISTORY_DATASETS
+
+
+def cmd_export_history(args):
+    import history_io
+
+    history_io.export_history(args.out, datasets=args.dataset or tuple(HISTORY_DATASETS), fmt=args.format,
+                              since=args.since, incremental=not args.full, chunk_rows=args.chunk_rows)
+    return 0
+
+
+def cmd_import_history(args):
+    import history_io
+
+    history_io.import_history(args.path, chunk_rows=args.chunk_rows)
+    return 0
+
+
+def default_listing_file():
+    """listing.json рядом с программой, как у главного окна"""
+    import os
+
+    if getattr(sys, 'frozen', False):
+        base = os.path.dirname(sys.executable)
+    else:
+        base = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(base, "listing.json")
+
+
+def cmd_import_watchlist(args):
+    import os
+
+    import catalog
+    import watchlist
+    from database import db
+
+    listing = args.listing or default_listing_file()
+    items = catalog.load_catalog(listing, os.path.dirname(os.path.abspath(listing)))
+    if not items:
+        print("Каталог не загружен: названия не разрешаются, item_id не проверяются", file=sys.stderr)
+    try:
+        entries = watchlist.resolve(watchlist.read_rows(args.path, args.format), items)
+    except watchlist.WatchlistError as e:
+        print(f"{str(e)}. Список не изменён.", file=sys.stderr)
+        for error in e.errors:
+            print(f"  {error}", file=sys.stderr)
+        return 1
+    if args.dry_run:
+        print(f"Строк в файле: {len(entries)}, ошибок нет")
+        return 0
+    added, updated, removed = db.import_tracked_items(entries, replace=args.replace)
+    print(f"Добавлено {added}, обновлено {updated}, удалено {len(removed)}")
+    return 0
+
+
+def cmd_export_watchlist(args):
+    import os
+
+    import catalog
+    import watchlist
+    from database import db
+
+    listing = args.listing or default_listing_file()
+    items = catalog.load_catalog(listing, os.path.dirname(os.path.abspath(listing)))
+    count = watchlist.write_rows(args.path, db.get_tracked_items(), items, args.format)
+    print(f"Сохранено строк: {count}")
+    return 0
+
+
+def parse_grid(text):
+    """Сетка значений: '5,10,20' или диапазон 'начало:конец:шаг' (конец включается)"""
+    values = []
+    for part in text.split(','):
+        part = part.strip()
+        if ':' in part:
+            start, stop, step = (float(x) for x in part.split(':'))
+            count = int(round((stop - start) / step)) + 1
+            values += [start + i * step for i in range(max(count, 0))]
+        elif part:
+            values.append(float(part))
+    return values
+
+
+def cmd_backtest(args):
+    import time
+
+    import backtest
+
+    targets = [int(v) for v in parse_grid(args.targets)] if args.targets else None
+    percentages = parse_grid(args.percentages) if args.percentages else []
+    min_amounts = [int(v) for v in parse_grid(args.min_amount)]
+    started = int(time.time())
+    results, sales, elapsed, since = backtest.run_backtest(args.item, days=args.days, qlt=args.qlt, region=args.region,
+                                                           targets=targets, percentages=percentages,
+                                                           min_amounts=min_amounts, reference=args.reference_days * 86400,
+                                                           horizon=args.horizon_hours * 3600, now=started)
+    if since > started - args.days * 86400:
+        print(f"Отдельные сделки хранятся только с {format_time(since)}: период сокращён до "
+              f"{(started - since) / 86400:.1f} дн. из {args.days}", file=sys.stderr)
+    print(f"Сделок: {sales}, комбинаций: {len(results)}, время: {elapsed:.2f} с")
+
+    if args.csv:
+        import csv
+
+        with open(args.csv, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(backtest.Result._fields)
+            writer.writerows(results)
+
+    # Лучшие настройки по прибыли для каждого предмета, редкости и режима
+    groups = {}
+    for result in results:
+        groups.setdefault((result.item_id, result.qlt, result.mode), []).append(result)
+    for (item_id, qlt, mode), group in sorted(groups.items()):
+        print(f"\n{item_id} qlt={qlt} {mode}:")
+        print(f"  {'порог':>12} {'от шт.':>6} {'сделок':>7} {'штук':>8} {'прибыль':>14}")
+        for result in sorted(group, key=lambda r: r.profit, reverse=True)[:args.top]:
+            threshold = f"{result.threshold:g}%" if mode == 'percent' else str(result.threshold)
+            print(f"  {threshold:>12} {result.min_amount:>6} {result.hits:>7} {result.units:>8} {result.profit:>14,.0f}")
+    return 0
+
+
+def format_time(timestamp):
+    import datetime
+
+    return datetime.datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def cmd_archive(args):
+    import archive
+
+    reader = archive.ArchiveReader(args.dir or archive.default_directory())
+    records, raw, stored, segments = reader.stats()
+    ratio = raw / stored if stored else 0
+    print(f"Ответов: {records}, сегментов: {segments}, исходно {raw / 2 ** 20:.1f} МБ, "
+          f"сжато {stored / 2 ** 20:.2f} МБ (x{ratio:.1f})")
+    for entry in reader.find(args.item, args.region, args.kind, args.since, args.until, limit=args.limit):
+        print(f"{format_time(entry.time)} {entry.region} {entry.item_id} {entry.kind} offset={entry.page} "
+              f"status={entry.status} {entry.raw_length} -> {entry.length} байт")
+        if args.dump:
+            print(reader.read(entry).decode('utf-8', errors='replace'))
+    return 0
+
+
+def cmd_replay(args):
+    import archive
+    import rules
+    import scan
+    from database import db
+
+    reader = archive.ArchiveReader(args.dir or archive.default_directory())
+    mode = scan.ScanMode(not args.no_stacks, args.percentage is not None, args.percentage or 0, args.sigma)
+    rule = rules.compile_rule(args.rule) if args.rule else None
+    if args.item:
+        targets = [scan.ScanTarget(0, item_id, args.rarity, args.target, mode, args.region, rule) for item_id in args.item]
+    else:
+        # Отслеживаемые строки с их правилами (или правилом из --rule)
+        targets = []
+        for row_id, item_id, target_price, rarity, region, alert_rule in db.get_tracked_items():
+            row_rule = rule or (rules.compile_rule(alert_rule) if alert_rule else None)
+            targets.append(scan.ScanTarget(row_id, item_id, rarity, target_price, mode, region, row_rule))
+
+    counts = {}
+
+    def on_event(when, kind, data):
+        counts[kind] = counts.get(kind, 0) + 1
+        if kind == 'min':
+            item_id, region, rarity, price, lots = data
+            if args.verbose:
+                print(f"{format_time(when)} {region} {item_id} qlt={rarity}: минимум {price}, лотов {lots}")
+        elif kind == 'error':
+            print(f"{format_time(when)} ошибка: {data}")
+        else:
+            item_id, buyout_price, amount, unit_price, position = data[:5]
+            print(f"{format_time(when)} {data[-1]} {item_id} {kind}: {amount} шт. за {buyout_price} "
+                  f"({unit_price} за шт.), позиция {position}")
+
+    checks, flows = archive.replay_scans(reader, targets, args.since, args.until, on_event)
+    sold = sum(row[6] for row in flows)
+    print(f"Проверок: {checks}, оповещений о лотах: {counts.get('lot', 0)}, ниже нормы: {counts.get('anomaly', 0)}, "
+          f"ошибок: {counts.get('error', 0)}, продано штук по снимкам: {sold}")
+    return 0
+
+
+def gui_arguments(argv):
+    """Параметры запуска окна; возвращает (параметры, оставшиеся аргументы для Qt)"""
+    import profiling
+
+    parser = argparse.ArgumentParser(prog='index.py', add_help=False)
+    parser.add_argument('--profile', type=int, default=0, metavar='ЦИКЛОВ',
+                        help="Профилировать столько первых циклов проверки")
+    parser.add_argument('--profile-interval', type=float, default=profiling.DEFAULT_INTERVAL * 1000, metavar='МС',
+                        help="Период снимков стеков")
+    parser.add_argument('--profile-dir', help="Каталог профилей (по умолчанию profiles рядом с программой)")
+    return parser.parse_known_args(argv)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='index.py', description="Stalcraft Price Tracker - команды без GUI",
+                                     epilog="Без команды запускается окно; python index.py --profile 3 "
+                                            "[--profile-interval 5] [--profile-dir DIR] профилирует первые циклы проверки")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    export = commands.add_parser('export-history', help="Выгрузить историю цен в Parquet/Arrow")
+    export.add_argument('out', help="Каталог для выгрузки")
+    export.add_argument('--format', choices=('parquet', 'arrow'), default='parquet')
+    export.add_argument('--dataset', action='append', choices=tuple(HISTORY_DATASETS),
+                        help="Набор данных (можно несколько раз); по умолчанию все")
+    export.add_argument('--since', type=int, help="Выгрузить только строки новее этого unix-времени (метку не сдвигает)")
+    export.add_argument('--full', action='store_true', help="Игнорировать сохранённую метку и не сдвигать её")
+    export.add_argument('--chunk-rows', type=int, default=50000)
+    export.set_defaults(func=cmd_export_history)
+
+    imp = commands.add_parser('import-history', help="Загрузить историю цен из Parquet/Arrow")
+    imp.add_argument('path', help="Каталог с выгрузкой")
+    imp.add_argument('--chunk-rows', type=int, default=50000)
+    imp.set_defaults(func=cmd_import_history)
+
+    bt = commands.add_parser('backtest', help="Проверить пороги оповещений на сохранённой истории")
+    bt.add_argument('item', nargs='+', help="item_id предметов")
+    bt.add_argument('--region', choices=REGIONS, default=DEFAULT_REGION)
+    bt.add_argument('--qlt', type=int, help="Только эта редкость")
+    bt.add_argument('--days', type=int, default=90, help="Глубина истории в днях (не дальше срока хранения отдельных сделок)")
+    bt.add_argument('--targets', help="Моя цена за шт.: '1000:5000:100' или список; по умолчанию - по перцентилям истории")
+    bt.add_argument('--percentages', default='5:50:5', help="Процент ниже средней: '5:50:1' или список")
+    bt.add_argument('--min-amount', default='1,2', help="Минимум штук в лоте (1 - любые лоты, 2 - только стаки)")
+    bt.add_argument('--reference-days', type=float, default=7, help="Окно средней цены для процентного режима")
+    bt.add_argument('--horizon-hours', type=float, default=24, help="Окно перепродажи для оценки прибыли")
+    bt.add_argument('--top', type=int, default=5, help="Сколько лучших настроек показать")
+    bt.add_argument('--csv', help="Сохранить все результаты в CSV")
+    bt.set_defaults(func=cmd_backtest)
+
+    arc = commands.add_parser('archive', help="Сводка и содержимое архива ответов API")
+    arc.add_argument('--dir', default=None, help="Каталог архива (по умолчанию archive рядом с программой)")
+    arc.add_argument('--item', help="item_id")
+    arc.add_argument('--region', choices=REGIONS)
+    arc.add_argument('--kind', choices=('lots', 'history'))
+    arc.add_argument('--since', type=float, help="С unix-времени")
+    arc.add_argument('--until', type=float, help="До unix-времени")
+    arc.add_argument('--limit', type=int, default=20, help="Сколько ответов показать (-1 - все)")
+    arc.add_argument('--dump', action='store_true', help="Печатать тела ответов")
+    arc.set_defaults(func=cmd_archive)
+
+    rp = commands.add_parser('replay', help="Прогнать архивные страницы лотов через проверку цен")
+    rp.add_argument('--dir', default=None, help="Каталог архива (по умолчанию archive рядом с программой)")
+    rp.add_argument('--item', action='append', help="item_id (можно несколько раз); по умолчанию - отслеживаемые строки")
+    rp.add_argument('--region', choices=REGIONS, default=DEFAULT_REGION)
+    rp.add_argument('--rarity', type=int, default=0, help="Редкость для --item")
+    rp.add_argument('--target', type=int, default=0, help="Моя цена для --item")
+    rp.add_argument('--rule', help="Правило оповещения вместо правил строк")
+    rp.add_argument('--no-stacks', action='store_true', help="Без стандартного поиска стаков")
+    rp.add_argument('--percentage', type=int, help="Поиск по проценту ниже минимума")
+    rp.add_argument('--sigma', type=int, default=0, help="Оповещать о цене ниже нормы на столько сигм")
+    rp.add_argument('--since', type=float, help="С unix-времени")
+    rp.add_argument('--until', type=float, help="До unix-времени")
+    rp.add_argument('--verbose', action='store_true', help="Печатать минимальную цену каждой проверки")
+    rp.set_defaults(func=cmd_replay)
+
+    wimp = commands.add_parser('import-watchlist', help="Загрузить отслеживаемые предметы из CSV/JSON")
+    wimp.add_argument('path', help="Файл со столбцами item_id или name, rarity, target_price, region, rule")
+    wimp.add_argument('--format', choices=('csv', 'json'), help="По умолчанию - по расширению файла")
+    wimp.add_argument('--replace', action='store_true', help="Удалить строки, которых нет в файле")
+    wimp.add_argument('--dry-run', action='store_true', help="Только проверить файл")
+    wimp.add_argument('--listing', help="Путь к listing.json для поиска по названию")
+    wimp.set_defaults(func=cmd_import_watchlist)
+
+    wexp = commands.add_parser('export-watchlist', help="Сохранить отслеживаемые предметы в CSV/JSON")
+    wexp.add_argument('path', help="Файл .csv или .json")
+    wexp.add_argument('--format', choices=('csv', 'json'), help="По умолчанию - по расширению файла")
+    wexp.add_argument('--listing', help="Путь к listing.json для столбца name")
+    wexp.set_defaults(func=cmd_export_watchlist)
+
+    return parser
+
+
+COMMANDS = ('export-history', 'import-history', 'backtest', 'archive', 'replay', 'import-watchlist', 'export-watchlist')
+
+
+def main(argv):
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except Exception as e:
+        print(f"Ошибка: {str(e)}", file=sys.stderr)
+        return 1
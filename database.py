@@ -1,78 +1,409 @@
 import sqlite3
-import os
-import json
+import threading
+
+from api import DEFAULT_REGION
+import profiling
+import stats
+
+def _migration_1_baseline(cursor):
+    """Исходная схема"""
+
+    # Таблица конфигурации
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS config (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+    ''')
+
+    # Таблица отслеживаемых предметов
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tracked_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            item_id TEXT,
+            target_price INTEGER DEFAULT 0,
+            target_rarity INTEGER DEFAULT 0
+        )
+    ''')
+
+
+
+    # Таблица истории цен
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS price_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            item_id TEXT,
+            time INTEGER,
+            price INTEGER,
+            amount INTEGER,
+            qlt INTEGER DEFAULT 0,
+            UNIQUE(item_id, time, price, amount, qlt)
+        )
+    ''')
+
+    # Столбец qlt уже добавлен в CREATE TABLE
+
+    # Таблица отслеживаемых строк (для сохранения дубликатов предметов)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tracked_rows (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            item_id TEXT,
+            rarity INTEGER DEFAULT 0
+        )
+    ''')
+
+    # Индексы для производительности
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_history_item_time ON price_history (item_id, time DESC)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_history_item ON price_history (item_id)')
+
+
+def _migration_2_item_keys(cursor):
+    """Словарь предметов с целочисленными ключами и история без rowid"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS items (
+            id INTEGER PRIMARY KEY,
+            item_id TEXT NOT NULL UNIQUE
+        )
+    ''')
+    cursor.execute('INSERT OR IGNORE INTO items (item_id) SELECT DISTINCT item_id FROM price_history WHERE item_id IS NOT NULL')
+
+    # Кластеризация по (предмет, редкость, время): выборки по предмету и
+    # диапазону времени читают соседние страницы. Ключ целиком заменяет
+    # прежний UNIQUE из пяти столбцов.
+    cursor.execute('''
+        CREATE TABLE price_history_v2 (
+            item INTEGER NOT NULL,
+            qlt INTEGER NOT NULL DEFAULT 0,
+            time INTEGER NOT NULL,
+            price INTEGER NOT NULL,
+            amount INTEGER NOT NULL,
+            PRIMARY KEY (item, qlt, time, price, amount)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        INSERT OR IGNORE INTO price_history_v2 (item, qlt, time, price, amount)
+        SELECT items.id, COALESCE(h.qlt, 0), h.time, h.price, h.amount
+        FROM price_history h JOIN items ON items.item_id = h.item_id
+        WHERE h.time IS NOT NULL AND h.price IS NOT NULL AND h.amount IS NOT NULL
+    ''')
+    # Вместе с таблицей удаляются idx_history_item_time и idx_history_item
+    cursor.execute('DROP TABLE price_history')
+    cursor.execute('ALTER TABLE price_history_v2 RENAME TO price_history')
+
+    # Выборка по предмету без фильтра редкости, отсортированная по времени.
+    # Индекс WITHOUT ROWID таблицы содержит все столбцы первичного ключа,
+    # поэтому он покрывающий.
+    cursor.execute('CREATE INDEX idx_history_item_time ON price_history (item, time)')
+
+    # Таблица нигде не использовалась
+    cursor.execute('DROP TABLE IF EXISTS tracked_rows')
+
+
+def _migration_3_rollups(cursor):
+    """Почасовые и дневные агрегаты истории цен"""
+    # Цены в агрегатах - за штуку; VWAP = turnover / volume
+    for table in ('price_history_hourly', 'price_history_daily'):
+        cursor.execute(f'''
+            CREATE TABLE {table} (
+                item INTEGER NOT NULL,
+                qlt INTEGER NOT NULL DEFAULT 0,
+                bucket INTEGER NOT NULL,
+                count INTEGER NOT NULL,
+                volume INTEGER NOT NULL,
+                turnover INTEGER NOT NULL,
+                min_price INTEGER NOT NULL,
+                max_price INTEGER NOT NULL,
+                PRIMARY KEY (item, qlt, bucket)
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute(f'CREATE INDEX idx_{table[len("price_"):]}_item_bucket ON {table} (item, bucket)')
+
+
+def _migration_4_regions(cursor):
+    """Регион как часть ключа отслеживаемых предметов и истории"""
+    cursor.execute(f"ALTER TABLE tracked_items ADD COLUMN region TEXT NOT NULL DEFAULT '{DEFAULT_REGION}'")
+
+    # Один и тот же item_id в разных регионах - разные ряды истории.
+    # Ключи items сохраняются, поэтому таблицы истории не перестраиваются.
+    cursor.execute(f'''
+        CREATE TABLE items_v2 (
+            id INTEGER PRIMARY KEY,
+            region TEXT NOT NULL DEFAULT '{DEFAULT_REGION}',
+            item_id TEXT NOT NULL,
+            UNIQUE (region, item_id)
+        )
+    ''')
+    cursor.execute(f"INSERT INTO items_v2 (id, region, item_id) SELECT id, '{DEFAULT_REGION}', item_id FROM items")
+    cursor.execute('DROP TABLE items')
+    cursor.execute('ALTER TABLE items_v2 RENAME TO items')
+
+
+def _migration_5_alert_rules(cursor):
+    """Текстовое правило оповещения для строки (NULL - стандартные проверки)"""
+    cursor.execute('ALTER TABLE tracked_items ADD COLUMN alert_rule TEXT')
+
+
+def _migration_6_latest_prices(cursor):
+    """Последняя известная минимальная цена строки по редкостям"""
+    cursor.execute('''
+        CREATE TABLE latest_prices (
+            row_id INTEGER NOT NULL,
+            qlt INTEGER NOT NULL,
+            floor_price INTEGER NOT NULL,
+            lot_count INTEGER NOT NULL,
+            scanned_at INTEGER NOT NULL,
+            PRIMARY KEY (row_id, qlt)
+        ) WITHOUT ROWID
+    ''')
+
+
+def _migration_7_price_stats(cursor):
+    """Потоковая статистика цен по (предмет, редкость), начальное заполнение из истории"""
+    cursor.execute('''
+        CREATE TABLE price_stats (
+            item INTEGER NOT NULL,
+            qlt INTEGER NOT NULL,
+            state BLOB NOT NULL,
+            PRIMARY KEY (item, qlt)
+        ) WITHOUT ROWID
+    ''')
+    # Один проход по сырым сделкам в порядке первичного ключа; дальше
+    # статистика обновляется только новыми сделками
+    source = cursor.connection.execute(
+        'SELECT item, qlt, time, price / MAX(amount, 1) FROM price_history ORDER BY item, qlt, time')
+    key, current = None, None
+    for item, qlt, time, unit_price in source:
+        if (item, qlt) != key:
+            if current is not None:
+                cursor.execute('INSERT INTO price_stats (item, qlt, state) VALUES (?, ?, ?)', key + (current.to_bytes(),))
+            key, current = (item, qlt), stats.PriceStats()
+        current.add(unit_price, time)
+    if current is not None:
+        cursor.execute('INSERT INTO price_stats (item, qlt, state) VALUES (?, ?, ?)', key + (current.to_bytes(),))
+
+
+def _migration_8_lot_flow(cursor):
+    """Почасовые счётчики появившихся, проданных и истёкших лотов (см. liquidity)"""
+    cursor.execute('''
+        CREATE TABLE lot_flow (
+            item INTEGER NOT NULL,
+            qlt INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            appeared INTEGER NOT NULL DEFAULT 0,
+            sold INTEGER NOT NULL DEFAULT 0,
+            sold_units INTEGER NOT NULL DEFAULT 0,
+            sold_turnover INTEGER NOT NULL DEFAULT 0,
+            expired INTEGER NOT NULL DEFAULT 0,
+            depth INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (item, qlt, bucket)
+        ) WITHOUT ROWID
+    ''')
+
+
+def _migration_9_item_summary(cursor):
+    """Сводка по (предмет, редкость) для обзора категорий: минимальная цена и сделки за сутки"""
+    import time
+
+    cursor.execute('''
+        CREATE TABLE item_summary (
+            item INTEGER NOT NULL,
+            qlt INTEGER NOT NULL,
+            floor_price INTEGER,
+            floor_lots INTEGER,
+            floor_at INTEGER,
+            sales INTEGER NOT NULL DEFAULT 0,
+            volume INTEGER NOT NULL DEFAULT 0,
+            turnover INTEGER NOT NULL DEFAULT 0,
+            prev_volume INTEGER NOT NULL DEFAULT 0,
+            prev_turnover INTEGER NOT NULL DEFAULT 0,
+            sales_at INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (item, qlt)
+        ) WITHOUT ROWID
+    ''')
+    # latest_prices хранит цену лота целиком, а сводка - за штуку: минимумы
+    # появятся с первым циклом проверки или проходом скринера
+    _refresh_sales(cursor, None, int(time.time()))
+
+
+def _refresh_sales(cursor, keys, now):
+    """Пересчитать в item_summary сделки за последние сутки и предыдущие сутки.
+
+    keys - ключи предметов (None - все). Для списка ключей читается только
+    диапазон индекса (item, time) за два окна.
+    """
+    day = now - SUMMARY_WINDOW
+    where, params = '', []
+    if keys is not None:
+        keys = list(keys)
+        if not keys:
+            return
+        where = f'AND item IN ({", ".join("?" * len(keys))})'
+        params = keys
+    # Редкости без сделок в обоих окнах обнуляются
+    cursor.execute(f'''
+        UPDATE item_summary SET sales = 0, volume = 0, turnover = 0, prev_volume = 0, prev_turnover = 0, sales_at = ?
+        WHERE true {where}
+    ''', [now] + params)
+    cursor.execute(f'''
+        INSERT INTO item_summary (item, qlt, sales, volume, turnover, prev_volume, prev_turnover, sales_at)
+        SELECT item, qlt, SUM(time >= ?),
+               SUM(CASE WHEN time >= ? THEN amount ELSE 0 END), SUM(CASE WHEN time >= ? THEN price ELSE 0 END),
+               SUM(CASE WHEN time < ? THEN amount ELSE 0 END), SUM(CASE WHEN time < ? THEN price ELSE 0 END), ?
+        FROM price_history
+        WHERE time >= ? {where}
+        GROUP BY item, qlt
+        ON CONFLICT (item, qlt) DO UPDATE SET
+            sales = excluded.sales, volume = excluded.volume, turnover = excluded.turnover,
+            prev_volume = excluded.prev_volume, prev_turnover = excluded.prev_turnover, sales_at = excluded.sales_at
+    ''', [day] * 5 + [now, day - SUMMARY_WINDOW] + params)
+
+
+def _migration_10_history_seq(cursor):
+    """Номер изменения у строк истории - метка инкрементальной выгрузки.
+
+    Время сделки для метки не годится: догруженные старые сделки и
+    дополненные свёрткой интервалы агрегатов оказываются позади неё.
+    """
+    for table in ('price_history',) + tuple(table for table, _ in HISTORY_TIERS):
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN seq INTEGER NOT NULL DEFAULT 0')
+        cursor.execute(f'CREATE INDEX idx_{table[len("price_"):]}_seq ON {table} (seq)')
+    # Прежние метки по времени: уже выгружавшийся набор продолжает с изменений
+    # после миграции, пропущенное раньше выгружается заново с --full
+    for dataset in HISTORY_DATASETS:
+        cursor.execute('SELECT 1 FROM config WHERE key = ?', (f'export_watermark_{dataset}',))
+        if cursor.fetchone():
+            cursor.execute('INSERT OR REPLACE INTO config (key, value) VALUES (?, ?)', (f'export_seq_{dataset}', '0'))
+            cursor.execute('DELETE FROM config WHERE key = ?', (f'export_watermark_{dataset}',))
+
+
+# Миграции применяются по порядку; номер версии = позиция в списке.
+# Текущая версия хранится в PRAGMA user_version.
+MIGRATIONS = [
+    _migration_1_baseline,
+    _migration_2_item_keys,
+    _migration_3_rollups,
+    _migration_4_regions,
+    _migration_5_alert_rules,
+    _migration_6_latest_prices,
+    _migration_7_price_stats,
+    _migration_8_lot_flow,
+    _migration_9_item_summary,
+    _migration_10_history_seq,
+]
+
+HOUR = 3600
+DAY = 86400
+
+# Уровни хранения истории: (таблица, размер интервала). Сырые сделки старше
+# history_raw_days сворачиваются в почасовые агрегаты, почасовые старше
+# history_hourly_days - в дневные. Дневные хранятся без ограничения.
+HISTORY_TIERS = (
+    ('price_history_hourly', HOUR),
+    ('price_history_daily', DAY),
+)
+# Наборы данных истории для выгрузки/загрузки: таблица, столбец времени, столбцы
+HISTORY_DATASETS = {
+    'raw': ('price_history', 'time', ('qlt', 'time', 'price', 'amount')),
+    'hourly': ('price_history_hourly', 'bucket', ('qlt', 'bucket', 'count', 'volume', 'turnover', 'min_price', 'max_price')),
+    'daily': ('price_history_daily', 'bucket', ('qlt', 'bucket', 'count', 'volume', 'turnover', 'min_price', 'max_price')),
+}
+DEFAULT_RAW_DAYS = 30
+DEFAULT_HOURLY_DAYS = 180
+COMPACT_INTERVAL = HOUR
+# Окно сделок в item_summary; сводка старше SUMMARY_REFRESH пересчитывается
+# в фоне, даже если новых сделок по предмету нет (окно сдвинулось)
+SUMMARY_WINDOW = DAY
+SUMMARY_REFRESH = HOUR
+# Ключей в одном запросе пересчёта (ограничение числа параметров SQLite)
+SUMMARY_BATCH = 500
+
+# Одна строка любого уровня в общем виде:
+# (time, qlt, count, volume, turnover, min_price, max_price)
+_RAW_AS_SERIES = '''
+    SELECT time, qlt, 1 AS count, amount AS volume, price AS turnover,
+           price / MAX(amount, 1) AS min_price, price / MAX(amount, 1) AS max_price
+    FROM price_history INDEXED BY idx_history_item_time
+    WHERE item = ? AND time >= ? AND time < ?
+'''
+_TIER_AS_SERIES = '''
+    SELECT bucket AS time, qlt, count, volume, turnover, min_price, max_price
+    FROM {table} INDEXED BY idx_{short}_item_bucket
+    WHERE item = ? AND bucket >= ? AND bucket < ?
+'''
+SCHEMA_VERSION = len(MIGRATIONS)
 
 class Database:
     def __init__(self, db_path='base.db'):
         self.db_path = db_path
-        self.init_db()
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
 
-    def init_db(self):
-        """Инициализация базы данных"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-
-            # Таблица конфигурации
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS config (
-                    key TEXT PRIMARY KEY,
-                    value TEXT
-                )
-            ''')
-
-            # Таблица отслеживаемых предметов
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS tracked_items (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    item_id TEXT,
-                    target_price INTEGER DEFAULT 0,
-                    target_rarity INTEGER DEFAULT 0
-                )
-            ''')
-
-
-
-            # Таблица истории цен
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS price_history (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    item_id TEXT,
-                    time INTEGER,
-                    price INTEGER,
-                    amount INTEGER,
-                    qlt INTEGER DEFAULT 0,
-                    UNIQUE(item_id, time, price, amount, qlt)
-                )
-            ''')
-
-            # Столбец qlt уже добавлен в CREATE TABLE
-
-            # Таблица отслеживаемых строк (для сохранения дубликатов предметов)
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS tracked_rows (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    item_id TEXT,
-                    rarity INTEGER DEFAULT 0
-                )
-            ''')
-
-            # Индексы для производительности
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_history_item_time ON price_history (item_id, time DESC)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_history_item ON price_history (item_id)')
+    def connect(self):
+        """Открыть соединение (схема проверяется при первом обращении)"""
+        if not self._schema_ready:
+            self.init_db()
+        return sqlite3.connect(self.db_path)
 
-            conn.commit()
+    def init_db(self):
+        """Инициализация базы данных и применение недостающих миграций"""
+        with self._schema_lock:
+            if self._schema_ready:
+                return
+            conn = sqlite3.connect(self.db_path, isolation_level=None)
+            try:
+                version = conn.execute('PRAGMA user_version').fetchone()[0]
+                has_tables = conn.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()[0] > 0
+                upgraded = has_tables and version < SCHEMA_VERSION
+                while version < SCHEMA_VERSION:
+                    # Каждая миграция - отдельная транзакция вместе с номером версии
+                    conn.execute('BEGIN IMMEDIATE')
+                    try:
+                        MIGRATIONS[version](conn.cursor())
+                        version += 1
+                        conn.execute(f'PRAGMA user_version = {version}')
+                        conn.execute('COMMIT')
+                    except Exception:
+                        conn.execute('ROLLBACK')
+                        raise
+                if upgraded:
+                    # Статистика для планировщика (выбор между первичным ключом и
+                    # индексом по времени) и возврат места после перестройки таблиц
+                    conn.execute('ANALYZE')
+                    conn.execute('VACUUM')
+            finally:
+                conn.close()
+            self._schema_ready = True
+
+    def item_key(self, cursor, item_id, region=DEFAULT_REGION):
+        """Целочисленный ключ предмета в регионе (создаётся при первом обращении)"""
+        cursor.execute('INSERT OR IGNORE INTO items (region, item_id) VALUES (?, ?)', (region, item_id))
+        cursor.execute('SELECT id FROM items WHERE region = ? AND item_id = ?', (region, item_id))
+        return cursor.fetchone()[0]
+
+    def find_item_key(self, cursor, item_id, region=DEFAULT_REGION):
+        """Ключ предмета или None, если истории по нему нет"""
+        cursor.execute('SELECT id FROM items WHERE region = ? AND item_id = ?', (region, item_id))
+        result = cursor.fetchone()
+        return result[0] if result else None
 
     def get_config(self, key, default=None):
         """Получить значение конфигурации"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('SELECT value FROM config WHERE key = ?', (key,))
             result = cursor.fetchone()
             return result[0] if result else default
 
+    def get_all_config(self):
+        """Получить все значения конфигурации одним запросом"""
+        with self.connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT key, value FROM config')
+            return dict(cursor.fetchall())
+
     def set_config(self, key, value):
         """Установить значение конфигурации"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT OR REPLACE INTO config (key, value) VALUES (?, ?)
@@ -81,33 +412,73 @@ class Database:
 
 
 
-    def add_tracked_item(self, item_id, target_price=0, target_rarity=0):
+    def add_tracked_item(self, item_id, target_price=0, target_rarity=0, region=DEFAULT_REGION):
         """Добавить отслеживаемый предмет"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
-                INSERT INTO tracked_items (item_id, target_price, target_rarity) VALUES (?, ?, ?)
-            ''', (item_id, target_price, target_rarity))
+                INSERT INTO tracked_items (item_id, target_price, target_rarity, region) VALUES (?, ?, ?, ?)
+            ''', (item_id, target_price, target_rarity, region))
             conn.commit()
             return cursor.lastrowid
 
+    @profiling.timed('db.import_tracked_items')
+    def import_tracked_items(self, entries, replace=False):
+        """Применить строки watchlist.WatchEntry одной транзакцией.
+
+        Строка файла обновляет ещё не сопоставленную строку с тем же
+        (item_id, регион, редкость) или добавляется. replace - удалить строки,
+        которых нет в файле. Возвращает (добавлено, обновлено, id удалённых).
+        """
+        with self.connect() as conn:
+            cursor = conn.cursor()
+            existing = {}
+            cursor.execute('SELECT id, item_id, region, target_rarity FROM tracked_items ORDER BY id')
+            for row_id, item_id, region, rarity in cursor.fetchall():
+                existing.setdefault((item_id, region, rarity), []).append(row_id)
+            added = updated = 0
+            for entry in entries:
+                candidates = existing.get((entry.item_id, entry.region, entry.rarity))
+                if candidates:
+                    cursor.execute('''
+                        UPDATE tracked_items SET target_price = COALESCE(?, target_price),
+                            alert_rule = COALESCE(?, alert_rule) WHERE id = ?
+                    ''', (entry.target_price, entry.rule, candidates.pop(0)))
+                    updated += 1
+                else:
+                    cursor.execute('''
+                        INSERT INTO tracked_items (item_id, target_price, target_rarity, region, alert_rule)
+                        VALUES (?, ?, ?, ?, ?)
+                    ''', (entry.item_id, entry.target_price or 0, entry.rarity, entry.region, entry.rule))
+                    added += 1
+            removed = []
+            if replace:
+                # Оставшиеся несопоставленными строки в файле не упомянуты
+                removed = [(row_id,) for ids in existing.values() for row_id in ids]
+                cursor.executemany('DELETE FROM tracked_items WHERE id = ?', removed)
+                cursor.executemany('DELETE FROM latest_prices WHERE row_id = ?', removed)
+            conn.commit()
+            return added, updated, [row_id for row_id, in removed]
+
     def remove_tracked_item(self, row_id):
         """Удалить отслеживаемый предмет"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('DELETE FROM tracked_items WHERE id = ?', (row_id,))
+            cursor.execute('DELETE FROM latest_prices WHERE row_id = ?', (row_id,))
             conn.commit()
 
+    @profiling.timed('db.get_tracked_items')
     def get_tracked_items(self):
         """Получить все отслеживаемые предметы"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
-            cursor.execute('SELECT id, item_id, target_price, target_rarity FROM tracked_items')
+            cursor.execute('SELECT id, item_id, target_price, target_rarity, region, alert_rule FROM tracked_items')
             return cursor.fetchall()
 
     def update_target_price(self, row_id, price):
         """Обновить целевую цену"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 UPDATE tracked_items SET target_price = ? WHERE id = ?
@@ -116,82 +487,537 @@ class Database:
 
     def update_target_rarity(self, row_id, rarity):
         """Обновить целевую редкость"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 UPDATE tracked_items SET target_rarity = ? WHERE id = ?
             ''', (rarity, row_id))
             conn.commit()
 
-    def add_price_history(self, item_id, prices):
-        """Добавить записи истории цен"""
-        import datetime
+    def update_alert_rule(self, row_id, rule):
+        """Обновить правило оповещения (None - стандартные проверки)"""
+        with self.connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('UPDATE tracked_items SET alert_rule = ? WHERE id = ?', (rule, row_id))
+            conn.commit()
 
-        with sqlite3.connect(self.db_path) as conn:
+    def update_target_region(self, row_id, region):
+        """Обновить регион отслеживаемого предмета"""
+        with self.connect() as conn:
             cursor = conn.cursor()
+            cursor.execute('UPDATE tracked_items SET region = ? WHERE id = ?', (region, row_id))
+            # Цены другого региона строке больше не соответствуют
+            cursor.execute('DELETE FROM latest_prices WHERE row_id = ?', (row_id,))
+            conn.commit()
 
-            added_count = 0
-            for price_data in prices:
-                # Преобразовать время в timestamp если оно строка
-                time_val = price_data['time']
-                if isinstance(time_val, str):
-                    # Предполагаем формат ISO 8601
-                    try:
-                        dt = datetime.datetime.fromisoformat(time_val.replace('Z', '+00:00'))
-                        time_val = int(dt.timestamp())
-                    except:
-                        # Если не ISO, пробуем как timestamp строку
-                        try:
-                            time_val = int(float(time_val))
-                        except:
-                            continue  # Пропускаем некорректные записи
+    @profiling.timed('db.save_latest_prices')
+    def save_latest_prices(self, rows):
+        """Сохранить итоги цикла: строки (row_id, qlt, floor_price, lot_count, scanned_at, unit_floor).
 
-                try:
-                    qlt = price_data.get('additional', {}).get('qlt', 0)
-                    cursor.execute('''
-                        INSERT OR IGNORE INTO price_history (item_id, time, price, amount, qlt)
-                        VALUES (?, ?, ?, ?, ?)
-                    ''', (item_id, time_val, price_data['price'], price_data['amount'], qlt))
+        floor_price - цена самого дешёвого лота целиком (колонка таблицы),
+        unit_floor - минимальная цена за штуку, она идёт в сводку по предметам.
+        """
+        with self.connect() as conn:
+            cursor = conn.cursor()
+            cursor.executemany('''
+                INSERT INTO latest_prices (row_id, qlt, floor_price, lot_count, scanned_at) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (row_id, qlt) DO UPDATE SET
+                    floor_price = excluded.floor_price,
+                    lot_count = excluded.lot_count,
+                    scanned_at = excluded.scanned_at
+            ''', [row[:5] for row in rows])
+            # Минимумы за штуку - в сводку по предметам, как у скринера
+            tracked = {row_id: (region, item_id) for row_id, region, item_id in
+                       cursor.execute('SELECT id, region, item_id FROM tracked_items').fetchall()}
+            self._record_floors(cursor, [tracked[row_id] + (qlt, unit_floor, lots, scanned_at)
+                                         for row_id, qlt, _, lots, scanned_at, unit_floor in rows
+                                         if row_id in tracked and unit_floor is not None])
+            conn.commit()
 
-                    if cursor.rowcount > 0:
-                        added_count += 1
-                except sqlite3.IntegrityError:
-                    # Дубликат, пропускаем
-                    continue
+    @profiling.timed('db.record_floors')
+    def record_floors(self, rows):
+        """Минимальные цены за штуку не из цикла проверки (скринер): (region, item_id, qlt, floor_price, lot_count, scanned_at)"""
+        with self.connect() as conn:
+            self._record_floors(conn.cursor(), rows)
+            conn.commit()
 
-            # Ограничить до 1000 записей на предмет (самые новые)
+    def _record_floors(self, cursor, rows):
+        keys = {}
+        batch = []
+        for row in rows:
+            if row[:2] not in keys:
+                keys[row[:2]] = self.item_key(cursor, row[1], row[0])
+            batch.append((keys[row[:2]],) + tuple(row[2:]))
+        # Более старое наблюдение (из другого источника) не перезаписывает свежее
+        cursor.executemany('''
+            INSERT INTO item_summary (item, qlt, floor_price, floor_lots, floor_at) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (item, qlt) DO UPDATE SET
+                floor_price = excluded.floor_price, floor_lots = excluded.floor_lots, floor_at = excluded.floor_at
+            WHERE excluded.floor_at >= COALESCE(floor_at, 0)
+        ''', batch)
+
+    def _refresh_summaries(self, cursor, keys, now=None):
+        import time
+
+        now = int(now if now is not None else time.time())
+        keys = list(keys)
+        for start in range(0, len(keys), SUMMARY_BATCH):
+            _refresh_sales(cursor, keys[start:start + SUMMARY_BATCH], now)
+
+    @profiling.timed('db.refresh_item_summaries')
+    def refresh_item_summaries(self, now=None):
+        """Сдвинуть окно сделок у сводок старше SUMMARY_REFRESH; возвращает число предметов"""
+        import time
+
+        now = int(now if now is not None else time.time())
+        with self.connect() as conn:
+            cursor = conn.cursor()
             cursor.execute('''
-                DELETE FROM price_history WHERE item_id = ? AND id NOT IN (
-                    SELECT id FROM price_history WHERE item_id = ? ORDER BY time DESC LIMIT 1000
-                )
-            ''', (item_id, item_id))
+                SELECT DISTINCT item FROM item_summary
+                WHERE sales_at < ? AND (volume > 0 OR prev_volume > 0)
+            ''', (now - SUMMARY_REFRESH,))
+            keys = [row[0] for row in cursor.fetchall()]
+            self._refresh_summaries(cursor, keys, now)
+            conn.commit()
+            return len(keys)
 
+    @profiling.timed('db.get_item_summaries')
+    def get_item_summaries(self, region=DEFAULT_REGION, qlt=None):
+        """Сводка по предметам региона (все редкости вместе или только qlt).
+
+        Строки (item_id, floor_price, floor_lots, floor_at, sales, volume, turnover,
+        prev_volume, prev_turnover); floor_* - по самой дешёвой редкости.
+        """
+        with self.connect() as conn:
+            cursor = conn.cursor()
+            query = '''
+                SELECT items.item_id, MIN(s.floor_price), SUM(s.floor_lots), MAX(s.floor_at), SUM(s.sales),
+                       SUM(s.volume), SUM(s.turnover), SUM(s.prev_volume), SUM(s.prev_turnover)
+                FROM item_summary s JOIN items ON items.id = s.item
+                WHERE items.region = ?
+            '''
+            params = [region]
+            if qlt is not None:
+                query += ' AND s.qlt = ?'
+                params.append(qlt)
+            cursor.execute(query + ' GROUP BY s.item', params)
+            return cursor.fetchall()
+
+    @profiling.timed('db.get_latest_prices')
+    def get_latest_prices(self):
+        """Последние известные цены: {(row_id, qlt): (floor_price, lot_count, scanned_at)}"""
+        with self.connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT row_id, qlt, floor_price, lot_count, scanned_at FROM latest_prices')
+            return {(row[0], row[1]): row[2:] for row in cursor.fetchall()}
+
+    @profiling.timed('db.add_price_history')
+    def add_price_history(self, item_id, prices, region=DEFAULT_REGION):
+        """Добавить записи истории цен"""
+        import datetime
+
+        rows = []
+        for price_data in prices:
+            # Преобразовать время в timestamp если оно строка
+            time_val = price_data['time']
+            if isinstance(time_val, str):
+                # Предполагаем формат ISO 8601
+                try:
+                    dt = datetime.datetime.fromisoformat(time_val.replace('Z', '+00:00'))
+                    time_val = int(dt.timestamp())
+                except:
+                    # Если не ISO, пробуем как timestamp строку
+                    try:
+                        time_val = int(float(time_val))
+                    except:
+                        continue  # Пропускаем некорректные записи
+
+            try:
+                qlt = (price_data.get('additional') or {}).get('qlt', 0)
+                rows.append((qlt, time_val, price_data['price'], price_data['amount']))
+            except (KeyError, TypeError):
+                continue
+
+        with self.connect() as conn:
+            cursor = conn.cursor()
+            key = self.item_key(cursor, item_id, region)
+
+            # Сделки старше границы свёртки уже учтены в агрегатах
+            cursor.execute("SELECT value FROM config WHERE key = 'history_raw_since'")
+            result = cursor.fetchone()
+            raw_since = int(result[0]) if result else 0
+
+            # Дубликаты отбрасываются первичным ключом
+            seq = self._next_history_seq(cursor)
+            before = conn.total_changes
+            cursor.executemany('''
+                INSERT OR IGNORE INTO price_history (item, qlt, time, price, amount, seq)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', [(key,) + row + (seq,) for row in rows if row[1] >= raw_since])
+            added_count = conn.total_changes - before
+
+            if added_count:
+                self._fold_stats(cursor, key, rows)
+                self._refresh_summaries(cursor, [key])
             conn.commit()
             return added_count
 
-    def get_price_history(self, item_id, limit=1000, qlt_filter=None):
-        """Получить историю цен для предмета"""
-        with sqlite3.connect(self.db_path) as conn:
+    def _fold_stats(self, cursor, key, rows):
+        """Обновить статистику предмета сделками (qlt, time, price, amount) в текущей транзакции"""
+        sales = {}
+        for qlt, time_val, price, amount in rows:
+            sales.setdefault(qlt, []).append((time_val, price // max(amount, 1)))
+        for qlt, values in sales.items():
+            cursor.execute('SELECT state FROM price_stats WHERE item = ? AND qlt = ?', (key, qlt))
+            result = cursor.fetchone()
+            current = stats.PriceStats.from_bytes(result[0]) if result else stats.PriceStats()
+            if stats.fold_sales(current, values):
+                cursor.execute('''
+                    INSERT INTO price_stats (item, qlt, state) VALUES (?, ?, ?)
+                    ON CONFLICT (item, qlt) DO UPDATE SET state = excluded.state
+                ''', (key, qlt, current.to_bytes()))
+
+    @profiling.timed('db.get_price_stats')
+    def get_price_stats(self, item_id, region=DEFAULT_REGION):
+        """Статистика цен предмета по редкостям: {qlt: stats.PriceStats}"""
+        with self.connect() as conn:
             cursor = conn.cursor()
-            query = '''SELECT time, price, amount, qlt FROM price_history WHERE item_id = ?'''
-            params = [item_id]
+            cursor.execute('''SELECT qlt, state FROM price_stats
+                              WHERE item = (SELECT id FROM items WHERE region = ? AND item_id = ?)''',
+                           (region, item_id))
+            return {qlt: stats.PriceStats.from_bytes(state) for qlt, state in cursor.fetchall()}
+
+    @profiling.timed('db.get_price_history')
+    def get_price_history(self, item_id, limit=1000, qlt_filter=None, region=DEFAULT_REGION, since=None, offset=0):
+        """Получить историю цен для предмета (limit=-1 - без ограничения)"""
+        with self.connect() as conn:
+            cursor = conn.cursor()
+            query = '''SELECT time, price, amount, qlt FROM price_history
+                       WHERE item = (SELECT id FROM items WHERE region = ? AND item_id = ?)'''
+            params = [region, item_id]
             if qlt_filter is not None:
                 query += ' AND qlt = ?'
                 params.append(qlt_filter)
-            query += ' ORDER BY time DESC LIMIT ?'
-            params.append(limit)
+            if since is not None:
+                query += ' AND time >= ?'
+                params.append(since)
+            query += ' ORDER BY time DESC LIMIT ? OFFSET ?'
+            params += [limit, offset]
+            cursor.execute(query, params)
+            return cursor.fetchall()
+
+    @profiling.timed('db.get_unit_prices')
+    def get_unit_prices(self, item_id, since, qlt, region=DEFAULT_REGION):
+        """Цены за штуку из сырых сделок редкости qlt начиная с since"""
+        with self.connect() as conn:
+            cursor = conn.cursor()
+            key = self.find_item_key(cursor, item_id, region)
+            if key is None:
+                return []
+            cursor.execute('''
+                SELECT price / MAX(amount, 1) FROM price_history
+                WHERE item = ? AND qlt = ? AND time >= ?
+            ''', (key, qlt, since))
+            return [row[0] for row in cursor.fetchall()]
+
+    @profiling.timed('db.get_price_series')
+    def get_price_series(self, item_id, since, until, qlt_filter=None, bucket=None, region=DEFAULT_REGION):
+        """Ряд цен за период из всех уровней хранения.
+
+        Возвращает строки (time, qlt, count, volume, turnover, min_price, max_price),
+        отсортированные по времени. Если задан bucket (секунды), более
+        подробные уровни агрегируются до этого интервала.
+        """
+        with self.connect() as conn:
+            cursor = conn.cursor()
+            key = self.find_item_key(cursor, item_id, region)
+            if key is None:
+                return []
+
+            parts = [_RAW_AS_SERIES]
+            params = [key, since, until]
+            for table, _ in HISTORY_TIERS:
+                parts.append(_TIER_AS_SERIES.format(table=table, short=table[len('price_'):]))
+                params += [key, since, until]
+            union = ' UNION ALL '.join(parts)
+
+            qlt_clause = ''
+            if qlt_filter is not None:
+                qlt_clause = 'WHERE qlt = ?'
+                params.append(qlt_filter)
+
+            if bucket:
+                query = f'''
+                    SELECT time / {int(bucket)} * {int(bucket)} AS t, qlt, SUM(count), SUM(volume),
+                           SUM(turnover), MIN(min_price), MAX(max_price)
+                    FROM ({union}) {qlt_clause}
+                    GROUP BY t, qlt ORDER BY t
+                '''
+            else:
+                query = f'SELECT * FROM ({union}) {qlt_clause} ORDER BY time'
             cursor.execute(query, params)
             return cursor.fetchall()
 
-    def delete_price_history(self, item_id):
+    @profiling.timed('db.get_reference_prices')
+    def get_reference_prices(self, item_id, since, until=None, region=DEFAULT_REGION):
+        """Средневзвешенная цена за штуку (VWAP) по редкостям за период: {qlt: цена}"""
+        import time
+
+        until = int(until if until is not None else time.time()) + 1
+        volume = {}
+        turnover = {}
+        for _, qlt, _, vol, turn, _, _ in self.get_price_series(item_id, since, until, region=region):
+            volume[qlt] = volume.get(qlt, 0) + vol
+            turnover[qlt] = turnover.get(qlt, 0) + turn
+        return {qlt: turnover[qlt] / volume[qlt] for qlt in volume if volume[qlt] > 0}
+
+    @profiling.timed('db.add_lot_flow')
+    def add_lot_flow(self, rows):
+        """Добавить счётчики (region, item_id, qlt, bucket, appeared, sold, sold_units, sold_turnover, expired, depth)"""
+        with self.connect() as conn:
+            cursor = conn.cursor()
+            keys = {}
+            batch = []
+            for row in rows:
+                if row[:2] not in keys:
+                    keys[row[:2]] = self.item_key(cursor, row[1], row[0])
+                batch.append((keys[row[:2]],) + tuple(row[2:]))
+            # Глубина - последнее значение за час, остальное складывается
+            cursor.executemany('''
+                INSERT INTO lot_flow (item, qlt, bucket, appeared, sold, sold_units, sold_turnover, expired, depth)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (item, qlt, bucket) DO UPDATE SET
+                    appeared = appeared + excluded.appeared,
+                    sold = sold + excluded.sold,
+                    sold_units = sold_units + excluded.sold_units,
+                    sold_turnover = sold_turnover + excluded.sold_turnover,
+                    expired = expired + excluded.expired,
+                    depth = excluded.depth
+            ''', batch)
+            conn.commit()
+
+    @profiling.timed('db.get_lot_flow')
+    def get_lot_flow(self, item_id, since, region=DEFAULT_REGION):
+        """Итоги lot_flow с since по редкостям:
+        {qlt: (appeared, sold, sold_units, sold_turnover, expired, depth)}, depth - последняя"""
+        with self.connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT qlt, SUM(appeared), SUM(sold), SUM(sold_units), SUM(sold_turnover), SUM(expired),
+                       (SELECT depth FROM lot_flow AS last
+                        WHERE last.item = lot_flow.item AND last.qlt = lot_flow.qlt
+                        ORDER BY bucket DESC LIMIT 1)
+                FROM lot_flow
+                WHERE item = (SELECT id FROM items WHERE region = ? AND item_id = ?) AND bucket >= ?
+                GROUP BY item, qlt
+            ''', (region, item_id, since))
+            return {row[0]: row[1:] for row in cursor.fetchall()}
+
+    def get_raw_history_since(self):
+        """Граница свёртки: отдельные сделки старше уже перенесены в агрегаты"""
+        return int(self.get_config('history_raw_since', 0))
+
+    @profiling.timed('db.compact_history')
+    def compact_history(self, now=None, force=False):
+        """Свернуть устаревшие сделки в почасовые и дневные агрегаты.
+
+        Выполняется не чаще раза в COMPACT_INTERVAL (если не force).
+        Возвращает количество удалённых строк более подробных уровней.
+        """
+        import time
+
+        now = int(now if now is not None else time.time())
+        with self.connect() as conn:
+            cursor = conn.cursor()
+            config = dict(cursor.execute('''
+                SELECT key, value FROM config WHERE key IN
+                ('history_compacted_at', 'history_raw_days', 'history_hourly_days')
+            ''').fetchall())
+            if not force and now - int(config.get('history_compacted_at', 0)) < COMPACT_INTERVAL:
+                return 0
+            raw_days = int(config.get('history_raw_days', DEFAULT_RAW_DAYS))
+            hourly_days = int(config.get('history_hourly_days', DEFAULT_HOURLY_DAYS))
+
+            # Границы выровнены по интервалу целевого уровня, чтобы не делить интервал
+            raw_before = (now - raw_days * DAY) // HOUR * HOUR
+            hourly_before = (now - hourly_days * DAY) // DAY * DAY
+
+            items = [row[0] for row in cursor.execute('SELECT id FROM items').fetchall()]
+            seq = self._next_history_seq(cursor)
+            removed = 0
+            for key in items:
+                removed += self._rollup(cursor, 'price_history', 'time', 'price_history_hourly', HOUR, key, raw_before,
+                                        'COUNT(*), SUM(amount), SUM(price), MIN(price / MAX(amount, 1)), MAX(price / MAX(amount, 1))',
+                                        'idx_history_item_time', seq)
+                removed += self._rollup(cursor, 'price_history_hourly', 'bucket', 'price_history_daily', DAY, key, hourly_before,
+                                        'SUM(count), SUM(volume), SUM(turnover), MIN(min_price), MAX(max_price)',
+                                        'idx_history_hourly_item_bucket', seq)
+
+            # Счётчики продаж по лотам хранятся столько же, сколько почасовые итоги
+            cursor.execute('DELETE FROM lot_flow WHERE bucket < ?', (hourly_before,))
+            removed += cursor.rowcount
+
+            cursor.execute('INSERT OR REPLACE INTO config (key, value) VALUES (?, ?)', ('history_compacted_at', str(now)))
+            cursor.execute('''
+                INSERT INTO config (key, value) VALUES ('history_raw_since', ?)
+                ON CONFLICT(key) DO UPDATE SET value = MAX(CAST(value AS INTEGER), CAST(excluded.value AS INTEGER))
+            ''', (str(raw_before),))
+            conn.commit()
+            return removed
+
+    def _rollup(self, cursor, source, time_column, target, bucket, key, before, aggregates, index, seq):
+        """Перенести строки source старше before в target с интервалом bucket.
+
+        Созданные и дополненные интервалы получают номер изменения seq.
+        """
+        cursor.execute(f'''
+            INSERT INTO {target} (item, qlt, bucket, count, volume, turnover, min_price, max_price, seq)
+            SELECT item, qlt, {time_column} / {bucket} * {bucket} AS b, {aggregates}, ?
+            FROM {source} INDEXED BY {index}
+            WHERE item = ? AND {time_column} < ?
+            GROUP BY qlt, b
+            ON CONFLICT (item, qlt, bucket) DO UPDATE SET
+                count = count + excluded.count,
+                volume = volume + excluded.volume,
+                turnover = turnover + excluded.turnover,
+                min_price = MIN(min_price, excluded.min_price),
+                max_price = MAX(max_price, excluded.max_price),
+                seq = excluded.seq
+        ''', (seq, key, before))
+        cursor.execute(f'DELETE FROM {source} WHERE item = ? AND {time_column} < ?', (key, before))
+        return cursor.rowcount
+
+    def _next_history_seq(self, cursor):
+        """Номер изменения для строк истории текущей транзакции.
+
+        Запись в SQLite одна за раз, поэтому номера зафиксированных транзакций
+        всегда идут без разрывов снизу и выгрузка по ним ничего не пропускает.
+        """
+        cursor.execute('''
+            INSERT INTO config (key, value) VALUES ('history_seq', '1')
+            ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1
+        ''')
+        cursor.execute("SELECT value FROM config WHERE key = 'history_seq'")
+        return int(cursor.fetchone()[0])
+
+    def history_seq(self):
+        """Последний выданный номер изменения истории"""
+        return int(self.get_config('history_seq', 0))
+
+    def iter_history_rows(self, dataset, since=None, chunk_rows=50000, after_seq=None, until_seq=None):
+        """Потоково читать набор истории порциями по chunk_rows.
+
+        Строки (region, item_id, *столбцы набора) упорядочены по предмету и времени;
+        since - вернуть только строки со временем строго больше, after_seq /
+        until_seq - только строки с номером изменения в (after_seq, until_seq].
+        """
+        table, time_column, columns = HISTORY_DATASETS[dataset]
+        if after_seq is not None:
+            # Изменённых строк обычно мало - выборка по номеру изменения и сортировка
+            index = f'idx_{table[len("price_"):]}_seq'
+        else:
+            index = 'idx_history_item_time' if dataset == 'raw' else f'idx_{table[len("price_"):]}_item_bucket'
+        query = f'''
+            SELECT items.region, items.item_id, {', '.join('h.' + c for c in columns)}
+            FROM {table} h INDEXED BY {index} JOIN items ON items.id = h.item
+        '''
+        conditions = []
+        params = []
+        if since is not None:
+            conditions.append(f'h.{time_column} > ?')
+            params.append(since)
+        if after_seq is not None:
+            conditions.append('h.seq > ?')
+            params.append(after_seq)
+        if until_seq is not None:
+            conditions.append('h.seq <= ?')
+            params.append(until_seq)
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += f' ORDER BY h.item, h.{time_column}'
+
+        conn = self.connect()
+        try:
+            cursor = conn.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(chunk_rows)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            conn.close()
+
+    def import_history_rows(self, dataset, rows):
+        """Загрузить строки (region, item_id, *столбцы набора) одной транзакцией.
+
+        Сырые сделки неизменны: существующие не перезаписываются, сделки
+        старше границы свёртки пропускаются, как и в add_price_history.
+        Интервал агрегатов заменяется загружаемой версией - выгрузка пишет
+        дополненный свёрткой интервал заново, файлы читаются от старых к
+        новым. Возвращает число добавленных или изменённых строк.
+        """
+        table, time_column, columns = HISTORY_DATASETS[dataset]
+        with self.connect() as conn:
+            cursor = conn.cursor()
+            raw_since = 0
+            if dataset == 'raw':
+                cursor.execute("SELECT value FROM config WHERE key = 'history_raw_since'")
+                result = cursor.fetchone()
+                raw_since = int(result[0]) if result else 0
+            time_pos = columns.index(time_column) + 2
+
+            keys = {}
+            batch = []
+            for row in rows:
+                if row[time_pos] < raw_since:
+                    continue
+                region_item = (row[0], row[1])
+                if region_item not in keys:
+                    keys[region_item] = self.item_key(cursor, row[1], row[0])
+                batch.append((keys[region_item],) + tuple(row[2:]))
+
+            insert = f'''
+                INSERT INTO {table} (item, {', '.join(columns)}, seq)
+                VALUES ({', '.join('?' * (len(columns) + 2))})
+            '''
+            if dataset == 'raw':
+                conflict = 'ON CONFLICT DO NOTHING'
+            else:
+                # Та же версия интервала не считается изменением и не сдвигает seq
+                values = [c for c in columns if c not in ('qlt', time_column)]
+                conflict = f'''
+                    ON CONFLICT (item, qlt, {time_column}) DO UPDATE SET
+                        {', '.join(f'{c} = excluded.{c}' for c in values + ['seq'])}
+                    WHERE ({', '.join(values)}) IS NOT ({', '.join('excluded.' + c for c in values)})
+                '''
+            seq = self._next_history_seq(cursor)
+            before = conn.total_changes
+            cursor.executemany(insert + conflict, [row + (seq,) for row in batch])
+            added = conn.total_changes - before
+            if added and dataset == 'raw':
+                self._refresh_summaries(cursor, set(keys.values()))
+            conn.commit()
+            return added
+
+    def delete_price_history(self, item_id, region=DEFAULT_REGION):
         """Удалить всю историю цен для предмета"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
-            cursor.execute('DELETE FROM price_history WHERE item_id = ?', (item_id,))
+            key = self.find_item_key(cursor, item_id, region)
+            if key is None:
+                return 0
+            deleted = 0
+            for table in ('price_history',) + tuple(table for table, _ in HISTORY_TIERS):
+                cursor.execute(f'DELETE FROM {table} WHERE item = ?', (key,))
+                deleted += cursor.rowcount
+            cursor.execute('DELETE FROM price_stats WHERE item = ?', (key,))
+            cursor.execute('DELETE FROM lot_flow WHERE item = ?', (key,))
+            self._refresh_summaries(cursor, [key])
             conn.commit()
-            return cursor.rowcount
+            return deleted
 
 
 
-# Глобальный экземпляр базы данных
+# Глобальный экземпляр базы данных (создание дешёвое - файл открывается
+# и схема проверяется только при первом запросе)
 db = Database()
@@ -0,0 +1,1002 @@
+import datetime
+import time
+from PyQt5.QtWidgets import (QApplication, QVBoxLayout, QLabel, QPushButton, QTableWidget,
+                            QTableWidgetItem, QLineEdit, QHBoxLayout, QHeaderView, QDialog,
+                            QListWidget, QListWidgetItem, QSpinBox, QComboBox, QCheckBox, QTabWidget, QTableView,
+                            QAbstractItemView)
+from PyQt5.QtCore import Qt, QTimer, pyqtSignal, QRunnable, QThreadPool, pyqtSlot, QAbstractTableModel, QModelIndex
+from PyQt5.QtGui import QColor
+
+import api
+from database import db
+
+class HistoryLoader(QRunnable):
+    def __init__(self, item_id, offset, limit, price_tracker, history_dialog, region=api.DEFAULT_REGION):
+        super().__init__()
+        self.item_id = item_id
+        self.region = region
+        self.offset = offset
+        self.limit = limit
+        self.price_tracker = price_tracker
+        self.history_dialog = history_dialog
+
+    @pyqtSlot()
+    def run(self):
+        # Подогретая первая страница отдаётся из базы без запроса к API. Дальше
+        # база не копия истории API (пропуски прошлых сессий, свёртка сырых
+        # сделок) - остальные страницы всегда запрашиваются
+        if self.offset == 0 and self.limit <= api.HISTORY_PAGE_LIMIT and \
+                self.price_tracker.is_history_warm(self.item_id, self.region):
+            rows = db.get_price_history(self.item_id, self.limit, region=self.region, offset=self.offset)
+            if len(rows) == self.limit:
+                history = [{'time': t, 'price': price, 'amount': amount, 'additional': {'qlt': qlt}}
+                           for t, price, amount, qlt in rows]
+                self.history_dialog.history_loaded.emit(history, self.offset, self.limit)
+                return
+
+        try:
+            history = self.price_tracker.fetch_history_page(self.item_id, self.offset, self.limit, self.region)
+        except api.ApiError as e:
+            # Сбой - не конец истории: диалог предложит повторить
+            self.history_dialog.history_failed.emit(str(e), self.offset)
+            return
+        except Exception as e:
+            self.history_dialog.history_failed.emit(f"ошибка ответа: {str(e)}", self.offset)
+            return
+        if history:
+            # Сохранить загруженные сделки для долгосрочной истории (до
+            # сигнала - график перечитывает ряд из базы)
+            try:
+                db.add_price_history(self.item_id, history, self.region)
+            except Exception as e:
+                self.price_tracker.log_message(f"Ошибка сохранения истории {self.item_id}: {str(e)}", item_id=self.item_id)
+        self.history_dialog.history_loaded.emit(history, self.offset, self.limit)
+
+
+class ChartLoader(QRunnable):
+    """Чтение ряда цен из всех уровней хранения и построение пирамид графика"""
+    def __init__(self, item_id, region, history_dialog):
+        super().__init__()
+        self.item_id = item_id
+        self.region = region
+        self.history_dialog = history_dialog
+
+    @pyqtSlot()
+    def run(self):
+        import chart
+
+        try:
+            rows = db.get_price_series(self.item_id, 0, int(time.time()) + 1, region=self.region)
+            self.history_dialog.chart_loaded.emit(chart.build_pyramids(rows))
+        except Exception as e:
+            self.history_dialog.price_tracker.log_message(f"Ошибка построения графика {self.item_id}: {str(e)}", item_id=self.item_id)
+
+class HistoryDialog(QDialog):
+    history_loaded = pyqtSignal(list, int, int)  # history, offset, limit
+    history_failed = pyqtSignal(str, int)  # error, offset
+    chart_loaded = pyqtSignal(object)  # {qlt: chart.SeriesPyramid}
+
+    def __init__(self, item_id, name, parent, region=api.DEFAULT_REGION):
+        super().__init__(parent)
+        self.item_id = item_id
+        self.region = region
+        self.name = name
+        self.price_tracker = parent
+        self.offset = 0
+        self.limit = 200
+        self.loading = False
+        self.all_history = []
+        self.current_filter = 0  # 0 - все, 1-7 - редкости
+        self.chart_stale = False  # в базе есть сделки новее построенного графика
+
+        self.setWindowTitle(f"История цен: {name}")
+        self.resize(800, 600)
+        self.setMinimumSize(600, 400)
+
+        layout = QVBoxLayout()
+
+        # Фильтр по редкости
+        self.rarity_filter = QComboBox()
+        self.rarity_filter.addItems(["Все", "Обычный", "Необычный", "Особый", "Редкий", "Исключительный", "Легендарный"])
+        self.rarity_filter.currentIndexChanged.connect(self.on_filter_changed)
+        layout.addWidget(self.rarity_filter)
+
+        self.table = QTableWidget()
+        self.table.setColumnCount(5)
+        self.table.setHorizontalHeaderLabels(["Время", "Цена", "Количество", "Цена за шт.", "Редкость"])
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.table.setAlternatingRowColors(True)
+        self.table.verticalScrollBar().valueChanged.connect(self.on_scroll)
+
+        # График - только если установлен pyqtgraph
+        try:
+            import chart
+            self.chart = chart.PriceChart()
+            chart_tab = self.chart
+        except ImportError:
+            self.chart = None
+            chart_tab = QLabel("Для графика установите pyqtgraph: pip install pyqtgraph")
+            chart_tab.setAlignment(Qt.AlignCenter)
+        self.tabs = QTabWidget()
+        self.tabs.addTab(self.table, "Таблица")
+        self.tabs.addTab(chart_tab, "График")
+        self.tabs.currentChanged.connect(self.on_tab_changed)
+        layout.addWidget(self.tabs)
+
+        self.info_label = QLabel("Загрузка...")
+        layout.addWidget(self.info_label)
+
+        self.retry_btn = QPushButton("Повторить загрузку")
+        self.retry_btn.clicked.connect(self.retry_history)
+        self.retry_btn.hide()
+        layout.addWidget(self.retry_btn)
+
+        btn_close = QPushButton("Закрыть")
+        btn_close.clicked.connect(self.accept)
+        layout.addWidget(btn_close)
+
+        self.setLayout(layout)
+
+        self.history_loaded.connect(self.on_history_loaded)
+        self.history_failed.connect(self.on_history_failed)
+        self.chart_loaded.connect(self.on_chart_loaded)
+
+        # Первоначальная загрузка в фоне
+        loader = HistoryLoader(self.item_id, self.offset, self.limit, self.price_tracker, self, self.region)
+        QThreadPool.globalInstance().start(loader)
+
+    def on_filter_changed(self, index):
+        self.current_filter = index
+        self.apply_filter()
+        if self.chart is not None:
+            self.chart.set_filter(index - 1 if index else None)
+
+    def load_chart(self):
+        if self.chart is not None:
+            QThreadPool.globalInstance().start(ChartLoader(self.item_id, self.region, self))
+
+    def on_chart_loaded(self, pyramids):
+        self.chart.set_series(pyramids)
+
+    def on_tab_changed(self, index):
+        # Страницы догружаются прокруткой таблицы - график перестраивается
+        # один раз при возврате к нему, а не после каждой страницы
+        if self.chart_stale and self.tabs.widget(index) is self.chart:
+            self.chart_stale = False
+            self.load_chart()
+
+    def apply_filter(self):
+        self.table.setRowCount(0)
+        filtered_history = []
+        if self.current_filter == 0:  # Все
+            filtered_history = self.all_history
+        else:
+            filter_qlt = self.current_filter - 1  # 0 - обычный, etc.
+            filtered_history = [h for h in self.all_history if h.get('additional', {}).get('qlt', 0) == filter_qlt]
+
+        for price_data in filtered_history[-self.limit:]:  # Показать последние limit записей
+            row = self.table.rowCount()
+            self.table.insertRow(row)
+            time_val = price_data['time']
+            if isinstance(time_val, str):
+                try:
+                    dt = datetime.datetime.fromisoformat(time_val.replace('Z', '+00:00'))
+                    time_val = dt.timestamp()
+                except:
+                    time_val = 0
+            dt = datetime.datetime.fromtimestamp(time_val)
+            time_str = dt.strftime("%Y-%m-%d %H:%M:%S")
+            self.table.setItem(row, 0, QTableWidgetItem(time_str))
+            self.table.setItem(row, 1, QTableWidgetItem(self.price_tracker.format_price(str(price_data['price']))))
+            self.table.setItem(row, 2, QTableWidgetItem(str(price_data['amount'])))
+
+            # Цена за шт.
+            unit_price = price_data['price'] // price_data['amount'] if price_data['amount'] > 1 else price_data['price']
+            self.table.setItem(row, 3, QTableWidgetItem(self.price_tracker.format_price(str(unit_price))))
+
+            # Редкость
+            rarity_names = ["Обычный", "Необычный", "Особый", "Редкий", "Исключительный", "Легендарный"]
+            qlt = price_data.get('additional', {}).get('qlt', 0)
+            rarity_name = rarity_names[qlt] if qlt < len(rarity_names) else f"qlt={qlt}"
+            self.table.setItem(row, 4, QTableWidgetItem(rarity_name))
+
+        self.info_label.setText(f"Показаны последние {len(filtered_history[-self.limit:])} записей (фильтр: {self.rarity_filter.currentText()})")
+
+    def load_more_history(self):
+        if self.loading:
+            return
+        self.loading = True
+        loader = HistoryLoader(self.item_id, self.offset, self.limit, self.price_tracker, self, self.region)
+        QThreadPool.globalInstance().start(loader)
+
+    def on_history_loaded(self, history, offset, limit):
+        # Сортировка по времени: новые сверху
+        history = sorted(history, key=lambda x: x['time'], reverse=True)
+        self.all_history.extend(history)
+        if offset == 0:
+            self.table.setRowCount(0)
+        for price_data in history:
+            row = self.table.rowCount()
+            self.table.insertRow(row)
+            time_val = price_data['time']
+            if isinstance(time_val, str):
+                try:
+                    dt = datetime.datetime.fromisoformat(time_val.replace('Z', '+00:00'))
+                    time_val = dt.timestamp()
+                except:
+                    time_val = 0
+            dt = datetime.datetime.fromtimestamp(time_val)
+            time_str = dt.strftime("%Y-%m-%d %H:%M:%S")
+            self.table.setItem(row, 0, QTableWidgetItem(time_str))
+            self.table.setItem(row, 1, QTableWidgetItem(self.price_tracker.format_price(str(price_data['price']))))
+            self.table.setItem(row, 2, QTableWidgetItem(str(price_data['amount'])))
+
+            # Цена за шт.
+            unit_price = price_data['price'] // price_data['amount'] if price_data['amount'] > 1 else price_data['price']
+            self.table.setItem(row, 3, QTableWidgetItem(self.price_tracker.format_price(str(unit_price))))
+
+            # Редкость
+            rarity_names = ["Обычный", "Необычный", "Особый", "Редкий", "Исключительный", "Легендарный"]
+            qlt = price_data.get('additional', {}).get('qlt', 0)
+            rarity_name = rarity_names[qlt] if qlt < len(rarity_names) else f"qlt={qlt}"
+            self.table.setItem(row, 4, QTableWidgetItem(rarity_name))
+
+        self.offset += len(history)
+        if len(history) < limit:
+            self.info_label.setText(f"Всего записей: {self.table.rowCount()} (конец)")
+        else:
+            self.info_label.setText(f"Всего записей: {self.table.rowCount()} (прокрутите вниз для загрузки ещё)")
+        self.loading = False
+        # Новые сделки уже в базе: график строится по первой странице, дальше
+        # только помечается устаревшим (чтение ряда и пирамиды - весь период)
+        if offset == 0 or self.tabs.currentWidget() is self.chart:
+            self.load_chart()
+        elif history:
+            self.chart_stale = True
+
+        # Если фильтр активен, обновить таблицу
+        if self.current_filter != 0:
+            self.apply_filter()
+
+    def on_history_failed(self, error, offset):
+        self.price_tracker.log_message(f"Ошибка загрузки истории {self.item_id}: {error}", item_id=self.item_id)
+        self.loading = False
+        if offset == 0 and self.table.rowCount() == 0:
+            # Нечего прокручивать - повтор по кнопке
+            self.info_label.setText(f"Ошибка загрузки: {error}")
+            self.retry_btn.show()
+        else:
+            self.info_label.setText(f"Всего записей: {self.table.rowCount()}. Ошибка загрузки: {error} "
+                                    f"(прокрутите вниз, чтобы повторить)")
+
+    def retry_history(self):
+        self.retry_btn.hide()
+        self.info_label.setText("Загрузка...")
+        self.load_more_history()
+
+    def on_scroll(self, value):
+        if not self.loading and value == self.table.verticalScrollBar().maximum():
+            self.load_more_history()
+
+
+class SettingsDialog(QDialog):
+    update_db_requested = pyqtSignal()
+    diagnostics_requested = pyqtSignal()
+
+    def __init__(self, current_interval, scan_rate, enable_stacks, enable_percentage, percentage, raw_history_days, hourly_history_days, local_api_port=0, anomaly_sigma=0, archive_max_mb=0, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Настройки")
+        self.setFixedSize(350, 700)
+
+        layout = QVBoxLayout()
+
+        # --- Interval Section ---
+        layout.addWidget(QLabel("Интервал запросов к серверу:"))
+        self.interval_spin = QSpinBox()
+        self.interval_spin.setRange(10, 3600)
+        self.interval_spin.setSuffix(" секунд")
+        self.interval_spin.setValue(current_interval)
+        layout.addWidget(self.interval_spin)
+
+        layout.addWidget(QLabel("Лимит запросов к API:"))
+        self.rate_spin = QSpinBox()
+        self.rate_spin.setRange(10, 400)
+        self.rate_spin.setSuffix(" в минуту")
+        self.rate_spin.setValue(scan_rate)
+        layout.addWidget(self.rate_spin)
+
+        layout.addSpacing(10)
+
+        # --- Stack Search Section ---
+        self.stacks_checkbox = QCheckBox("Включить поиск выгодных стаков")
+        self.stacks_checkbox.setChecked(enable_stacks)
+        self.stacks_checkbox.stateChanged.connect(self.toggle_percentage_enabled)
+        layout.addWidget(self.stacks_checkbox)
+
+        layout.addSpacing(10)
+
+        # --- Percentage Search Section ---
+        self.percentage_checkbox = QCheckBox("Включить поиск по процентам ниже рыночной цены")
+        self.percentage_checkbox.setChecked(enable_percentage)
+        self.percentage_checkbox.stateChanged.connect(self.toggle_percentage_spin)
+        layout.addWidget(self.percentage_checkbox)
+
+        self.percentage_label = QLabel("Процент ниже рыночной цены:")
+        layout.addWidget(self.percentage_label)
+        self.percentage_spin = QSpinBox()
+        self.percentage_spin.setRange(1, 99)
+        self.percentage_spin.setSuffix(" %")
+        self.percentage_spin.setValue(percentage)
+        layout.addWidget(self.percentage_spin)
+
+        self.toggle_percentage_enabled()
+
+        layout.addSpacing(10)
+
+        # --- Anomaly Section ---
+        layout.addWidget(QLabel("Оповещать о цене ниже нормы (0 - выключено):"))
+        self.anomaly_spin = QSpinBox()
+        self.anomaly_spin.setRange(0, 10)
+        self.anomaly_spin.setSuffix(" σ")
+        self.anomaly_spin.setValue(anomaly_sigma)
+        layout.addWidget(self.anomaly_spin)
+
+        layout.addSpacing(10)
+
+        # --- History Retention Section ---
+        layout.addWidget(QLabel("Хранить отдельные сделки:"))
+        self.raw_days_spin = QSpinBox()
+        # Сводка по категориям сравнивает сделки двух последних суток
+        self.raw_days_spin.setRange(2, 3650)
+        self.raw_days_spin.setSuffix(" дней")
+        self.raw_days_spin.setValue(raw_history_days)
+        layout.addWidget(self.raw_days_spin)
+
+        layout.addWidget(QLabel("Хранить почасовые итоги (дальше - дневные):"))
+        self.hourly_days_spin = QSpinBox()
+        self.hourly_days_spin.setRange(1, 3650)
+        self.hourly_days_spin.setSuffix(" дней")
+        self.hourly_days_spin.setValue(hourly_history_days)
+        layout.addWidget(self.hourly_days_spin)
+
+        layout.addSpacing(10)
+
+        # --- Local API Section ---
+        layout.addWidget(QLabel("Локальный API (http://127.0.0.1:порт), 0 - выключен:"))
+        self.api_port_spin = QSpinBox()
+        self.api_port_spin.setRange(0, 65535)
+        self.api_port_spin.setValue(local_api_port)
+        layout.addWidget(self.api_port_spin)
+
+        layout.addSpacing(10)
+
+        # --- Response Archive Section ---
+        layout.addWidget(QLabel("Архив ответов API для разбора (0 - выключен):"))
+        self.archive_spin = QSpinBox()
+        self.archive_spin.setRange(0, 100000)
+        self.archive_spin.setSuffix(" МБ")
+        self.archive_spin.setValue(archive_max_mb)
+        layout.addWidget(self.archive_spin)
+
+        layout.addSpacing(10)
+
+        # --- Profiling Section ---
+        layout.addWidget(QLabel("Профилировать следующие циклы проверки (0 - нет):"))
+        self.profile_spin = QSpinBox()
+        self.profile_spin.setRange(0, 100)
+        layout.addWidget(self.profile_spin)
+        self.diagnostics_btn = QPushButton("Диагностика (F12)")
+        self.diagnostics_btn.clicked.connect(self.diagnostics_requested.emit)
+        layout.addWidget(self.diagnostics_btn)
+
+        layout.addSpacing(10)
+
+        # --- Database Update Section ---
+        layout.addWidget(QLabel("База данных предметов:"))
+        self.update_db_btn = QPushButton("Обновить базу предметов")
+        self.update_db_btn.clicked.connect(self.update_db_requested.emit)
+        layout.addWidget(self.update_db_btn)
+
+        layout.addStretch()
+
+        # --- Buttons ---
+        btn_layout = QHBoxLayout()
+        self.save_btn = QPushButton("Сохранить")
+        self.save_btn.clicked.connect(self.accept)
+        self.cancel_btn = QPushButton("Отмена")
+        self.cancel_btn.clicked.connect(self.reject)
+
+        btn_layout.addWidget(self.save_btn)
+        btn_layout.addWidget(self.cancel_btn)
+        layout.addLayout(btn_layout)
+
+        self.setLayout(layout)
+
+    def toggle_percentage_spin(self):
+        enabled = self.percentage_checkbox.isChecked()
+        self.percentage_label.setEnabled(enabled)
+        self.percentage_spin.setEnabled(enabled)
+
+    def toggle_percentage_enabled(self):
+        stacks_enabled = self.stacks_checkbox.isChecked()
+        self.percentage_checkbox.setEnabled(stacks_enabled)
+        if not stacks_enabled:
+            self.percentage_checkbox.setChecked(False)
+        self.toggle_percentage_spin()
+
+class QuickHUD(QDialog):
+    def __init__(self, name, rarity, buyout_price, unit_price, page, parent=None):
+        super().__init__(parent)
+        self.setWindowFlags(Qt.FramelessWindowHint | Qt.WindowStaysOnTopHint | Qt.Tool)
+        self.setAttribute(Qt.WA_TranslucentBackground)
+        self.setAttribute(Qt.WA_ShowWithoutActivating)
+
+        layout = QVBoxLayout()
+        layout.setContentsMargins(10, 10, 10, 10)
+
+        self.label = QLabel()
+        self.label.setStyleSheet("color: red; font-size: 14px; font-weight: bold;")
+        if page > 0:
+            text = f"{name}\nРедкость: {rarity}\nЦена за стак: {buyout_price}\nЦена за шт.: {unit_price}\nСтраница: {page}"
+        else:
+            text = f"{name}\nРедкость: {rarity}\nЦена: {buyout_price}"
+        self.label.setText(text)
+        layout.addWidget(self.label)
+
+        self.setLayout(layout)
+
+        # Позиционирование в правом верхнем углу
+        screen = QApplication.primaryScreen().geometry()
+        self.move(screen.width() - self.sizeHint().width() - 10, 10)
+
+        # Таймер на исчезновение через 30 секунд
+        QTimer.singleShot(30000, self.close)
+
+    def closeEvent(self, event):
+        if self.parent():
+            self.parent().current_hud = None
+        super().closeEvent(event)
+
+class ItemSearchDialog(QDialog):
+    """Поиск по общему каталогу; selected_item - item_id выбранного предмета"""
+    # Больше строк список не показывает - короткий запрос не заполняет его всем каталогом
+    MAX_RESULTS = 500
+
+    def __init__(self, catalog, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Поиск предмета")
+        self.setFixedSize(400, 400)
+
+        self.catalog = catalog
+        self.selected_item = None
+
+        layout = QVBoxLayout()
+
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("Введите название предмета...")
+        self.search_input.textChanged.connect(self.update_search_results)
+
+        self.results_list = QListWidget()
+        self.results_list.itemDoubleClicked.connect(self.select_item)
+
+        self.select_btn = QPushButton("Выбрать")
+        self.select_btn.clicked.connect(self.accept_selection)
+
+        layout.addWidget(self.search_input)
+        layout.addWidget(self.results_list)
+        layout.addWidget(self.select_btn)
+
+        self.setLayout(layout)
+
+    def update_search_results(self, text):
+        self.results_list.clear()
+        if not text: return
+
+        for name, item_id in self.catalog.search(text, self.MAX_RESULTS):
+            entry = QListWidgetItem(name)
+            entry.setData(Qt.UserRole, item_id)
+            self.results_list.addItem(entry)
+
+    def select_item(self, item):
+        # У разных предметов бывают одинаковые названия - выбор по item_id строки
+        self.selected_item = item.data(Qt.UserRole)
+        self.accept()
+
+    def accept_selection(self):
+        current_item = self.results_list.currentItem()
+        if current_item:
+            self.select_item(current_item)
+
+
+class ScreenerWorker(QRunnable):
+    def __init__(self, screener, item_ids, dialog):
+        super().__init__()
+        self.screener = screener
+        self.item_ids = item_ids
+        self.dialog = dialog
+        self.cancelled = False
+
+    @pyqtSlot()
+    def run(self):
+        last_emit = 0
+        def progress(done, total):
+            nonlocal last_emit
+            # Обновлять таблицу не чаще раза в секунду
+            now = time.monotonic()
+            if now - last_emit >= 1 or done == total:
+                last_emit = now
+                self.dialog.progress.emit(done, total, self.screener.results())
+
+        try:
+            self.screener.sweep(self.item_ids, progress=progress, cancelled=lambda: self.cancelled)
+        except Exception as e:
+            self.dialog.price_tracker.log_message(f"Ошибка скринера: {str(e)}")
+        self.dialog.finished_sweep.emit(self.screener.results())
+
+
+class ScreenerDialog(QDialog):
+    progress = pyqtSignal(int, int, list)  # done, total, candidates
+    finished_sweep = pyqtSignal(list)  # candidates
+
+    def __init__(self, catalog, token, parent):
+        super().__init__(parent)
+        import screener
+
+        self.price_tracker = parent
+        self.catalog = catalog
+        self.token = token
+        self.worker = None
+        self.candidates = []
+        self.region = api.DEFAULT_REGION  # регион последнего обхода
+
+        self.setWindowTitle("Скринер каталога")
+        self.resize(800, 600)
+
+        layout = QVBoxLayout()
+
+        # --- Фильтры ---
+        filter_layout = QHBoxLayout()
+        self.type_combo = QComboBox()
+        self.type_combo.addItem("Все категории", None)
+        for item_type in screener.catalog_types(catalog):
+            self.type_combo.addItem(item_type, item_type)
+        self.color_combo = QComboBox()
+        self.color_combo.addItem("Любой цвет", None)
+        for color in screener.catalog_colors(catalog):
+            self.color_combo.addItem(color, color)
+        self.metric_input = QLineEdit()
+        self.metric_input.setPlaceholderText("auctionItemsMetricId через запятую")
+        filter_layout.addWidget(self.type_combo)
+        filter_layout.addWidget(self.color_combo)
+        filter_layout.addWidget(self.metric_input)
+        layout.addLayout(filter_layout)
+
+        budget_layout = QHBoxLayout()
+        budget_layout.addWidget(QLabel("Запросов в минуту:"))
+        self.rate_spin = QSpinBox()
+        self.rate_spin.setRange(1, 400)
+        self.rate_spin.setValue(int(db.get_config('screener_rate', '60')))
+        budget_layout.addWidget(self.rate_spin)
+        budget_layout.addWidget(QLabel("Лучших:"))
+        self.top_spin = QSpinBox()
+        self.top_spin.setRange(5, 500)
+        self.top_spin.setValue(int(db.get_config('screener_top_k', '50')))
+        budget_layout.addWidget(self.top_spin)
+        budget_layout.addWidget(QLabel("Скидка от:"))
+        self.discount_spin = QSpinBox()
+        self.discount_spin.setRange(1, 99)
+        self.discount_spin.setSuffix(" %")
+        self.discount_spin.setValue(int(db.get_config('screener_min_discount', '10')))
+        budget_layout.addWidget(self.discount_spin)
+        budget_layout.addWidget(QLabel("Регион:"))
+        self.region_combo = QComboBox()
+        for code in api.REGIONS:
+            self.region_combo.addItem(code.upper(), code)
+        self.region_combo.setCurrentIndex(max(self.region_combo.findData(db.get_config('screener_region', api.DEFAULT_REGION)), 0))
+        budget_layout.addWidget(self.region_combo)
+        self.start_btn = QPushButton("Начать")
+        self.start_btn.clicked.connect(self.toggle_sweep)
+        budget_layout.addWidget(self.start_btn)
+        layout.addLayout(budget_layout)
+
+        self.table = QTableWidget()
+        self.table.setColumnCount(6)
+        self.table.setHorizontalHeaderLabels(["Название", "Редкость", "Мин. цена за шт.", "Средняя за 7 дн.", "Ниже на", "Лотов"])
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.table.setSelectionBehavior(QTableWidget.SelectRows)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        layout.addWidget(self.table)
+
+        self.info_label = QLabel("Выберите фильтры и нажмите \"Начать\"")
+        layout.addWidget(self.info_label)
+
+        btn_layout = QHBoxLayout()
+        self.add_btn = QPushButton("Добавить в отслеживаемые")
+        self.add_btn.clicked.connect(self.add_selected)
+        btn_close = QPushButton("Закрыть")
+        btn_close.clicked.connect(self.accept)
+        btn_layout.addWidget(self.add_btn)
+        btn_layout.addWidget(btn_close)
+        layout.addLayout(btn_layout)
+
+        self.setLayout(layout)
+
+        self.progress.connect(self.on_progress)
+        self.finished_sweep.connect(self.on_finished)
+
+    def selected_item_ids(self, screener):
+        metric_ids = set()
+        for part in self.metric_input.text().replace(';', ',').split(','):
+            part = part.strip()
+            if part.isdigit():
+                metric_ids.add(int(part))
+        return screener.filter_catalog(self.catalog, item_type=self.type_combo.currentData(),
+                                       color=self.color_combo.currentData(), metric_ids=metric_ids or None)
+
+    def toggle_sweep(self):
+        import screener
+
+        if self.worker is not None:
+            self.worker.cancelled = True
+            self.start_btn.setEnabled(False)
+            return
+
+        item_ids = self.selected_item_ids(screener)
+        if not item_ids:
+            self.info_label.setText("Под фильтр не попал ни один предмет")
+            return
+
+        db.set_config('screener_rate', self.rate_spin.value())
+        db.set_config('screener_top_k', self.top_spin.value())
+        db.set_config('screener_min_discount', self.discount_spin.value())
+        db.set_config('screener_region', self.region_combo.currentData())
+        limiter = api.RateLimiter(self.rate_spin.value())
+        sweep = screener.CatalogScreener(self.token, limiter, top_k=self.top_spin.value(),
+                                         min_discount=self.discount_spin.value() / 100,
+                                         region=self.region_combo.currentData())
+        self.region = sweep.region
+        minutes = sweep.estimate_seconds(len(item_ids)) / 60
+        self.info_label.setText(f"Предметов: {len(item_ids)}, оценка до {minutes:.0f} мин.")
+        self.worker = ScreenerWorker(sweep, item_ids, self)
+        self.start_btn.setText("Остановить")
+        QThreadPool.globalInstance().start(self.worker)
+
+    def on_progress(self, done, total, candidates):
+        self.show_candidates(candidates)
+        self.info_label.setText(f"Проверено {done} из {total}, найдено {len(candidates)}")
+
+    def on_finished(self, candidates):
+        self.show_candidates(candidates)
+        self.info_label.setText(f"Готово: найдено {len(candidates)}")
+        self.worker = None
+        self.start_btn.setText("Начать")
+        self.start_btn.setEnabled(True)
+
+    def show_candidates(self, candidates):
+        rarity_names = ["Обычный", "Необычный", "Особый", "Редкий", "Исключительный", "Легендарный"]
+        self.candidates = candidates
+        self.table.setRowCount(len(candidates))
+        for row, candidate in enumerate(candidates):
+            rarity_name = rarity_names[candidate.qlt] if candidate.qlt < len(rarity_names) else f"qlt={candidate.qlt}"
+            values = [
+                self.price_tracker.find_item_name(candidate.item_id),
+                rarity_name,
+                self.price_tracker.format_price(str(candidate.floor)),
+                self.price_tracker.format_price(str(candidate.reference)),
+                f"{candidate.discount * 100:.0f}%",
+                str(candidate.lots),
+            ]
+            for col, value in enumerate(values):
+                self.table.setItem(row, col, QTableWidgetItem(value))
+
+    def add_selected(self):
+        rows = sorted({index.row() for index in self.table.selectedIndexes()})
+        for row in rows:
+            candidate = self.candidates[row]
+            self.price_tracker.add_item_to_table(candidate.item_id, self.price_tracker.find_item_name(candidate.item_id),
+                                                 existing_rarity=candidate.qlt, region=self.region)
+        if rows:
+            self.price_tracker.log_message(f"Из скринера добавлено предметов: {len(rows)}")
+
+    def done(self, result):
+        if self.worker is not None:
+            self.worker.cancelled = True
+        super().done(result)
+
+
+class DiagnosticsDialog(QDialog):
+    """Таймеры горячих мест (profiling.timers), состояние API и профайлера"""
+    COLUMNS = ["Место", "Вызовов", "Среднее, мс", "p95, мс", "Макс., мс", "Всего, с"]
+
+    def __init__(self, price_tracker):
+        super().__init__(price_tracker)
+        self.price_tracker = price_tracker
+        self.setWindowTitle("Диагностика")
+        self.resize(640, 480)
+
+        layout = QVBoxLayout()
+        self.status_label = QLabel()
+        self.status_label.setWordWrap(True)
+        layout.addWidget(self.status_label)
+
+        self.table = QTableWidget()
+        self.table.setColumnCount(len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.table.verticalHeader().setVisible(False)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        layout.addWidget(self.table)
+
+        btn_layout = QHBoxLayout()
+        self.profile_spin = QSpinBox()
+        self.profile_spin.setRange(1, 100)
+        self.profile_spin.setSuffix(" цикл.")
+        self.profile_btn = QPushButton("Профилировать")
+        self.profile_btn.clicked.connect(lambda: self.price_tracker.start_profiling(self.profile_spin.value()))
+        reset_btn = QPushButton("Сбросить таймеры")
+        reset_btn.clicked.connect(self.reset_timers)
+        close_btn = QPushButton("Закрыть")
+        close_btn.clicked.connect(self.close)
+        btn_layout.addWidget(self.profile_spin)
+        btn_layout.addWidget(self.profile_btn)
+        btn_layout.addStretch()
+        btn_layout.addWidget(reset_btn)
+        btn_layout.addWidget(close_btn)
+        layout.addLayout(btn_layout)
+        self.setLayout(layout)
+
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.refresh_timer.start(1000)
+        self.refresh()
+
+    def reset_timers(self):
+        import profiling
+
+        profiling.timers.reset()
+        self.refresh()
+
+    def refresh(self):
+        import profiling
+
+        if not self.isVisible() and self.table.rowCount():
+            return
+        tracker = self.price_tracker
+        profiler = tracker.profiler
+        if profiler is not None:
+            profile = (f"профайлер: идёт, снимков {profiler.samples}, циклов в работе {len(tracker.profiled_cycles)}, "
+                       f"ещё не начато {tracker.profile_remaining}")
+        elif tracker.profile_remaining:
+            profile = f"профайлер: ждёт цикла проверки (циклов: {tracker.profile_remaining})"
+        else:
+            profile = "профайлер: выключен"
+        executor = api.executor()
+        breakers = ", ".join(f"{region.upper()} {kind}: {breaker.state}"
+                             for (region, kind), breaker in sorted(list(executor.breakers.items()), key=str)
+                             if breaker.state != breaker.CLOSED)
+        self.status_label.setText(f"Циклов в работе: {len(tracker.cycles)}; {profile}\n"
+                                  f"API: дублей запросов {executor.hedges}; разомкнуто: {breakers or 'нет'}")
+        self.profile_btn.setEnabled(profiler is None and not tracker.profile_remaining)
+
+        rows = profiling.timers.snapshot()
+        self.table.setRowCount(len(rows))
+        for row, (name, count, mean, p95, longest, total) in enumerate(rows):
+            values = [name, str(count), f"{mean * 1000:.2f}", f"{p95 * 1000:.2f}", f"{longest * 1000:.1f}", f"{total:.2f}"]
+            for col, value in enumerate(values):
+                item = self.table.item(row, col)
+                if item is None:
+                    self.table.setItem(row, col, QTableWidgetItem(value))
+                else:
+                    item.setText(value)
+
+
+class SummaryModel(QAbstractTableModel):
+    """Строки обзора категории: текст ячеек готовится заранее, сортировка - по сырым значениям"""
+    COLUMNS = ["Название", "Категория", "Цвет", "Мин. цена за шт.", "Лотов", "Обновлено",
+               "VWAP за 24 ч", "Продано за 24 ч", "Сделок", "Изменение"]
+    CHANGE_COLUMN = 9
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        # (значения для сортировки, тексты ячеек, item_id)
+        self.rows = []
+
+    def set_rows(self, rows):
+        self.beginResetModel()
+        self.rows = rows
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole:
+            return self.rows[index.row()][1][index.column()]
+        if role == Qt.TextAlignmentRole and index.column() >= 3:
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+        if role == Qt.ForegroundRole and index.column() == self.CHANGE_COLUMN:
+            change = self.rows[index.row()][0][self.CHANGE_COLUMN]
+            if change is not None:
+                return QColor(0, 140, 0) if change > 0 else QColor(200, 0, 0)
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.COLUMNS[section]
+        return None
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        # Предметы без значения - в конце при любом порядке
+        present = [row for row in self.rows if row[0][column] is not None]
+        missing = [row for row in self.rows if row[0][column] is None]
+        present.sort(key=lambda row: row[0][column], reverse=order == Qt.DescendingOrder)
+        self.set_rows(present + missing)
+
+
+class CategoryDashboard(QDialog):
+    """Сравнение предметов категории по сводке item_summary - без запросов к API.
+
+    Сводку пополняют циклы проверки (минимумы), скринер (минимумы каталога)
+    и загрузка истории (сделки за сутки); окно только читает её одним запросом.
+    """
+    def __init__(self, catalog, parent):
+        super().__init__(parent)
+        import screener
+
+        self.price_tracker = parent
+        self.catalog = catalog
+        self.summaries = {}
+
+        self.setWindowTitle("Обзор категорий")
+        self.resize(1000, 650)
+        layout = QVBoxLayout()
+
+        filter_layout = QHBoxLayout()
+        self.type_combo = QComboBox()
+        self.type_combo.addItem("Все категории", None)
+        subtypes = sorted({item_type for item_type in set(catalog.types) if '/' in item_type})
+        for item_type in screener.catalog_types(catalog):
+            self.type_combo.addItem(item_type, item_type)
+            for subtype in subtypes:
+                if subtype.startswith(item_type + '/'):
+                    self.type_combo.addItem("    " + subtype, subtype)
+        self.color_combo = QComboBox()
+        self.color_combo.addItem("Любой цвет", None)
+        for color in screener.catalog_colors(catalog):
+            self.color_combo.addItem(color, color)
+        self.region_combo = QComboBox()
+        for code in api.REGIONS:
+            self.region_combo.addItem(code.upper(), code)
+        self.rarity_combo = QComboBox()
+        self.rarity_combo.addItem("Все редкости", None)
+        for qlt, rarity_name in enumerate(["Обычный", "Необычный", "Особый", "Редкий", "Исключительный", "Легендарный"]):
+            self.rarity_combo.addItem(rarity_name, qlt)
+        self.name_filter = QLineEdit()
+        self.name_filter.setPlaceholderText("Название")
+        self.name_filter.setClearButtonEnabled(True)
+        self.empty_check = QCheckBox("Без данных")
+        self.empty_check.setToolTip("Показывать предметы категории, по которым ещё нет сводки")
+        for widget in (self.type_combo, self.color_combo, self.region_combo, self.rarity_combo,
+                       self.name_filter, self.empty_check):
+            filter_layout.addWidget(widget)
+        layout.addLayout(filter_layout)
+
+        self.model = SummaryModel(self)
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.setSortingEnabled(True)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.verticalHeader().setVisible(False)
+        # ResizeToContents измеряет все строки при каждой сортировке - ширины заданы заранее
+        self.table.horizontalHeader().setDefaultSectionSize(95)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.table.horizontalHeader().resizeSection(1, 150)
+        self.table.horizontalHeader().setSortIndicator(3, Qt.AscendingOrder)
+        self.table.doubleClicked.connect(self.show_history)
+        layout.addWidget(self.table)
+
+        self.info_label = QLabel()
+        layout.addWidget(self.info_label)
+
+        btn_layout = QHBoxLayout()
+        history_btn = QPushButton("История цен")
+        history_btn.clicked.connect(self.show_history)
+        add_btn = QPushButton("Добавить в отслеживаемые")
+        add_btn.clicked.connect(self.add_selected)
+        refresh_btn = QPushButton("Обновить")
+        refresh_btn.clicked.connect(self.load)
+        close_btn = QPushButton("Закрыть")
+        close_btn.clicked.connect(self.accept)
+        for button in (history_btn, add_btn, refresh_btn, close_btn):
+            btn_layout.addWidget(button)
+        layout.addLayout(btn_layout)
+        self.setLayout(layout)
+
+        self.region_combo.currentIndexChanged.connect(self.load)
+        self.rarity_combo.currentIndexChanged.connect(self.load)
+        self.type_combo.currentIndexChanged.connect(self.apply_filters)
+        self.color_combo.currentIndexChanged.connect(self.apply_filters)
+        self.name_filter.textChanged.connect(self.apply_filters)
+        self.empty_check.toggled.connect(self.apply_filters)
+        self.load()
+
+    def load(self):
+        """Прочитать сводку региона (и редкости) из базы"""
+        started = time.perf_counter()
+        self.summaries = {row[0]: row[1:] for row in
+                          db.get_item_summaries(self.region_combo.currentData(), self.rarity_combo.currentData())}
+        self.load_ms = (time.perf_counter() - started) * 1000
+        self.apply_filters()
+
+    def row_values(self, item_id, now):
+        name, item_type, color = self.catalog.describe(item_id)
+        summary = self.summaries.get(item_id)
+        if summary is None:
+            return (name.lower(), item_type, color) + (None,) * 7, (name, item_type, color) + ('',) * 7
+        floor, lots, floor_at, sales, volume, turnover, prev_volume, prev_turnover = summary
+        vwap = turnover / volume if volume else None
+        previous = prev_turnover / prev_volume if prev_volume else None
+        change = (vwap / previous - 1) * 100 if vwap and previous else None
+        age = now - floor_at if floor_at else None
+        format_price = self.price_tracker.format_price
+        values = (name.lower(), item_type, color, floor, lots, age, vwap, volume or None, sales or None, change)
+        texts = (name, item_type, color,
+                 format_price(str(floor)) if floor is not None else '',
+                 str(lots) if lots is not None else '',
+                 f"{self.price_tracker.format_age(age)} назад" if age is not None else '',
+                 format_price(str(int(vwap))) if vwap is not None else '',
+                 str(volume) if volume else '',
+                 str(sales) if sales else '',
+                 f"{change:+.1f}%" if change is not None else '')
+        return values, texts
+
+    def apply_filters(self):
+        started = time.perf_counter()
+        item_type = self.type_combo.currentData()
+        color = self.color_combo.currentData()
+        name_filter = self.name_filter.text().strip().lower()
+        source = self.catalog.ids if self.empty_check.isChecked() else self.summaries
+        now = int(time.time())
+        rows = []
+        for item_id in source:
+            name, entry_type, entry_color = self.catalog.describe(item_id)
+            if item_type and entry_type != item_type and not entry_type.startswith(item_type + '/'):
+                continue
+            if color and entry_color != color:
+                continue
+            if name_filter and name_filter not in name.lower():
+                continue
+            values, texts = self.row_values(item_id, now)
+            rows.append((values, texts, item_id))
+        self.model.set_rows(rows)
+        header = self.table.horizontalHeader()
+        self.model.sort(header.sortIndicatorSection(), header.sortIndicatorOrder())
+        elapsed = (time.perf_counter() - started) * 1000
+        self.info_label.setText(f"Предметов: {len(rows)} (со сводкой в регионе: {len(self.summaries)}); "
+                                f"чтение сводки {self.load_ms:.0f} мс, фильтр и сортировка {elapsed:.0f} мс")
+
+    def selected_item_ids(self):
+        rows = sorted({index.row() for index in self.table.selectionModel().selectedRows()})
+        return [self.model.rows[row][2] for row in rows]
+
+    def show_history(self, *args):
+        item_ids = self.selected_item_ids()
+        if not item_ids:
+            return
+        item_id = item_ids[0]
+        region = self.region_combo.currentData()
+        name = f"{self.catalog.describe(item_id)[0]} [{region.upper()}]"
+        HistoryDialog(item_id, name, self.price_tracker, region=region).exec_()
+
+    def add_selected(self):
+        item_ids = self.selected_item_ids()
+        rarity = self.rarity_combo.currentData() or 0
+        for item_id in item_ids:
+            self.price_tracker.add_item_to_table(item_id, self.price_tracker.find_item_name(item_id),
+                                                 existing_rarity=rarity, region=self.region_combo.currentData())
+        if item_ids:
+            self.price_tracker.log_message(f"Из обзора категорий добавлено предметов: {len(item_ids)}")
@@ -0,0 +1,190 @@
+"""Выгрузка и загрузка истории цен в колоночных форматах (Parquet / Arrow IPC).
+
+Файлы раскладываются по каталогам в стиле Hive:
+    <out>/<набор>/region=<регион>/item=<item_id>/day=<YYYY-MM-DD>/part-<метка>.<ext>
+Чтение идёт порциями, в памяти одновременно держится одна порция строк и
+один открытый файл раздела.
+"""
+import datetime
+import os
+
+from api import DEFAULT_REGION
+from database import db, HISTORY_DATASETS
+
+FORMATS = {'parquet': '.parquet', 'arrow': '.arrow'}
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("Для выгрузки истории нужен pyarrow: pip install pyarrow")
+    return pyarrow
+
+
+def _schema(pa, dataset):
+    _, time_column, columns = HISTORY_DATASETS[dataset]
+    fields = [pa.field('region', pa.string()), pa.field('item_id', pa.string())]
+    for column in columns:
+        if column == time_column:
+            fields.append(pa.field(column, pa.timestamp('s', tz='UTC')))
+        elif column == 'qlt':
+            fields.append(pa.field(column, pa.int8()))
+        else:
+            fields.append(pa.field(column, pa.int64()))
+    return pa.schema(fields)
+
+
+def _day(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).strftime('%Y-%m-%d')
+
+
+def _safe(value):
+    """Значение для имени каталога раздела"""
+    return ''.join(ch if ch.isalnum() or ch in '-_' else '_' for ch in str(value))
+
+
+class _PartitionWriter:
+    """Один открытый файл раздела (регион, предмет, день)"""
+    def __init__(self, pa, path, schema, fmt):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if fmt == 'parquet':
+            self.writer = pa.parquet.ParquetWriter(path, schema, compression='zstd')
+        else:
+            self.sink = pa.OSFile(path, 'wb')
+            self.writer = pa.ipc.new_file(self.sink, schema, options=pa.ipc.IpcWriteOptions(compression='zstd'))
+        self.fmt = fmt
+
+    def write(self, batch):
+        self.writer.write_batch(batch)
+
+    def close(self):
+        self.writer.close()
+        if self.fmt != 'parquet':
+            self.sink.close()
+
+
+def export_history(out_dir, datasets=('raw', 'hourly', 'daily'), fmt='parquet', since=None, incremental=True,
+                   chunk_rows=50000, log=print):
+    """Выгрузить наборы истории в out_dir.
+
+    При incremental выгружаются только строки, добавленные или изменённые
+    после прошлой выгрузки: метка - номер изменения истории (config
+    export_seq_<набор>), а не время сделки. Так попадают и догруженные
+    старые сделки, и интервалы агрегатов, дополненные свёрткой - такой
+    интервал выгружается заново целиком в новый part-файл, и import_history
+    заменяет им прежнюю версию. since дополнительно ограничивает время строк (метка
+    при этом не сдвигается).
+    Возвращает {набор: число строк}.
+    """
+    pa = _require_pyarrow()
+    if fmt not in FORMATS:
+        raise ValueError(f"Неизвестный формат: {fmt}")
+    # Метка с микросекундами: файлы двух выгрузок в одну секунду не
+    # перезаписывают друг друга, а порядок имён совпадает с порядком выгрузок
+    run_tag = datetime.datetime.now().strftime('%Y%m%dT%H%M%S%f')
+    totals = {}
+
+    for dataset in datasets:
+        _, time_column, columns = HISTORY_DATASETS[dataset]
+        watermark_key = f'export_seq_{dataset}'
+        watermark = None
+        if incremental:
+            stored = db.get_config(watermark_key)
+            watermark = int(stored) if stored else None
+        # Верхняя граница фиксируется до чтения: изменения во время выгрузки
+        # попадут в следующую
+        until_seq = db.history_seq()
+
+        schema = _schema(pa, dataset)
+        time_pos = columns.index(time_column) + 2
+        writer = None
+        current = None
+        count = 0
+
+        partition = lambda row: (row[0], row[1], _day(row[time_pos]))
+        try:
+            for rows in db.iter_history_rows(dataset, since=since, chunk_rows=chunk_rows,
+                                             after_seq=watermark, until_seq=until_seq):
+                # Порция упорядочена по (предмет, время) - строки раздела идут подряд
+                start = 0
+                for i in range(1, len(rows) + 1):
+                    if i < len(rows) and partition(rows[i]) == partition(rows[start]):
+                        continue
+                    key = partition(rows[start])
+                    if key != current:
+                        if writer is not None:
+                            writer.close()
+                        region, item_id, day = key
+                        path = os.path.join(out_dir, dataset, f'region={_safe(region)}', f'item={_safe(item_id)}', f'day={day}',
+                                            f'part-{run_tag}{FORMATS[fmt]}')
+                        writer = _PartitionWriter(pa, path, schema, fmt)
+                        current = key
+                    part = rows[start:i]
+                    writer.write(pa.record_batch([pa.array(values, type=field.type)
+                                                  for values, field in zip(zip(*part), schema)], schema=schema))
+                    count += len(part)
+                    start = i
+        finally:
+            if writer is not None:
+                writer.close()
+
+        # Выгрузка с since пропустила более старые строки - метка не сдвигается
+        if incremental and since is None:
+            db.set_config(watermark_key, until_seq)
+        totals[dataset] = count
+        log(f"{dataset}: выгружено {count} строк")
+    return totals
+
+
+def _iter_files(in_dir):
+    """Файлы выгрузки; в каталоге раздела - от старых part-файлов к новым"""
+    for root, dirs, files in os.walk(in_dir):
+        dirs.sort()
+        for name in sorted(files):
+            ext = os.path.splitext(name)[1]
+            if ext in FORMATS.values():
+                yield os.path.join(root, name), ext
+
+
+def _iter_batches(pa, path, ext, chunk_rows):
+    if ext == '.parquet':
+        yield from pa.parquet.ParquetFile(path).iter_batches(batch_size=chunk_rows)
+    else:
+        with pa.memory_map(path, 'r') as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                yield reader.get_batch(i)
+
+
+def import_history(in_dir, chunk_rows=50000, log=print):
+    """Загрузить все файлы Parquet/Arrow из in_dir (набор определяется по каталогу).
+
+    Интервалы агрегатов из более новых файлов заменяют прежние версии.
+    """
+    pa = _require_pyarrow()
+    totals = {}
+    for path, ext in _iter_files(in_dir):
+        parts = os.path.abspath(path).split(os.sep)
+        dataset = next((p for p in reversed(parts) if p in HISTORY_DATASETS), None)
+        if dataset is None:
+            log(f"Пропущен файл вне каталога набора: {path}")
+            continue
+        _, time_column, columns = HISTORY_DATASETS[dataset]
+        names = ['item_id'] + list(columns)
+        for batch in _iter_batches(pa, path, ext, chunk_rows):
+            # Parquet хранит секундные метки как миллисекунды - привести обратно
+            times = batch.column(time_column).cast(pa.timestamp('s', tz='UTC')).cast(pa.int64())
+            # В выгрузках без региона вся история относится к региону по умолчанию
+            if 'region' in batch.schema.names:
+                regions = batch.column('region').to_pylist()
+            else:
+                regions = [DEFAULT_REGION] * batch.num_rows
+            data = [regions] + [times.to_pylist() if name == time_column else batch.column(name).to_pylist()
+                                for name in names]
+            totals[dataset] = totals.get(dataset, 0) + db.import_history_rows(dataset, zip(*data))
+    for dataset, count in totals.items():
+        log(f"{dataset}: загружено {count} новых или изменённых строк")
+    return totals
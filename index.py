@@ -1,514 +1,387 @@
 import sys
 import os
-import json
-import requests
 import datetime
+import heapq
+import logging
 import time
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QVBoxLayout,
                             QWidget, QLabel, QPushButton, QTableWidget,
                             QTableWidgetItem, QLineEdit, QHBoxLayout,
                             QHeaderView, QMessageBox, QDialog,
-                            QListWidget, QListWidgetItem, QSpinBox, QTextEdit, QAbstractItemView, QComboBox, QMenu, QCheckBox)
-from PyQt5.QtCore import Qt, QTimer, QObject, pyqtSignal, QSettings, QThread, QRunnable, QThreadPool, pyqtSlot
-from PyQt5.QtGui import QColor
-
+                            QListWidget, QAbstractItemView, QComboBox, QMenu, QShortcut)
+from PyQt5.QtCore import Qt, QTimer, pyqtSignal, QSettings, QRunnable, QThreadPool, pyqtSlot
+from PyQt5.QtGui import QColor, QKeySequence
+
+import api
+import catalog
+import profiling
+import scan
+from scan import ScanCancelled
+import database
+import liquidity
+import logs
 from database import db
 
+# Тяжёлые модули (requests, диалоги, JSON каталог) импортируются лениво,
+# чтобы главное окно появлялось как можно быстрее.
+
+# Новый цикл не ставится в очередь, пока предыдущий не выполнил хотя бы
+# половину задач; одновременно выполняется не больше двух циклов
+CYCLE_BACKPRESSURE = 0.5
+MAX_ACTIVE_CYCLES = 2
+# Потоков проверки на регион: регионы опрашиваются параллельно, каждый в
+# пределах своего лимита запросов
+SCAN_THREADS_PER_REGION = 4
+
+# Подогрев истории: не чаще запроса за WARM_TICK_MS, только между циклами
+# и только пока в ведре лимита региона больше половины запаса. История
+# предмета считается свежей WARM_FRESH секунд после загрузки.
+WARM_TICK_MS = 1000
+WARM_FRESH = 1800
+WARM_RESERVE_SHARE = 0.5
+# Недавно открытая история подогревается первой
+RECENTLY_VIEWED = 86400
+
+# Цена старше двух интервалов автообновления показывается серой с возрастом
+STALE_INTERVALS = 2
+AGE_REFRESH_MS = 60000
+
+# Оповещение о лоте дешевле нормы на столько сигм (0 - выключено)
+DEFAULT_ANOMALY_SIGMA = 3
+
+RARITY_NAMES = ["Обычный", "Необычный", "Особый", "Редкий", "Исключительный", "Легендарный"]
+
+RULE_HELP = ("Пусто - стандартные проверки. Пример: unit <= p10(7d) and amount >= 5\n"
+             "Поля: price, unit, amount, qlt, ends_in, position; значения: target, threshold, min,\n"
+             "mean, sigma, median, sold, depth, pN(7d), vwap(7d); операторы: < <= > >= == != in {...} and or not + - * /")
+
 class PageChecker(QRunnable):
-    def __init__(self, row, item_id, token, target_price, offset, enable_stacks, enable_percentage, percentage, parent):
+    """Проверка всех нужных страниц лотов одного предмета.
+
+    Первая страница сообщает общее число лотов (total); остальные страницы
+    запрашиваются параллельно в общем пуле, в пределах лимита запросов.
+    """
+    def __init__(self, cycle, target, parent):
         super().__init__()
-        self.row = row
-        self.item_id = item_id
-        self.token = token
-        self.target_price = target_price
-        self.offset = offset
-        self.enable_stacks = enable_stacks
-        self.enable_percentage = enable_percentage
-        self.percentage = percentage
+        self.cycle = cycle
+        self.target = target
+        self.cancel_token = cycle.row_tokens[target.row_id]
+        self.item_id = target.item_id
+        self.region = target.region
+        self.limiter = cycle.limiters[target.region]
         self.parent = parent
 
-    @pyqtSlot()
-    def run(self):
+    def fetch_page(self, offset):
         try:
-            limit = 200
-            item = self.parent.table.item(self.row, 0)
-            if item is None:
-                return
-            row_data = item.data(Qt.UserRole)
-            rarity = row_data['rarity'] if isinstance(row_data, dict) else 0
+            response = api.executor().get(
+                api.lots_url(self.item_id, offset, region=self.region),
+                headers=api.auth_headers(self.cycle.api_token),
+                endpoint=(self.region, 'lots'), limiter=self.limiter, budget=self.cycle.retry_budget,
+                cancelled=self.cancel_token.is_cancelled,
+                observe=lambda response: self.on_response(offset, response))
+        except api.RequestCancelled:
+            raise ScanCancelled()
+        self.cancel_token.check()
+        with profiling.measure('scan.json'):
+            return response.json()
+
+    def on_response(self, offset, response):
+        """Каждый ответ (и неуспешный) - в архив; о паузе по 429 - в лог раз за цикл"""
+        archive = self.parent.archive
+        if archive is not None:
+            archive.record('lots', self.region, self.item_id, offset, response.status_code, response.content)
+        if response.status_code == 429 and self.cycle.report_once((self.region, 429)):
+            retry_after = response.headers.get('Retry-After', 5)
+            self.parent.error_occurred.emit(f"Лимит запросов ({self.region.upper()}). Пауза {retry_after} сек.")
+
+    def fetch_lots(self, rarity):
+        """Все нужные лоты предмета, упорядоченные по цене выкупа, и признак,
+        что загружены все страницы"""
+        limit = api.LOTS_PAGE_LIMIT
+        data = self.fetch_page(0)
+        lots = data.get('lots', [])
+
+        mode = self.target.mode
+        need_all = mode.enable_stacks or mode.enable_percentage or self.target.rule is not None
+        has_rarity = any(lot.get('buyoutPrice', 0) > 0 and (lot.get('additional') or {}).get('qlt', 0) == rarity
+                         for lot in lots)
+        if len(lots) < limit or (not need_all and has_rarity):
+            return lots, len(lots) < limit
+
+        total = data.get('total')
+        if total is None:
+            # Без total - по одной странице, как раньше
+            pages = [lots]
+            while len(pages[-1]) == limit:
+                pages.append(self.fetch_page(len(pages) * limit).get('lots', []))
+        else:
+            futures = [api.page_executor(self.region).submit(self.fetch_page, offset) for offset in range(limit, total, limit)]
+            pages = [lots] + [future.result().get('lots', []) for future in futures]
 
-            url = f"https://eapi.stalcraft.net/ru/auction/{self.item_id}/lots?sort=buyout_price&order=asc&limit={limit}&offset={self.offset}&additional=true"
-            headers = {"Authorization": f"Bearer {self.token}"}
-            response = requests.get(url, headers=headers, timeout=15)
+        # Страницы отсортированы по цене; слияние сохраняет порядок, даже если
+        # лоты сдвинулись между запросами
+        return list(heapq.merge(*pages, key=lambda lot: lot.get('buyoutPrice', 0))), True
 
-            if response.status_code == 429:
-                retry_after = int(response.headers.get('Retry-After', 5))
-                self.parent.error_occurred.emit(f"Лимит запросов. Пауза {retry_after} сек.")
-                time.sleep(retry_after)
-                response = requests.get(url, headers=headers, timeout=15)
+    @pyqtSlot()
+    def run(self):
+        with profiling.measure('scan.run'):
+            self.check()
 
-            response.raise_for_status()
-            data = response.json()
+    def check(self):
+        import numpy as np
+        import rules
 
-            lots = data.get('lots', [])
+        try:
+            # Задача могла дождаться очереди уже после остановки или удаления строки
+            self.cancel_token.check()
+            rarity = self.target.rarity
+            mode = self.target.mode
+
+            with profiling.measure('scan.fetch'):
+                lots, complete = self.fetch_lots(rarity)
+            batch = rules.LotBatch(lots, now=self.cycle.clock())
+            # Разница с прошлым снимком: появившиеся, проданные и истёкшие лоты
+            with profiling.measure('scan.liquidity'):
+                self.parent.lot_tracker.observe(self.item_id, self.region, batch, complete)
+            self.cancel_token.check()
 
             min_price = None
+            min_unit = None
+            lot_count = 0
             if lots:
-                # First pass: find min_price
+                # First pass: find min_price (и минимум за штуку для сводки)
                 for lot in lots:
                     buyout_price = lot.get('buyoutPrice', 0)
                     if buyout_price > 0:
-                        lot_qlt = lot.get('additional', {}).get('qlt', 0)
+                        lot_qlt = (lot.get('additional') or {}).get('qlt', 0)
                         if lot_qlt == rarity:
+                            lot_count += 1
                             if min_price is None or buyout_price < min_price:
                                 min_price = buyout_price
+                            unit_price = buyout_price // max(lot.get('amount', 1), 1)
+                            if min_unit is None or unit_price < min_unit:
+                                min_unit = unit_price
 
                 # Calculate threshold
-                threshold = self.target_price
-                if self.enable_percentage:
-                    global_min = self.parent.item_mins.get(self.row, None)
-                    if global_min and global_min > 0:
-                        threshold = int(global_min * (1 - self.percentage / 100))
-
-                # Second pass: check for profitable stacks
-                for index, lot in enumerate(lots):
-                    buyout_price = lot.get('buyoutPrice', 0)
-                    lot_qlt = lot.get('additional', {}).get('qlt', 0)
-                    if buyout_price > 0 and lot_qlt == rarity:
-                        amount = lot.get('amount', 1)
-                        if amount > 1 and (self.enable_stacks or self.enable_percentage):
-                            unit_price = buyout_price // amount
-                            if threshold > 0 and unit_price <= threshold:
-                                position = self.offset + index
-                                self.parent.profitable_stack_found.emit(self.item_id, buyout_price, amount, unit_price, position, threshold, lot['startTime'], lot['endTime'], rarity)
+                threshold = self.target.threshold
+                if mode.enable_percentage and min_price:
+                    threshold = int(min_price * (1 - mode.percentage / 100))
+
+                # Second pass: правило строки (или стандартный поиск стаков)
+                # вычисляется сразу над всеми лотами
+                rule = self.target.rule
+                if rule is None and (mode.enable_stacks or mode.enable_percentage):
+                    rule = rules.compile_rule(rules.STACK_RULE)
+                price_stats = None
+                if mode.anomaly_sigma or (rule is not None and rule.uses_stats):
+                    price_stats = db.get_price_stats(self.item_id, self.region).get(rarity)
+                if rule is not None:
+                    values = {'target': self.target.threshold, 'threshold': threshold,
+                              'min': min_price if min_price is not None else float('nan')}
+                    values.update(rules.stats_values(price_stats))
+                    if rule.uses_flow:
+                        flow = db.get_lot_flow(self.item_id, int(batch.now) - database.DAY, self.region).get(rarity)
+                        values.update(liquidity.flow_values(flow))
+                    values.update(rules.history_values(rule, self.item_id, rarity, self.region, db, batch.now))
+                    prices = batch.column('price')
+                    amounts = batch.column('amount')
+                    units = batch.column('unit')
+                    qlts = batch.column('qlt')
+                    with profiling.measure('scan.rules'):
+                        positions = rule.matches(batch, rarity, values).tolist()
+                    for position in positions:
+                        lot = lots[position]
+                        self.cancel_token.check()
+                        self.parent.profitable_stack_found.emit(self.item_id, int(prices[position]), int(amounts[position]), int(units[position]), position, threshold, lot['startTime'], lot['endTime'], int(qlts[position]), self.region)
+
+                # Самый дешёвый за штуку лот сравнивается с нормой из статистики
+                # сделок - O(1) на лот, без чтения истории
+                if mode.anomaly_sigma and price_stats is not None and min_price is not None:
+                    candidates = np.flatnonzero((batch.column('price') > 0) & (batch.column('qlt') == rarity))
+                    position = int(candidates[np.argmin(batch.column('unit')[candidates])])
+                    unit_price = int(batch.column('unit')[position])
+                    z = price_stats.zscore(unit_price)
+                    if z <= -mode.anomaly_sigma:
+                        lot = lots[position]
+                        self.cancel_token.check()
+                        self.parent.price_anomaly_found.emit(self.item_id, int(batch.column('price')[position]), int(batch.column('amount')[position]), unit_price, position, int(price_stats.ewma), z, lot['startTime'], rarity, self.region)
 
             if min_price is not None:
-                self.parent.found_min.emit(self.row, min_price)
-
-            if len(lots) == limit and ((self.enable_stacks or self.enable_percentage) or min_price is None):
-                self.parent.next_page.emit(self.row, self.item_id, self.token, self.target_price, self.offset + limit, self.enable_percentage, self.percentage)
+                self.cancel_token.check()
+                self.cycle.mins.offer(self.target.row_id, min_price, lot_count, min_unit)
 
-        except requests.exceptions.RequestException as e:
-            self.parent.error_occurred.emit(f"Ошибка сети для {self.item_id}: {str(e)}")
+        except ScanCancelled:
+            pass
+        except api.ApiError as e:
+            # Разомкнутая цепь и исчерпанный бюджет касаются всех строк региона
+            if e.kind not in (api.CIRCUIT_OPEN, api.BUDGET):
+                self.parent.error_occurred.emit(f"Ошибка сети для {self.item_id} ({self.region.upper()}): {str(e)}")
+            elif self.cycle.report_once((self.region, e.kind)):
+                self.parent.error_occurred.emit(f"Проверка {self.region.upper()} пропущена: {str(e)}")
         except Exception as e:
-            self.parent.error_occurred.emit(f"Ошибка для {self.item_id}: {str(e)}")
+            self.parent.error_occurred.emit(f"Ошибка для {self.item_id} ({self.region.upper()}): {str(e)}")
         finally:
-            self.parent.request_finished.emit()
+            self.parent.request_finished.emit(self.cycle)
+
 
 
-class HistoryLoader(QRunnable):
-    def __init__(self, item_id, offset, limit, price_tracker, history_dialog):
+class StartupLoader(QRunnable):
+    """Фоновая загрузка базы и каталога после показа главного окна"""
+    def __init__(self, parent):
         super().__init__()
-        self.item_id = item_id
-        self.offset = offset
-        self.limit = limit
-        self.price_tracker = price_tracker
-        self.history_dialog = history_dialog
+        self.parent = parent
 
     @pyqtSlot()
     def run(self):
-        history = self.price_tracker.fetch_history_page(self.item_id, self.offset, self.limit)
-        self.history_dialog.history_loaded.emit(history, self.offset, self.limit)
-
-class HistoryDialog(QDialog):
-    history_loaded = pyqtSignal(list, int, int)  # history, offset, limit
-
-    def __init__(self, item_id, name, parent):
-        super().__init__(parent)
-        self.item_id = item_id
-        self.name = name
-        self.price_tracker = parent
-        self.offset = 0
-        self.limit = 200
-        self.loading = False
-        self.all_history = []
-        self.current_filter = 0  # 0 - все, 1-7 - редкости
-
-        self.setWindowTitle(f"История цен: {name}")
-        self.resize(800, 600)
-        self.setMinimumSize(600, 400)
-
-        layout = QVBoxLayout()
-
-        # Фильтр по редкости
-        self.rarity_filter = QComboBox()
-        self.rarity_filter.addItems(["Все", "Обычный", "Необычный", "Особый", "Редкий", "Исключительный", "Легендарный"])
-        self.rarity_filter.currentIndexChanged.connect(self.on_filter_changed)
-        layout.addWidget(self.rarity_filter)
-
-        self.table = QTableWidget()
-        self.table.setColumnCount(5)
-        self.table.setHorizontalHeaderLabels(["Время", "Цена", "Количество", "Цена за шт.", "Редкость"])
-        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
-        self.table.setAlternatingRowColors(True)
-        self.table.verticalScrollBar().valueChanged.connect(self.on_scroll)
-
-        layout.addWidget(self.table)
-
-        self.info_label = QLabel("Загрузка...")
-        layout.addWidget(self.info_label)
-
-        btn_close = QPushButton("Закрыть")
-        btn_close.clicked.connect(self.accept)
-        layout.addWidget(btn_close)
-
-        self.setLayout(layout)
-
-        self.history_loaded.connect(self.on_history_loaded)
-
-        # Первоначальная загрузка в фоне
-        loader = HistoryLoader(self.item_id, self.offset, self.limit, self.price_tracker, self)
-        QThreadPool.globalInstance().start(loader)
-
-    def on_filter_changed(self, index):
-        self.current_filter = index
-        self.apply_filter()
-
-    def apply_filter(self):
-        self.table.setRowCount(0)
-        filtered_history = []
-        if self.current_filter == 0:  # Все
-            filtered_history = self.all_history
-        else:
-            filter_qlt = self.current_filter - 1  # 0 - обычный, etc.
-            filtered_history = [h for h in self.all_history if h.get('additional', {}).get('qlt', 0) == filter_qlt]
-
-        for price_data in filtered_history[-self.limit:]:  # Показать последние limit записей
-            row = self.table.rowCount()
-            self.table.insertRow(row)
-            time_val = price_data['time']
-            if isinstance(time_val, str):
-                try:
-                    dt = datetime.datetime.fromisoformat(time_val.replace('Z', '+00:00'))
-                    time_val = dt.timestamp()
-                except:
-                    time_val = 0
-            dt = datetime.datetime.fromtimestamp(time_val)
-            time_str = dt.strftime("%Y-%m-%d %H:%M:%S")
-            self.table.setItem(row, 0, QTableWidgetItem(time_str))
-            self.table.setItem(row, 1, QTableWidgetItem(self.price_tracker.format_price(str(price_data['price']))))
-            self.table.setItem(row, 2, QTableWidgetItem(str(price_data['amount'])))
-
-            # Цена за шт.
-            unit_price = price_data['price'] // price_data['amount'] if price_data['amount'] > 1 else price_data['price']
-            self.table.setItem(row, 3, QTableWidgetItem(self.price_tracker.format_price(str(unit_price))))
-
-            # Редкость
-            rarity_names = ["Обычный", "Необычный", "Особый", "Редкий", "Исключительный", "Легендарный"]
-            qlt = price_data.get('additional', {}).get('qlt', 0)
-            rarity_name = rarity_names[qlt] if qlt < len(rarity_names) else f"qlt={qlt}"
-            self.table.setItem(row, 4, QTableWidgetItem(rarity_name))
-
-        self.info_label.setText(f"Показаны последние {len(filtered_history[-self.limit:])} записей (фильтр: {self.rarity_filter.currentText()})")
-
-    def load_more_history(self):
-        if self.loading:
-            return
-        self.loading = True
-        loader = HistoryLoader(self.item_id, self.offset, self.limit, self.price_tracker, self)
-        QThreadPool.globalInstance().start(loader)
-
-    def on_history_loaded(self, history, offset, limit):
-        # Сортировка по времени: новые сверху
-        history = sorted(history, key=lambda x: x['time'], reverse=True)
-        self.all_history.extend(history)
-        if offset == 0:
-            self.table.setRowCount(0)
-        for price_data in history:
-            row = self.table.rowCount()
-            self.table.insertRow(row)
-            time_val = price_data['time']
-            if isinstance(time_val, str):
-                try:
-                    dt = datetime.datetime.fromisoformat(time_val.replace('Z', '+00:00'))
-                    time_val = dt.timestamp()
-                except:
-                    time_val = 0
-            dt = datetime.datetime.fromtimestamp(time_val)
-            time_str = dt.strftime("%Y-%m-%d %H:%M:%S")
-            self.table.setItem(row, 0, QTableWidgetItem(time_str))
-            self.table.setItem(row, 1, QTableWidgetItem(self.price_tracker.format_price(str(price_data['price']))))
-            self.table.setItem(row, 2, QTableWidgetItem(str(price_data['amount'])))
-
-            # Цена за шт.
-            unit_price = price_data['price'] // price_data['amount'] if price_data['amount'] > 1 else price_data['price']
-            self.table.setItem(row, 3, QTableWidgetItem(self.price_tracker.format_price(str(unit_price))))
-
-            # Редкость
-            rarity_names = ["Обычный", "Необычный", "Особый", "Редкий", "Исключительный", "Легендарный"]
-            qlt = price_data.get('additional', {}).get('qlt', 0)
-            rarity_name = rarity_names[qlt] if qlt < len(rarity_names) else f"qlt={qlt}"
-            self.table.setItem(row, 4, QTableWidgetItem(rarity_name))
-
-        self.offset += len(history)
-        if len(history) < limit:
-            self.info_label.setText(f"Всего записей: {self.table.rowCount()} (конец)")
-        else:
-            self.info_label.setText(f"Всего записей: {self.table.rowCount()} (прокрутите вниз для загрузки ещё)")
-        self.loading = False
-
-        # Если фильтр активен, обновить таблицу
-        if self.current_filter != 0:
-            self.apply_filter()
-
-    def on_scroll(self, value):
-        if not self.loading and value == self.table.verticalScrollBar().maximum():
-            self.load_more_history()
-
-
-
-
-
-class SettingsDialog(QDialog):
-    update_db_requested = pyqtSignal()
-
-    def __init__(self, current_interval, enable_stacks, enable_percentage, percentage, parent=None):
-        super().__init__(parent)
-        self.setWindowTitle("Настройки")
-        self.setFixedSize(350, 300)
-
-        layout = QVBoxLayout()
-
-        # --- Interval Section ---
-        layout.addWidget(QLabel("Интервал запросов к серверу:"))
-        self.interval_spin = QSpinBox()
-        self.interval_spin.setRange(10, 3600)
-        self.interval_spin.setSuffix(" секунд")
-        self.interval_spin.setValue(current_interval)
-        layout.addWidget(self.interval_spin)
-
-        layout.addSpacing(10)
-
-        # --- Stack Search Section ---
-        self.stacks_checkbox = QCheckBox("Включить поиск выгодных стаков")
-        self.stacks_checkbox.setChecked(enable_stacks)
-        self.stacks_checkbox.stateChanged.connect(self.toggle_percentage_enabled)
-        layout.addWidget(self.stacks_checkbox)
-
-        layout.addSpacing(10)
-
-        # --- Percentage Search Section ---
-        self.percentage_checkbox = QCheckBox("Включить поиск по процентам ниже рыночной цены")
-        self.percentage_checkbox.setChecked(enable_percentage)
-        self.percentage_checkbox.stateChanged.connect(self.toggle_percentage_spin)
-        layout.addWidget(self.percentage_checkbox)
-
-        self.percentage_label = QLabel("Процент ниже рыночной цены:")
-        layout.addWidget(self.percentage_label)
-        self.percentage_spin = QSpinBox()
-        self.percentage_spin.setRange(1, 99)
-        self.percentage_spin.setSuffix(" %")
-        self.percentage_spin.setValue(percentage)
-        layout.addWidget(self.percentage_spin)
-
-        self.toggle_percentage_enabled()
-
-        layout.addSpacing(10)
-
-        # --- Database Update Section ---
-        layout.addWidget(QLabel("База данных предметов:"))
-        self.update_db_btn = QPushButton("Обновить базу предметов")
-        self.update_db_btn.clicked.connect(self.update_db_requested.emit)
-        layout.addWidget(self.update_db_btn)
-
-        layout.addStretch()
-
-        # --- Buttons ---
-        btn_layout = QHBoxLayout()
-        self.save_btn = QPushButton("Сохранить")
-        self.save_btn.clicked.connect(self.accept)
-        self.cancel_btn = QPushButton("Отмена")
-        self.cancel_btn.clicked.connect(self.reject)
-
-        btn_layout.addWidget(self.save_btn)
-        btn_layout.addWidget(self.cancel_btn)
-        layout.addLayout(btn_layout)
-
-        self.setLayout(layout)
-
-    def toggle_percentage_spin(self):
-        enabled = self.percentage_checkbox.isChecked()
-        self.percentage_label.setEnabled(enabled)
-        self.percentage_spin.setEnabled(enabled)
-
-    def toggle_percentage_enabled(self):
-        stacks_enabled = self.stacks_checkbox.isChecked()
-        self.percentage_checkbox.setEnabled(stacks_enabled)
-        if not stacks_enabled:
-            self.percentage_checkbox.setChecked(False)
-        self.toggle_percentage_spin()
-
-class QuickHUD(QDialog):
-    def __init__(self, name, rarity, buyout_price, unit_price, page, parent=None):
-        super().__init__(parent)
-        self.setWindowFlags(Qt.FramelessWindowHint | Qt.WindowStaysOnTopHint | Qt.Tool)
-        self.setAttribute(Qt.WA_TranslucentBackground)
-        self.setAttribute(Qt.WA_ShowWithoutActivating)
-
-        layout = QVBoxLayout()
-        layout.setContentsMargins(10, 10, 10, 10)
-
-        self.label = QLabel()
-        self.label.setStyleSheet("color: red; font-size: 14px; font-weight: bold;")
-        if page > 0:
-            text = f"{name}\nРедкость: {rarity}\nЦена за стак: {buyout_price}\nЦена за шт.: {unit_price}\nСтраница: {page}"
-        else:
-            text = f"{name}\nРедкость: {rarity}\nЦена: {buyout_price}"
-        self.label.setText(text)
-        layout.addWidget(self.label)
-
-        self.setLayout(layout)
-
-        # Позиционирование в правом верхнем углу
-        screen = QApplication.primaryScreen().geometry()
-        self.move(screen.width() - self.sizeHint().width() - 10, 10)
-
-        # Таймер на исчезновение через 30 секунд
-        QTimer.singleShot(30000, self.close)
-
-    def closeEvent(self, event):
-        if self.parent():
-            self.parent().current_hud = None
-        super().closeEvent(event)
-
-class ItemSearchDialog(QDialog):
-    def __init__(self, items_data, parent=None):
-        super().__init__(parent)
-        self.setWindowTitle("Поиск предмета")
-        self.setFixedSize(400, 400)
-
-        self.items_data = items_data
-        self.selected_item = None
-
-        layout = QVBoxLayout()
-
-        self.search_input = QLineEdit()
-        self.search_input.setPlaceholderText("Введите название предмета...")
-        self.search_input.textChanged.connect(self.update_search_results)
-
-        self.results_list = QListWidget()
-        self.results_list.itemDoubleClicked.connect(self.select_item)
-
-        self.select_btn = QPushButton("Выбрать")
-        self.select_btn.clicked.connect(self.accept_selection)
-
-        layout.addWidget(self.search_input)
-        layout.addWidget(self.results_list)
-        layout.addWidget(self.select_btn)
-
-        self.setLayout(layout)
+        try:
+            db.init_db()
+            self.parent.startup_db_loaded.emit({
+                'config': db.get_all_config(),
+                'tracked': db.get_tracked_items(),
+                'latest': db.get_latest_prices(),
+            })
+        except Exception as e:
+            self.parent.log_message(f"Ошибка загрузки базы данных: {str(e)}")
 
-        self.all_items = []
-        for item in self.items_data:
+        items = self.parent.load_item_data()
+        if not items:
+            self.parent.log_message("Синхронизация базы данных предметов (listing.json)...")
             try:
-                name_ru = item['name']['lines']['ru']
-                self.all_items.append((name_ru, item))
-            except (KeyError, TypeError):
-                continue
-
-    def update_search_results(self, text):
-        self.results_list.clear()
-        text = text.lower()
-        if not text: return
-
-        for name_ru, item in self.all_items:
-            if text in name_ru.lower():
-                self.results_list.addItem(name_ru)
+                items = catalog.Catalog.from_items(catalog.download_listing(self.parent.LISTING_FILE, self.parent.base_dir),
+                                                   self.parent.LISTING_FILE)
+                self.parent.log_message("База данных предметов успешно обновлена")
+            except Exception as e:
+                self.parent.log_message(f"Ошибка обновления базы: {str(e)}")
+                items = catalog.Catalog()
+        self.parent.catalog_loaded.emit(items)
 
-    def select_item(self, item):
-        self.selected_item = None
-        for name_ru, item_data in self.all_items:
-            if name_ru == item.text():
-                self.selected_item = item_data
-                break
-        self.accept()
+        try:
+            self.parent.compact_history()
+        except Exception as e:
+            self.parent.log_message(f"Ошибка свёртки истории: {str(e)}")
 
-    def accept_selection(self):
-        current_item = self.results_list.currentItem()
-        if current_item:
-            self.select_item(current_item)
 
+class BackgroundTask(QRunnable):
+    """Выполнить функцию в пуле потоков, ошибки - в лог"""
+    def __init__(self, parent, func, *args):
+        super().__init__()
+        self.parent = parent
+        self.func = func
+        self.args = args
 
+    @pyqtSlot()
+    def run(self):
+        try:
+            self.func(*self.args)
+        except Exception as e:
+            self.parent.error_occurred.emit(f"{getattr(self.func, '__name__', 'task')}: {str(e)}")
 
 class PriceTracker(QMainWindow):
-    price_checked = pyqtSignal(int, str)
-    profitable_stack_found = pyqtSignal(str, int, int, int, int, int, str, str, int)  # item_id, buyout_price, amount, unit_price, position, target_price, startTime, endTime, rarity
-    next_page = pyqtSignal(int, str, str, int, int, bool, int)  # row, item_id, token, target_price, offset, enable_percentage, percentage
-    found_min = pyqtSignal(int, int)  # row, price
+    price_checked = pyqtSignal(int, object)  # row, min_price
+    profitable_stack_found = pyqtSignal(str, int, int, int, int, int, str, str, int, str)  # item_id, buyout_price, amount, unit_price, position, target_price, startTime, endTime, rarity, region
+    price_anomaly_found = pyqtSignal(str, int, int, int, int, int, float, str, int, str)  # item_id, buyout_price, amount, unit_price, position, normal_price, zscore, startTime, rarity, region
     error_occurred = pyqtSignal(str)
-    request_finished = pyqtSignal()
-    log_message_signal = pyqtSignal(str)
+    request_finished = pyqtSignal(object)  # cycle
+    log_message_signal = pyqtSignal(object)  # logs.LogEntry
+    startup_db_loaded = pyqtSignal(object)  # {'config': dict, 'tracked': list, 'latest': dict}
+    catalog_loaded = pyqtSignal(object)  # catalog.Catalog
+    history_warmed = pyqtSignal(object, bool)  # (item_id, region), страница загружена
 
-    def __init__(self):
+    def __init__(self, base_dir=None):
         super().__init__()
 
-        if getattr(sys, 'frozen', False):
+        # base_dir - каталог listing.json и лога (замеры передают временный)
+        if base_dir is not None:
+            self.base_dir = base_dir
+        elif getattr(sys, 'frozen', False):
             self.base_dir = os.path.dirname(sys.executable)
         else:
             self.base_dir = os.path.dirname(os.path.abspath(__file__))
 
         self.LISTING_FILE = os.path.join(self.base_dir, "listing.json")
-        self.LOG_FILE = os.path.join(self.base_dir, "price_tracker.log")
+        self.LOG_FILE = os.path.join(self.base_dir, logs.FILE_NAME)
 
-        # Очистка лога при запуске
-        with open(self.LOG_FILE, 'w', encoding='utf-8') as f:
-            f.write("")
+        # Лог прошлых запусков сохраняется: файл дописывается и ротируется
+        self.file_log = logs.FileLog(self.LOG_FILE)
 
         self.request_interval = 60
         self.enable_stacks = True
         self.enable_percentage = False
         self.percentage = 10
-        self.running_requests = 0
-        self.item_mins = {}
+        self.anomaly_sigma = DEFAULT_ANOMALY_SIGMA
+        self.raw_history_days = database.DEFAULT_RAW_DAYS
+        self.hourly_history_days = database.DEFAULT_HOURLY_DAYS
+        self.scan_rate = api.DEFAULT_SCAN_RATE
+        self.local_api_port = 0
+        self.archive_max_mb = 0
+        self.archive = None  # archive.ResponseArchive, пока архив включён
+        self.local_api = None  # local_api.LocalApiServer
+        self.api_state = None  # local_api.ApiState, пока API включён
+        # Профилирование: сколько ещё циклов снимать и какие циклы уже сняты
+        self.profiler = None  # profiling.SamplingProfiler, пока идёт снятие
+        self.profile_remaining = 0
+        self.profiled_cycles = set()
+        self.profile_interval = profiling.DEFAULT_INTERVAL
+        self.profile_dir = os.path.join(self.base_dir, profiling.DIRECTORY)
+        self.diagnostics_dialog = None
+        self.scan_limiters = {}  # регион -> RateLimiter, у каждого региона свой лимит
+        self.scan_pool = QThreadPool(self)
+        self.cycles = []  # незавершённые циклы проверки (не больше MAX_ACTIVE_CYCLES)
+        # Последние известные цены: (row_id, редкость) -> (мин. цена, лотов, время проверки)
+        self.latest = {}
         self.shown_stacks = set()
+        # Снимки лотов между циклами для оценки продаж (liquidity)
+        self.lot_tracker = liquidity.LotTracker()
         self.current_hud = None
         self.timer = QTimer()
         self.timer.timeout.connect(self.start_price_check)
+        # Фоновый подогрев истории отслеживаемых предметов
+        self.warmed = {}  # (item_id, регион) -> время последней попытки подогрева
+        self.warm_loaded = {}  # (item_id, регион) -> время последней удачной загрузки
+        self.viewed = {}  # (item_id, регион) -> время открытия истории
+        self.warming = False
+        self.history_warmed.connect(self.on_history_warmed)
+        self.warm_timer = QTimer()
+        self.warm_timer.timeout.connect(self.warm_history_tick)
+        self.warm_timer.start(WARM_TICK_MS)
+        # Возраст устаревших цен в таблице
+        self.age_timer = QTimer()
+        self.age_timer.timeout.connect(self.refresh_price_cells)
+        self.age_timer.start(AGE_REFRESH_MS)
 
         # Связи
         self.price_checked.connect(self.update_item_price)
         self.profitable_stack_found.connect(self.on_profitable_stack)
-        self.next_page.connect(self.launch_next_page)
-        self.found_min.connect(self.update_min)
+        self.price_anomaly_found.connect(self.on_price_anomaly)
         self.error_occurred.connect(self.log_error)
         self.request_finished.connect(self.on_request_finished)
         self.log_message_signal.connect(self.do_log_message)
+        QShortcut(QKeySequence("F12"), self, self.show_diagnostics)
 
         self.setWindowTitle("Stalcraft Price Tracker")
         self.setMinimumSize(1000, 700)
 
         self.init_ui()
 
-        # Первоначальная проверка файлов
-        self.ensure_files_exist()
-        self.items_data = self.load_item_data()
-        if not self.items_data:
-            self.download_listing_file(silent=True)
-            self.items_data = self.load_item_data()
-
-        self.table.blockSignals(True)
-        self.load_settings()
-        self.load_tracked_items_from_db()
-        self.load_target_prices()
-        self.table.blockSignals(False)
+        # Каталог и база загружаются в фоне после первой отрисовки окна
+        # Общий для всех окон компактный каталог (catalog.Catalog)
+        self.catalog = catalog.Catalog()
+        self.startup_db_loaded.connect(self.on_startup_db_loaded)
+        self.catalog_loaded.connect(self.on_catalog_loaded)
+        QTimer.singleShot(0, self.start_background_init)
 
         self.log_message("Приложение запущено")
     
-    def log_message(self, message):
-        self.log_message_signal.emit(message)
+    def log_message(self, message, level=None, item_id=None):
+        """Из любого потока: файл пишется через очередь, окно получает запись сигналом"""
+        if level is None:
+            level = logs.guess_level(message)
+        self.file_log.write(level, message)
+        self.log_message_signal.emit(logs.LogEntry(time.time(), level, item_id, message))
 
-    def do_log_message(self, message):
-        timestamp = datetime.datetime.now().strftime("%H:%M:%S")
-        log_entry = f"[{timestamp}] {message}"
-
-        try:
-            with open(self.LOG_FILE, 'a', encoding='utf-8') as f:
-                f.write(log_entry + '\n')
-        except:
-            pass
-
-        self.log_output.append(log_entry)
-        self.log_output.verticalScrollBar().setValue(self.log_output.verticalScrollBar().maximum())
+    @profiling.timed('gui.log_message')
+    def do_log_message(self, entry):
+        self.log_view.append(entry)
 
     def add_notification(self, message):
         """Добавить уведомление в список"""
@@ -532,89 +405,41 @@ class PriceTracker(QMainWindow):
         except (ValueError, TypeError):
             return str(price_str)
     
-    def ensure_files_exist(self):
-        if not os.path.exists(self.LISTING_FILE) or os.path.getsize(self.LISTING_FILE) < 10:
-            self.download_listing_file()
+    def start_background_init(self):
+        QThreadPool.globalInstance().start(StartupLoader(self))
 
-    def merge_uniq_into_listing(self, listing_data):
-        """Объединяет данные из uniq.json в listing_data"""
-        uniq_file = os.path.join(self.base_dir, "uniq.json")
-        if not os.path.exists(uniq_file):
-            return listing_data
+    def on_startup_db_loaded(self, data):
+        self.table.blockSignals(True)
+        self.load_settings(data['config'])
+        self.latest = data['latest']
+        self.load_tracked_items_from_db(data['tracked'])
+        self.load_target_prices(data['tracked'])
+        self.table.blockSignals(False)
+        self.refresh_price_cells()
+        self.restart_local_api()
+        self.restart_archive()
 
-        try:
-            with open(uniq_file, 'r', encoding='utf-8') as f:
-                uniq_data = json.load(f)
-        except Exception:
-            return listing_data
-
-        # Создаем словарь listing по id для быстрого доступа
-        listing_dict = {item['id']: item for item in listing_data}
-
-        # Проходим по uniq и обновляем listing
-        for uniq_item in uniq_data:
-            item_id = uniq_item['itemId']
-            if item_id in listing_dict:
-                # Обновляем существующий элемент
-                existing = listing_dict[item_id]
-                # Добавляем новые поля из uniq, кроме id, itemId, name, color
-                for key, value in uniq_item.items():
-                    if key not in ['id', 'itemId', 'name', 'color']:
-                        existing[key] = value
-            else:
-                # Создаем новый элемент на основе uniq
-                new_item = {
-                    'id': item_id,
-                    'name': {
-                        'lines': {
-                            'ru': uniq_item['name']
-                        }
-                    },
-                    'color': uniq_item.get('color', 'DEFAULT'),
-                    'status': {
-                        'state': 'NON_DROP'  # По умолчанию, как в примере
-                    }
-                }
-                # Добавляем остальные поля
-                for key, value in uniq_item.items():
-                    if key not in ['id', 'itemId', 'name', 'color']:
-                        new_item[key] = value
-                listing_data.append(new_item)
-
-        return listing_data
+    def on_catalog_loaded(self, items):
+        self.catalog = items
+        # Строки могли быть добавлены до загрузки каталога - обновить названия
+        self.table.blockSignals(True)
+        for row in range(self.table.rowCount()):
+            item = self.table.item(row, 0)
+            if item:
+                row_data = item.data(Qt.UserRole)
+                if isinstance(row_data, dict):
+                    item.setText(self.find_item_name(row_data['item_id']))
+        self.table.blockSignals(False)
 
     def download_listing_file(self, silent=False):
-        url = "https://raw.githubusercontent.com/EXBO-Studio/stalcraft-database/refs/heads/main/ru/listing.json"
         if not silent:
             self.log_message("Синхронизация базы данных предметов (listing.json)...")
 
         QApplication.setOverrideCursor(Qt.WaitCursor)
 
         try:
-            response = requests.get(url, timeout=30)
-            response.raise_for_status()
-
-            data = response.json()
-            if not isinstance(data, list):
-                raise ValueError("Некорректный формат данных")
-
-            # Конвертируем данные: удаляем 'data' и 'icon', добавляем 'id'
-            for item in data:
-                if 'data' in item:
-                    basename = os.path.basename(item['data'])
-                    item_id = os.path.splitext(basename)[0]
-                    item['id'] = item_id
-                    del item['data']
-                if 'icon' in item:
-                    del item['icon']
-
-            # Объединяем с uniq.json
-            data = self.merge_uniq_into_listing(data)
-
-            with open(self.LISTING_FILE, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=4)
-
-            self.items_data = data
+            data = catalog.download_listing(self.LISTING_FILE, self.base_dir)
+            self.on_catalog_loaded(catalog.Catalog.from_items(data, self.LISTING_FILE))
 
             if not silent:
                 self.log_message("База данных предметов успешно обновлена")
@@ -630,22 +455,10 @@ class PriceTracker(QMainWindow):
 
     def load_item_data(self):
         try:
-            if os.path.exists(self.LISTING_FILE):
-                with open(self.LISTING_FILE, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    if isinstance(data, list):
-                        # Проверить, нужно ли объединить с uniq.json
-                        uniq_file = os.path.join(self.base_dir, "uniq.json")
-                        if os.path.exists(uniq_file):
-                            data = self.merge_uniq_into_listing(data)
-                            # Сохранить объединенный файл
-                            with open(self.LISTING_FILE, 'w', encoding='utf-8') as fw:
-                                json.dump(data, fw, ensure_ascii=False, indent=4)
-                        return data
-            return []
+            return catalog.load_catalog(self.LISTING_FILE, self.base_dir)
         except Exception as e:
             self.log_message(f"Ошибка чтения listing.json: {str(e)}")
-            return []
+            return catalog.Catalog()
     
     def init_ui(self):
         central_widget = QWidget()
@@ -678,22 +491,44 @@ class PriceTracker(QMainWindow):
         self.btn_history = QPushButton("История цен")
         self.btn_history.clicked.connect(self.show_history)
 
+        self.btn_screener = QPushButton("Скринер")
+        self.btn_screener.clicked.connect(self.show_screener)
+
+        self.btn_dashboard = QPushButton("Категории")
+        self.btn_dashboard.setToolTip("Сравнить предметы категории по минимальной цене и сделкам за сутки")
+        self.btn_dashboard.clicked.connect(self.show_dashboard)
+
+        self.btn_import = QPushButton("Импорт")
+        self.btn_import.setToolTip("Загрузить список отслеживаемых предметов из CSV или JSON")
+        self.btn_import.clicked.connect(self.import_watchlist)
+
+        self.btn_export = QPushButton("Экспорт")
+        self.btn_export.setToolTip("Сохранить список отслеживаемых предметов в CSV или JSON")
+        self.btn_export.clicked.connect(self.export_watchlist)
+
         self.btn_start = QPushButton("Автообновление")
         self.btn_start.clicked.connect(self.toggle_auto_update)
 
         btn_layout.addWidget(self.btn_add)
         btn_layout.addWidget(self.btn_remove)
         btn_layout.addWidget(self.btn_history)
+        btn_layout.addWidget(self.btn_screener)
+        btn_layout.addWidget(self.btn_dashboard)
+        btn_layout.addWidget(self.btn_import)
+        btn_layout.addWidget(self.btn_export)
         btn_layout.addWidget(self.btn_start)
 
         # --- Middle Area ---
         self.table = QTableWidget()
-        self.table.setColumnCount(4)
-        self.table.setHorizontalHeaderLabels(["Название", "Цена", "Моя цена", "Редкость"])
+        self.table.setColumnCount(6)
+        self.table.setHorizontalHeaderLabels(["Название", "Цена", "Моя цена", "Редкость", "Регион", "Правило"])
         self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
         self.table.verticalHeader().setVisible(False)  # Скрыть нумерацию строк
         self.table.setEditTriggers(QAbstractItemView.DoubleClicked)  # Разрешить редактирование двойным кликом
         self.table.cellChanged.connect(self.on_cell_changed)
+        # Стиль списков в ячейках задаётся один раз для всей таблицы: свой
+        # стиль у каждого виджета заметно замедляет добавление сотен строк
+        self.table.setStyleSheet("QComboBox { background-color: white; }")
 
         # Уведомления
         self.notifications_list = QListWidget()
@@ -715,17 +550,14 @@ class PriceTracker(QMainWindow):
         right_layout.addWidget(clear_notifications_btn)
         central_layout.addLayout(right_layout, 1)
 
-        self.log_output = QTextEdit()
-        self.log_output.setReadOnly(True)
-        self.log_output.setMaximumHeight(150)
+        self.log_view = logs.LogView()
 
         main_layout.addLayout(top_layout)
         main_layout.addLayout(btn_layout)
         main_layout.addWidget(QLabel("Отслеживаемые предметы:"))
         main_layout.addLayout(central_layout)
 
-        main_layout.addWidget(QLabel("Лог:"))
-        main_layout.addWidget(self.log_output)
+        main_layout.addWidget(self.log_view)
         
         central_widget.setLayout(main_layout)
         
@@ -734,6 +566,8 @@ class PriceTracker(QMainWindow):
             self.restoreGeometry(settings.value("geometry"))
     
     def on_cell_changed(self, row, column):
+        if column == 5:  # Столбец "Правило"
+            self.on_rule_changed(row)
         if column == 2:  # Столбец "Моя цена"
             item = self.table.item(row, column)
             id_item = self.table.item(row, 0)
@@ -742,6 +576,8 @@ class PriceTracker(QMainWindow):
                 if isinstance(row_data, dict):
                     row_id = row_data['id']
                     raw_price = ''.join(filter(str.isdigit, item.text()))
+                    row_data['target_price'] = int(raw_price) if raw_price else 0
+                    id_item.setData(Qt.UserRole, row_data)
 
                     if raw_price:
                         self.save_target_price(row_id, raw_price)
@@ -755,26 +591,57 @@ class PriceTracker(QMainWindow):
                         item.setText("")
                         self.table.blockSignals(False)
     
+    def on_rule_changed(self, row):
+        import rules
+
+        item = self.table.item(row, 5)
+        id_item = self.table.item(row, 0)
+        if not item or not id_item:
+            return
+        row_data = id_item.data(Qt.UserRole)
+        if not isinstance(row_data, dict):
+            return
+        text = item.text().strip()
+        if text:
+            try:
+                rules.compile_rule(text)
+            except rules.RuleError as e:
+                self.log_message(f"Ошибка в правиле для {self.find_item_name(row_data['item_id'])}: {str(e)}",
+                                 item_id=row_data['item_id'])
+                self.table.blockSignals(True)
+                item.setText(row_data['rule'] or "")
+                self.table.blockSignals(False)
+                return
+        row_data['rule'] = text or None
+        id_item.setData(Qt.UserRole, row_data)
+        try:
+            db.update_alert_rule(row_data['id'], row_data['rule'])
+        except Exception as e:
+            self.log_message(f"Ошибка сохранения правила: {str(e)}")
+
     def save_target_price(self, row_id, price):
         try:
             db.update_target_price(row_id, int(price))
         except Exception as e:
             self.log_message(f"Ошибка сохранения целевой цены: {str(e)}")
 
-    def load_tracked_items_from_db(self):
+    def load_tracked_items_from_db(self, tracked_items):
         """Загрузить список отслеживаемых предметов из базы данных"""
         try:
-            tracked_items = db.get_tracked_items()
-            for id, item_id, _, target_rarity in tracked_items:
+            # Строки создаются заранее одним вызовом - вставка по одной в
+            # таблицу с виджетами в ячейках заметно медленнее
+            first = self.table.rowCount()
+            self.table.setRowCount(first + len(tracked_items))
+            for offset, (id, item_id, _, target_rarity, region, alert_rule) in enumerate(tracked_items):
                 name = self.find_item_name(item_id)
-                self.add_item_to_table(item_id, name, existing_id=id, existing_rarity=target_rarity)
+                self.add_item_to_table(item_id, name, existing_id=id, existing_rarity=target_rarity, region=region,
+                                       rule=alert_rule, publish=False, row=first + offset)
         except Exception as e:
             self.log_message(f"Ошибка загрузки списка предметов: {str(e)}")
 
-    def load_target_prices(self):
+    def load_target_prices(self, tracked_items):
         try:
-            tracked_items = db.get_tracked_items()
-            target_data = {id: (target_price, target_rarity) for id, item_id, target_price, target_rarity in tracked_items}
+            target_data = {id: (target_price, target_rarity) for id, item_id, target_price, target_rarity, _, _ in tracked_items}
 
             self.table.blockSignals(True)
             for row in range(self.table.rowCount()):
@@ -783,6 +650,8 @@ class PriceTracker(QMainWindow):
                     row_data = id_item.data(Qt.UserRole)
                     if isinstance(row_data, dict) and row_data['id'] in target_data:
                         price, rarity = target_data[row_data['id']]
+                        row_data['target_price'] = price
+                        id_item.setData(Qt.UserRole, row_data)
                         if price > 0:
                             self.table.setItem(row, 2, QTableWidgetItem(self.format_price(str(price))))
                             self.table.item(row, 2).setFlags(Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsEditable)
@@ -792,55 +661,90 @@ class PriceTracker(QMainWindow):
                             combo.blockSignals(True)
                             combo.setCurrentIndex(rarity)
                             combo.blockSignals(False)
-                            combo.setStyleSheet("QComboBox { background-color: white; }")
             self.table.blockSignals(False)
         except Exception as e:
             self.log_message(f"Ошибка загрузки целевых цен: {str(e)}")
     
 
 
+    def format_age(self, seconds):
+        if seconds < 60:
+            return f"{seconds} с"
+        if seconds < 3600:
+            return f"{seconds // 60} мин"
+        if seconds < 86400:
+            return f"{seconds // 3600} ч"
+        return f"{seconds // 86400} дн"
+
+    def show_price_cell(self, row, now=None):
+        """Последняя известная цена строки; устаревшая - серым и с возрастом"""
+        id_item = self.table.item(row, 0)
+        price_item = self.table.item(row, 1)
+        row_data = id_item.data(Qt.UserRole) if id_item else None
+        if not price_item or not isinstance(row_data, dict):
+            return
+        latest = self.latest.get((row_data['id'], row_data['rarity']))
+        self.table.blockSignals(True)
+        if latest is None:
+            price_item.setText("---")
+            price_item.setToolTip("")
+            price_item.setForeground(QColor(Qt.black))
+        else:
+            price, lots, scanned_at = latest
+            age = max(int(now if now is not None else time.time()) - scanned_at, 0)
+            text = self.format_price(str(price))
+            if age >= self.request_interval * STALE_INTERVALS:
+                text += f" ({self.format_age(age)} назад)"
+                price_item.setForeground(QColor(Qt.gray))
+            else:
+                price_item.setForeground(QColor(Qt.black))
+            price_item.setText(text)
+            checked = datetime.datetime.fromtimestamp(scanned_at).strftime("%Y-%m-%d %H:%M:%S")
+            price_item.setToolTip(f"Лотов: {lots}\nПроверено: {checked}")
+        self.table.blockSignals(False)
+
+    def refresh_price_cells(self):
+        now = int(time.time())
+        for row in range(self.table.rowCount()):
+            self.show_price_cell(row, now)
+
+    @profiling.timed('gui.update_item_price')
     def update_item_price(self, row, price):
         try:
-            formatted_price = self.format_price(price)
-            self.table.blockSignals(True)
-            price_item = self.table.item(row, 1)
-            if price_item: price_item.setText(formatted_price)
-            self.table.blockSignals(False)
+            formatted_price = self.format_price(str(price))
+            self.show_price_cell(row)
 
             id_item = self.table.item(row, 0)
-            name_item = self.table.item(row, 0)
-            name_text = name_item.text() if name_item else ""
-            target_item = self.table.item(row, 2)  # "Моя цена"
-
-            if id_item and name_text and target_item and target_item.text():
-                try:
-                    current_price = int(''.join(filter(str.isdigit, price)))
-                    target_price = int(''.join(filter(str.isdigit, target_item.text())))
-
-                    if current_price > 0 and current_price <= target_price:
-                        message = f"🚀 ВЫГОДНО: {name_text} за {formatted_price}"
-                        self.log_message(message)
-                        row_data = id_item.data(Qt.UserRole)
-                        rarity = row_data['rarity']
-                        rarity_names = ["Обычный", "Необычный", "Особый", "Редкий", "Исключительный", "Легендарный"]
-                        rarity_name = rarity_names[rarity] if rarity < len(rarity_names) else f"rarity={rarity}"
-                        notification_message = f"{name_text}\nРедкость: {rarity_name}\n{formatted_price}"
-                        self.add_notification(notification_message)
-                        for col in range(self.table.columnCount()):
-                            cell = self.table.item(row, col)
-                            if cell:  # Проверяем, что ячейка существует
-                                cell.setBackground(QColor(255, 255, 0))
-
-                        QApplication.beep()
-                        QTimer.singleShot(30000, lambda: self.reset_row_color_by_row(row))
-                    else:
-                        self.reset_row_color(id_item.data(Qt.UserRole))
-                except ValueError: pass
+            name_text = id_item.text() if id_item else ""
+            row_data = id_item.data(Qt.UserRole) if id_item else None
+
+            # Строки с правилом оповещают о подходящих лотах сами
+            if name_text and isinstance(row_data, dict) and row_data['target_price'] and not row_data['rule']:
+                target_price = row_data['target_price']
+                if 0 < price <= target_price:
+                    region_tag = row_data['region'].upper()
+                    message = f"🚀 ВЫГОДНО [{region_tag}]: {name_text} за {formatted_price}"
+                    self.log_message(message, item_id=row_data['item_id'])
+                    rarity = row_data['rarity']
+                    rarity_name = RARITY_NAMES[rarity] if rarity < len(RARITY_NAMES) else f"rarity={rarity}"
+                    notification_message = f"{name_text} [{region_tag}]\nРедкость: {rarity_name}\n{formatted_price}"
+                    self.add_notification(notification_message)
+                    self.publish_alert('price', row_data['item_id'], row_data['region'], rarity, price)
+                    for col in range(self.table.columnCount()):
+                        cell = self.table.item(row, col)
+                        if cell:  # Проверяем, что ячейка существует
+                            cell.setBackground(QColor(255, 255, 0))
+
+                    QApplication.beep()
+                    QTimer.singleShot(30000, lambda: self.reset_row_color_by_row(row))
+                else:
+                    self.reset_row_color_by_row(row)
         except Exception as e:
             self.log_message(f"Ошибка при обновлении цены: {str(e)}")
 
-    def on_profitable_stack(self, item_id, buyout_price, amount, unit_price, position, target_price, startTime, endTime, rarity):
-        token = f"{item_id}_{buyout_price}_{amount}_{startTime}"
+    @profiling.timed('gui.on_profitable_stack')
+    def on_profitable_stack(self, item_id, buyout_price, amount, unit_price, position, target_price, startTime, endTime, rarity, region):
+        token = f"{region}_{item_id}_{buyout_price}_{amount}_{startTime}"
         if token not in self.shown_stacks:
             self.shown_stacks.add(token)
             profit = (amount * target_price) - buyout_price
@@ -848,21 +752,55 @@ class PriceTracker(QMainWindow):
             page = position // 50 + 1
             formatted_total = self.format_price(str(buyout_price))
             formatted_unit = self.format_price(str(unit_price))
-            rarity_names = ["Обычный", "Необычный", "Особый", "Редкий", "Исключительный", "Легендарный"]
-            rarity_name = rarity_names[rarity] if rarity < len(rarity_names) else f"rarity={rarity}"
-            message = f"💰 ВЫГОДНЫЙ СТАК: {name} - {amount} шт. за {formatted_total} ({formatted_unit} за шт.) - Прибыль: {profit}"
-            notification_message = f"{name} (x{amount})\nРедкость: {rarity_name}\nЦена за стак: {buyout_price}\nЦена за шт.: {unit_price}\nСтраница {page}"
+            rarity_name = RARITY_NAMES[rarity] if rarity < len(RARITY_NAMES) else f"rarity={rarity}"
+            region_tag = region.upper()
+            message = f"💰 ВЫГОДНЫЙ СТАК [{region_tag}]: {name} - {amount} шт. за {formatted_total} ({formatted_unit} за шт.) - Прибыль: {profit}"
+            message += self.liquidity_hint(item_id, region, rarity)
+            self.log_message(message, item_id=item_id)
+            self.publish_alert('lot', item_id, region, rarity, buyout_price, amount, unit_price)
+            notification_message = f"{name} [{region_tag}] (x{amount})\nРедкость: {rarity_name}\nЦена за стак: {buyout_price}\nЦена за шт.: {unit_price}\nСтраница {page}"
             self.add_notification(notification_message)
             QApplication.beep()
 
-    def launch_next_page(self, row, item_id, token, target_price, offset, enable_percentage, percentage):
-        runnable = PageChecker(row, item_id, token, target_price, offset, self.enable_stacks, enable_percentage, percentage, self)
-        self.running_requests += 1
-        QThreadPool.globalInstance().start(runnable)
+    @profiling.timed('gui.on_price_anomaly')
+    def on_price_anomaly(self, item_id, buyout_price, amount, unit_price, position, normal_price, zscore, startTime, rarity, region):
+        token = f"{region}_{item_id}_{buyout_price}_{amount}_{startTime}"
+        if token not in self.shown_stacks:
+            self.shown_stacks.add(token)
+            name = self.find_item_name(item_id)
+            rarity_name = RARITY_NAMES[rarity] if rarity < len(RARITY_NAMES) else f"rarity={rarity}"
+            region_tag = region.upper()
+            formatted_unit = self.format_price(str(unit_price))
+            formatted_normal = self.format_price(str(normal_price))
+            self.log_message(f"📉 НИЖЕ НОРМЫ [{region_tag}]: {name} - {formatted_unit} за шт. "
+                             f"(обычно {formatted_normal}, {zscore:.1f}σ)", item_id=item_id)
+            self.publish_alert('anomaly', item_id, region, rarity, buyout_price, amount, unit_price)
+            # Формат уведомления о стаке - его понимает QuickHUD
+            notification_message = f"{name} [{region_tag}] (x{amount})\nРедкость: {rarity_name}\nЦена за стак: {buyout_price}\nЦена за шт.: {unit_price}\nСтраница {position // 50 + 1}"
+            self.add_notification(notification_message)
+            QApplication.beep()
 
-    def update_min(self, row, price):
-        if row not in self.item_mins or price < self.item_mins[row]:
-            self.item_mins[row] = price
+    def liquidity_hint(self, item_id, region, rarity):
+        """Сколько штук редкости ушло за сутки по исчезнувшим лотам"""
+        try:
+            flow = db.get_lot_flow(item_id, int(time.time()) - database.DAY, region).get(rarity)
+        except Exception:
+            return ""
+        if flow is None:
+            return ""
+        appeared, sold, sold_units, turnover, expired, depth = flow
+        return f" - За сутки ушло {sold_units} шт. (лотов: {sold}), у минимума {depth} шт."
+
+    def row_index(self):
+        """Текущие номера строк таблицы по id в базе"""
+        rows = {}
+        for row in range(self.table.rowCount()):
+            item = self.table.item(row, 0)
+            if item:
+                row_data = item.data(Qt.UserRole)
+                if isinstance(row_data, dict):
+                    rows[row_data['id']] = row
+        return rows
     
     def reset_row_color(self, row_data):
         """Сбросить цвет строки обратно к белому"""
@@ -890,26 +828,188 @@ class PriceTracker(QMainWindow):
                 row_id = row_data['id']
                 item_id = row_data['item_id']
                 rarity = combo.currentIndex()
-                rarity_names = ["Обычный", "Необычный", "Особый", "Редкий", "Исключительный", "Легендарный"]
                 item_name = self.find_item_name(item_id)
-                self.log_message(f"Редкость для {item_name} изменена на {rarity_names[rarity]}")
-                # Обновить цвет
-                combo.setStyleSheet("QComboBox { background-color: white; }")
+                self.log_message(f"Редкость для {item_name} изменена на {RARITY_NAMES[rarity]}", item_id=item_id)
                 db.update_target_rarity(row_id, rarity)
                 # Обновить UserRole
                 row_data['rarity'] = rarity
                 item.setData(Qt.UserRole, row_data)
+                self.show_price_cell(row)
+
+    def on_region_changed(self, combo):
+        # Номер строки мог измениться после удаления строк выше - ищем по виджету
+        for row in range(self.table.rowCount()):
+            if self.table.cellWidget(row, 4) is combo:
+                item = self.table.item(row, 0)
+                row_data = item.data(Qt.UserRole) if item else None
+                if isinstance(row_data, dict):
+                    region = combo.currentData()
+                    # Текущие циклы ещё опрашивают старый регион - их цена для строки не нужна
+                    for cycle in self.cycles:
+                        cycle.cancel_row(row_data['id'])
+                    db.update_target_region(row_data['id'], region)
+                    self.forget_latest(row_data['id'])
+                    row_data['region'] = region
+                    item.setData(Qt.UserRole, row_data)
+                    item_name = self.find_item_name(row_data['item_id'])
+                    self.log_message(f"Регион для {item_name} изменён на {region.upper()}", item_id=row_data['item_id'])
+                    self.show_price_cell(row)
+                break
+
+    def restart_local_api(self):
+        """Запустить локальный API на local_api_port (0 - выключить)"""
+        if self.local_api is not None:
+            self.local_api.stop()
+            self.local_api = None
+            self.api_state = None
+        if not self.local_api_port:
+            return
+        import local_api
+
+        try:
+            self.api_state = local_api.ApiState()
+            self.local_api = local_api.LocalApiServer(self.api_state, self.local_api_port).start()
+            self.log_message(f"Локальный API: http://127.0.0.1:{self.local_api.port}/prices")
+            self.publish_prices()
+        except OSError as e:
+            self.api_state = None
+            self.log_message(f"Не удалось запустить локальный API на порту {self.local_api_port}: {str(e)}")
+
+    def restart_archive(self):
+        """Включить архив ответов с лимитом archive_max_mb (0 - выключить)"""
+        if self.archive is not None:
+            self.archive.close()
+            self.archive = None
+        if not self.archive_max_mb:
+            return
+        import archive
+
+        try:
+            directory = os.path.join(self.base_dir, archive.DIRECTORY)
+            self.archive = archive.ResponseArchive(directory, self.archive_max_mb * 1024 * 1024)
+            self.log_message(f"Архив ответов API: {directory} (до {self.archive_max_mb} МБ)")
+        except (ImportError, OSError) as e:
+            self.log_message(f"Архив ответов не включён: {str(e)}", logging.WARNING)
+
+    def publish_prices(self):
+        """Передать локальному API текущие цены таблицы"""
+        if self.api_state is None:
+            return
+        prices = []
+        for row in range(self.table.rowCount()):
+            item = self.table.item(row, 0)
+            row_data = item.data(Qt.UserRole) if item else None
+            if not isinstance(row_data, dict):
+                continue
+            floor, lots, scanned_at = self.latest.get((row_data['id'], row_data['rarity']), (None, None, None))
+            prices.append({
+                'row_id': row_data['id'], 'item_id': row_data['item_id'], 'name': item.text(),
+                'region': row_data['region'], 'rarity': row_data['rarity'], 'target_price': row_data['target_price'],
+                'floor_price': floor, 'lot_count': lots, 'scanned_at': scanned_at,
+            })
+        self.api_state.publish_prices(prices)
+
+    def publish_alert(self, kind, item_id, region, rarity, price, amount=1, unit_price=None):
+        if self.api_state is None:
+            return
+        self.api_state.add_alert({
+            'time': int(time.time()), 'kind': kind, 'item_id': item_id, 'name': self.find_item_name(item_id),
+            'region': region, 'rarity': rarity, 'price': price, 'amount': amount,
+            'unit_price': unit_price if unit_price is not None else price,
+        })
+
+    def warm_candidates(self, now):
+        """Предметы для подогрева истории: сначала недавно открытые, затем
+        ближайшие к своей цене, затем давно не обновлявшиеся"""
+        candidates = {}
+        for row in range(self.table.rowCount()):
+            item = self.table.item(row, 0)
+            row_data = item.data(Qt.UserRole) if item else None
+            if not isinstance(row_data, dict):
+                continue
+            key = (row_data['item_id'], row_data['region'])
+            if now - self.warmed.get(key, 0) < WARM_FRESH:
+                continue
+            viewed = now - self.viewed.get(key, 0) < RECENTLY_VIEWED
+            floor = self.latest.get((row_data['id'], row_data['rarity']), (None,))[0]
+            target = row_data['target_price']
+            distance = abs(floor / target - 1) if floor and target else float('inf')
+            rank = (not viewed, distance, self.warmed.get(key, 0))
+            if key not in candidates or rank < candidates[key]:
+                candidates[key] = rank
+        return sorted(candidates, key=candidates.get)
+
+    def warm_history_tick(self):
+        """Загрузить первую страницу истории одного предмета из свободного лимита"""
+        token = self.token_input.text().strip()
+        # Циклы проверки цен важнее - пока они идут, подогрев ждёт
+        if self.warming or not token or any(not cycle.finished for cycle in self.cycles):
+            return
+        now = time.time()
+        for item_id, region in self.warm_candidates(now):
+            if api.executor().breaker((region, 'history')).is_open():
+                continue
+            limiter = self.limiter(region)
+            if not limiter.try_acquire(reserve=limiter.burst * WARM_RESERVE_SHARE):
+                continue
+            self.warming = True
+            QThreadPool.globalInstance().start(BackgroundTask(self, self.warm_history, item_id, region))
+            return
+
+    def warm_history(self, item_id, region):
+        loaded = False
+        try:
+            history = self.fetch_history_page(item_id, 0, api.HISTORY_PAGE_LIMIT, region)
+            if history:
+                db.add_price_history(item_id, history, region)
+            loaded = True
+        except api.ApiError as e:
+            # Подогрев необязателен: при сбое API он просто ждёт
+            if e.kind != api.CIRCUIT_OPEN:
+                self.log_message(f"Ошибка подогрева истории {item_id} ({region.upper()}): {str(e)}", item_id=item_id)
+        finally:
+            # Неудачная попытка тоже откладывает предмет, чтобы не повторять её каждый тик
+            self.history_warmed.emit((item_id, region), loaded)
+
+    def on_history_warmed(self, key, loaded):
+        self.warmed[key] = time.time()
+        if loaded:
+            self.warm_loaded[key] = self.warmed[key]
+        self.warming = False
+
+    def is_history_warm(self, item_id, region):
+        """Первая страница истории недавно загружена в базу"""
+        return time.time() - self.warm_loaded.get((item_id, region), 0) < WARM_FRESH
+
+    def forget_latest(self, row_id):
+        for key in [key for key in self.latest if key[0] == row_id]:
+            del self.latest[key]
+
+    def limiter(self, region):
+        """Ограничитель частоты запросов региона (создаётся при первом обращении)"""
+        limiter = self.scan_limiters.get(region)
+        if limiter is None:
+            limiter = self.scan_limiters[region] = api.RateLimiter(self.scan_rate)
+        return limiter
 
     def update_token(self):
         token = self.token_input.text().strip()
 
-    def load_settings(self):
+    def load_settings(self, config):
         try:
-            self.request_interval = int(db.get_config('interval', '60'))
-            self.enable_stacks = db.get_config('enable_stacks', 'True') == 'True'
-            self.enable_percentage = db.get_config('enable_percentage', 'False') == 'True'
-            self.percentage = int(db.get_config('percentage', '10'))
-            token = db.get_config('token', '')
+            self.request_interval = int(config.get('interval', '60'))
+            self.scan_rate = int(config.get('scan_rate', api.DEFAULT_SCAN_RATE))
+            for limiter in self.scan_limiters.values():
+                limiter.set_rate(self.scan_rate)
+            self.enable_stacks = config.get('enable_stacks', 'True') == 'True'
+            self.enable_percentage = config.get('enable_percentage', 'False') == 'True'
+            self.percentage = int(config.get('percentage', '10'))
+            self.anomaly_sigma = int(config.get('anomaly_sigma', DEFAULT_ANOMALY_SIGMA))
+            self.raw_history_days = int(config.get('history_raw_days', database.DEFAULT_RAW_DAYS))
+            self.hourly_history_days = int(config.get('history_hourly_days', database.DEFAULT_HOURLY_DAYS))
+            self.local_api_port = int(config.get('local_api_port', 0))
+            self.archive_max_mb = int(config.get('archive_max_mb', 0))
+            token = config.get('token', '')
             if token:
                 self.token_input.setText(token)
                 self.update_token()
@@ -918,21 +1018,46 @@ class PriceTracker(QMainWindow):
     def save_settings(self):
         try:
             db.set_config('interval', str(self.request_interval))
+            db.set_config('scan_rate', str(self.scan_rate))
             db.set_config('enable_stacks', str(self.enable_stacks))
             db.set_config('enable_percentage', str(self.enable_percentage))
             db.set_config('percentage', str(self.percentage))
+            db.set_config('anomaly_sigma', str(self.anomaly_sigma))
+            db.set_config('history_raw_days', str(self.raw_history_days))
+            db.set_config('history_hourly_days', str(self.hourly_history_days))
+            db.set_config('local_api_port', str(self.local_api_port))
+            db.set_config('archive_max_mb', str(self.archive_max_mb))
             db.set_config('token', self.token_input.text().strip())
         except: pass
 
     def show_settings(self):
-        dialog = SettingsDialog(self.request_interval, self.enable_stacks, self.enable_percentage, self.percentage)
+        from dialogs import SettingsDialog
+
+        dialog = SettingsDialog(self.request_interval, self.scan_rate, self.enable_stacks, self.enable_percentage, self.percentage,
+                                self.raw_history_days, self.hourly_history_days, self.local_api_port, self.anomaly_sigma,
+                                self.archive_max_mb)
         dialog.update_db_requested.connect(lambda: self.handle_manual_update(dialog))
+        dialog.diagnostics_requested.connect(self.show_diagnostics)
 
         if dialog.exec_() == QDialog.Accepted:
             self.request_interval = dialog.interval_spin.value()
+            self.scan_rate = dialog.rate_spin.value()
+            for limiter in self.scan_limiters.values():
+                limiter.set_rate(self.scan_rate)
             self.enable_stacks = dialog.stacks_checkbox.isChecked()
             self.enable_percentage = dialog.percentage_checkbox.isChecked()
             self.percentage = dialog.percentage_spin.value()
+            self.anomaly_sigma = dialog.anomaly_spin.value()
+            self.raw_history_days = dialog.raw_days_spin.value()
+            self.hourly_history_days = dialog.hourly_days_spin.value()
+            if dialog.api_port_spin.value() != self.local_api_port:
+                self.local_api_port = dialog.api_port_spin.value()
+                self.restart_local_api()
+            if dialog.archive_spin.value() != self.archive_max_mb:
+                self.archive_max_mb = dialog.archive_spin.value()
+                self.restart_archive()
+            if dialog.profile_spin.value():
+                self.start_profiling(dialog.profile_spin.value())
             self.save_settings()
             if self.timer.isActive(): self.timer.start(self.request_interval * 1000)
             self.log_message(f"Интервал изменен: {self.request_interval} сек")
@@ -943,35 +1068,99 @@ class PriceTracker(QMainWindow):
             QMessageBox.information(dialog, "Успех", "База данных предметов успешно обновлена!")
 
     def show_item_search(self):
-        if not self.items_data:
-            self.items_data = self.load_item_data()
-            if not self.items_data:
+        from dialogs import ItemSearchDialog
+
+        if not self.catalog:
+            self.on_catalog_loaded(self.load_item_data())
+            if not self.catalog:
                 QMessageBox.warning(self, "Ошибка", "База данных предметов пуста. Обновите её в настройках.")
                 return
 
-        dialog = ItemSearchDialog(self.items_data, self)
+        dialog = ItemSearchDialog(self.catalog, self)
         if dialog.exec_() == QDialog.Accepted and dialog.selected_item:
-            item_data = dialog.selected_item
-            item_id = item_data['id']
-            self.add_item_to_table(item_id, item_data['name']['lines']['ru'])
+            item_id = dialog.selected_item
+            self.add_item_to_table(item_id, self.find_item_name(item_id))
     
 
 
 
 
-    def add_item_to_table(self, item_id, name, existing_id=None, existing_rarity=0):
+    def import_watchlist(self):
+        """Загрузить строки из CSV/JSON: проверка всего файла, одна транзакция, одно обновление таблицы"""
+        import watchlist
+        from PyQt5.QtWidgets import QFileDialog
+
+        path, _ = QFileDialog.getOpenFileName(self, "Импорт списка", self.base_dir, "Список (*.csv *.json);;Все файлы (*)")
+        if not path:
+            return
+        if not self.catalog:
+            self.on_catalog_loaded(self.load_item_data())
+        answer = QMessageBox.question(self, "Импорт списка", "Удалить строки, которых нет в файле?",
+                                      QMessageBox.Yes | QMessageBox.No | QMessageBox.Cancel, QMessageBox.No)
+        if answer == QMessageBox.Cancel:
+            return
+        try:
+            entries = watchlist.resolve(watchlist.read_rows(path), self.catalog)
+            added, updated, removed = db.import_tracked_items(entries, replace=answer == QMessageBox.Yes)
+        except watchlist.WatchlistError as e:
+            details = "\n".join(e.errors[:20]) + ("\n..." if len(e.errors) > 20 else "")
+            QMessageBox.warning(self, "Импорт списка", f"{str(e)}. Список не изменён.\n\n{details}")
+            return
+        except Exception as e:
+            QMessageBox.warning(self, "Импорт списка", f"Ошибка импорта: {str(e)}")
+            return
+        self.reload_tracked_items(removed)
+        self.log_message(f"Импорт списка: добавлено {added}, обновлено {updated}, удалено {len(removed)}")
+
+    def export_watchlist(self):
+        import watchlist
+        from PyQt5.QtWidgets import QFileDialog
+
+        path, _ = QFileDialog.getSaveFileName(self, "Экспорт списка", os.path.join(self.base_dir, "watchlist.csv"),
+                                              "CSV (*.csv);;JSON (*.json)")
+        if not path:
+            return
+        try:
+            count = watchlist.write_rows(path, db.get_tracked_items(), self.catalog)
+            self.log_message(f"Список сохранён: {count} строк в {path}")
+        except Exception as e:
+            QMessageBox.warning(self, "Экспорт списка", f"Ошибка экспорта: {str(e)}")
+
+    def reload_tracked_items(self, removed=()):
+        """Перестроить таблицу из базы за одно обновление (после пакетных изменений)"""
+        for row_id in removed:
+            for cycle in self.cycles:
+                cycle.cancel_row(row_id)
+            self.forget_latest(row_id)
+        tracked = db.get_tracked_items()
+        self.table.setUpdatesEnabled(False)
+        self.table.blockSignals(True)
+        try:
+            self.table.setRowCount(0)
+            self.load_tracked_items_from_db(tracked)
+            self.load_target_prices(tracked)
+        finally:
+            self.table.blockSignals(False)
+            self.table.setUpdatesEnabled(True)
+        self.refresh_price_cells()
+        self.publish_prices()
+
+    def add_item_to_table(self, item_id, name, existing_id=None, existing_rarity=0, region=api.DEFAULT_REGION, rule=None,
+                          publish=True, row=None):
         # Always add to database
         if existing_id is None:
-            row_id = db.add_tracked_item(item_id)
+            row_id = db.add_tracked_item(item_id, target_rarity=existing_rarity, region=region)
         else:
             row_id = existing_id
 
         self.table.blockSignals(True)
-        row = self.table.rowCount()
-        self.table.insertRow(row)
+        if row is None:
+            row = self.table.rowCount()
+            self.table.insertRow(row)
 
         self.table.setItem(row, 0, QTableWidgetItem(name))
-        self.table.item(row, 0).setData(Qt.UserRole, {'id': row_id, 'item_id': item_id, 'rarity': existing_rarity})
+        self.table.item(row, 0).setData(Qt.UserRole, {'id': row_id, 'item_id': item_id, 'rarity': existing_rarity, 'region': region,
+                                                     'target_price': 0, 'rule': rule})
         self.table.item(row, 0).setFlags(Qt.ItemIsEnabled | Qt.ItemIsSelectable)
 
         self.table.setItem(row, 1, QTableWidgetItem("---"))
@@ -982,15 +1171,31 @@ class PriceTracker(QMainWindow):
 
         # Столбец 3 - Редкость
         combo = QComboBox()
-        combo.addItems(["Обычный", "Необычный", "Особый", "Редкий", "Исключительный", "Легендарный"])
+        combo.addItems(RARITY_NAMES)
         combo.setCurrentIndex(existing_rarity)  # Use existing_rarity
         combo.setEnabled(True)
         combo.setFocusPolicy(Qt.StrongFocus)
-        combo.setStyleSheet("QComboBox { background-color: white; }")
         combo.currentIndexChanged.connect(lambda index, row=row, combo=combo: self.on_rarity_changed_by_id(row, combo))
         self.table.setCellWidget(row, 3, combo)
 
+        # Столбец 4 - Регион
+        region_combo = QComboBox()
+        for code in api.REGIONS:
+            region_combo.addItem(code.upper(), code)
+        if region_combo.findData(region) < 0:
+            region_combo.addItem(region.upper(), region)
+        region_combo.setCurrentIndex(region_combo.findData(region))
+        region_combo.currentIndexChanged.connect(lambda index, combo=region_combo: self.on_region_changed(combo))
+        self.table.setCellWidget(row, 4, region_combo)
+
+        # Столбец 5 - Правило оповещения
+        self.table.setItem(row, 5, QTableWidgetItem(rule or ""))
+        self.table.item(row, 5).setFlags(Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsEditable)
+        self.table.item(row, 5).setToolTip(RULE_HELP)
+
         self.table.blockSignals(False)
+        if publish:
+            self.publish_prices()
     
     def remove_item(self):
         selected = self.table.currentRow()
@@ -999,61 +1204,158 @@ class PriceTracker(QMainWindow):
         if isinstance(row_data, dict):
             row_id = row_data['id']
             item_id = row_data['item_id']
+            for cycle in self.cycles:
+                cycle.cancel_row(row_id)
+            self.forget_latest(row_id)
             self.table.removeRow(selected)
+            self.publish_prices()
             db.remove_tracked_item(row_id)
-            self.log_message(f"Удалён предмет {item_id}")
+            self.log_message(f"Удалён предмет {item_id}", item_id=item_id)
 
 
     
     def find_item_name(self, item_id):
-        for item in self.items_data:
-            try:
-                current_id = item.get('id', '')
-                if current_id == item_id: return item['name']['lines']['ru']
-            except: continue
-        return item_id
+        return self.catalog.name(item_id, item_id)
     
 
     
     def start_price_check(self):
         if not self.token_input.text().strip() or self.table.rowCount() == 0: return
 
-        token = self.token_input.text().strip()
-        thread_pool = QThreadPool.globalInstance()
-        self.running_requests = 0
-        self.item_mins = {}
+        self.cycles = [cycle for cycle in self.cycles if not cycle.finished]
+        busy = [cycle for cycle in self.cycles if cycle.busy_share() > CYCLE_BACKPRESSURE]
+        if busy or len(self.cycles) >= MAX_ACTIVE_CYCLES:
+            self.log_message("Предыдущий цикл проверки ещё выполняется - новый пропущен", logging.WARNING)
+            return
 
+        # Снимок строк строится один раз в потоке GUI и передаётся задачам
+        import rules
+
+        mode = scan.ScanMode(self.enable_stacks, self.enable_percentage, self.percentage, self.anomaly_sigma)
+        targets = []
         for r in range(self.table.rowCount()):
             item = self.table.item(r, 0)
             if item:
                 row_data = item.data(Qt.UserRole)
                 if isinstance(row_data, dict):
-                    item_id = row_data['item_id']
-                    target_item = self.table.item(r, 2)
-                    target_price = 0
-                    if target_item and target_item.text():
-                        target_price = int(''.join(filter(str.isdigit, target_item.text())))
-                    self.running_requests += 1
-                    runnable = PageChecker(r, item_id, token, target_price, 0, self.enable_stacks, self.enable_percentage, self.percentage, self)
-                    thread_pool.start(runnable)
-
-        # Очистить показанные стаки только если нет активных запросов
-        if self.running_requests == 0:
+                    # Правило компилируется один раз (кеш по тексту)
+                    rule = None
+                    if row_data['rule']:
+                        try:
+                            rule = rules.compile_rule(row_data['rule'])
+                        except rules.RuleError as e:
+                            self.log_message(f"Ошибка в правиле для {item.text()}: {str(e)}", item_id=row_data['item_id'])
+                    targets.append(scan.ScanTarget(row_data['id'], row_data['item_id'], row_data['rarity'],
+                                                   row_data['target_price'], mode, row_data['region'], rule))
+
+        if not targets:
+            # Очистить показанные стаки только если нет активных запросов
             self.shown_stacks.clear()
+            return
+
+        # Дедлайн - интервал автообновления: задачи, не успевшие к следующему
+        # циклу, прекращают запросы
+        # Сначала строки, проверенные давнее всех (и никогда не проверенные):
+        # при срыве дедлайна не успевают свежие, а не одни и те же устаревшие
+        targets.sort(key=lambda target: self.latest.get((target.row_id, target.rarity), (0, 0, 0))[2])
+        limiters = {target.region: self.limiter(target.region) for target in targets}
+        cycle = scan.ScanCycle(targets, self.token_input.text().strip(), self.request_interval, limiters)
+        self.cycles.append(cycle)
+        # Потоки добавляются на каждый регион: пока один регион ждёт своего
+        # лимита, задачи остальных продолжают выполняться
+        self.scan_pool.setMaxThreadCount(max(self.scan_pool.maxThreadCount(), SCAN_THREADS_PER_REGION * len(cycle.regions)))
+        self.profile_cycle_started(cycle)
+        for target in cycle.targets:
+            self.scan_pool.start(PageChecker(cycle, target, self))
+
+    def stop_price_checks(self):
+        """Отменить все задачи текущих циклов"""
+        for cycle in self.cycles:
+            cycle.cancel()
+
+    def on_request_finished(self, cycle):
+        if cycle.job_finished():
+            self.on_check_complete(cycle)
+
+    @profiling.timed('gui.on_check_complete')
+    def on_check_complete(self, cycle):
+        if cycle in self.cycles:
+            self.cycles.remove(cycle)
+        profiling.timers.add('cycle', time.monotonic() - cycle.started)
+        # Счётчики лотов копятся и в остановленном цикле - наблюдения верны
+        flows = self.lot_tracker.drain()
+        if flows:
+            QThreadPool.globalInstance().start(BackgroundTask(self, db.add_lot_flow, flows))
+        if not cycle.stopped:
+            rows = self.row_index()
+            rarities = {target.row_id: target.rarity for target in cycle.targets}
+            now = int(time.time())
+            latest = []
+            units = cycle.mins.unit_floors()
+            for row_id, price, lots in cycle.mins.items():
+                if row_id in rows:
+                    self.latest[(row_id, rarities[row_id])] = (price, lots, now)
+                    latest.append((row_id, rarities[row_id], price, lots, now, units.get(row_id)))
+                    self.price_checked.emit(rows[row_id], price)
+            if latest:
+                QThreadPool.globalInstance().start(BackgroundTask(self, db.save_latest_prices, latest))
+            self.publish_prices()
+        # Свёртка старой истории (сама ограничивает частоту запуска)
+        QThreadPool.globalInstance().start(BackgroundTask(self, self.compact_history))
+        self.profile_cycle_finished(cycle)
+
+    def start_profiling(self, cycles, interval=None, directory=None):
+        """Снимать стеки всех потоков в течение следующих cycles циклов проверки"""
+        self.profile_remaining = cycles
+        if interval:
+            self.profile_interval = interval
+        if directory:
+            self.profile_dir = directory
+        self.log_message(f"Профилирование следующих циклов проверки: {cycles}")
+
+    def profile_cycle_started(self, cycle):
+        if not self.profile_remaining:
+            return
+        if self.profiler is None:
+            self.profiler = profiling.SamplingProfiler(self.profile_interval).start()
+        self.profile_remaining -= 1
+        self.profiled_cycles.add(cycle)
+
+    def profile_cycle_finished(self, cycle):
+        """Последний профилируемый цикл завершён - остановить снятие и сохранить файлы"""
+        if cycle not in self.profiled_cycles:
+            return
+        self.profiled_cycles.discard(cycle)
+        if self.profiled_cycles or self.profile_remaining or self.profiler is None:
+            return
+        profiler, self.profiler = self.profiler, None
+        profiler.stop()
+        try:
+            _, speedscope = profiler.save(self.profile_dir)
+            self.log_message(f"Профиль сохранён: {speedscope} ({profiler.samples} снимков за {profiler.elapsed:.1f} с)")
+        except OSError as e:
+            self.log_message(f"Ошибка сохранения профиля: {str(e)}")
 
-    def on_request_finished(self):
-        self.running_requests -= 1
-        if self.running_requests == 0:
-            self.on_check_complete()
+    def show_diagnostics(self):
+        from dialogs import DiagnosticsDialog
 
-    def on_check_complete(self):
-        for row, price in self.item_mins.items():
-            self.price_checked.emit(row, str(price))
-        self.item_mins = {}
+        if self.diagnostics_dialog is None:
+            self.diagnostics_dialog = DiagnosticsDialog(self)
+        self.diagnostics_dialog.show()
+        self.diagnostics_dialog.raise_()
+
+    def compact_history(self):
+        removed = db.compact_history()
+        if removed:
+            self.log_message(f"История цен свёрнута в агрегаты: {removed} строк")
+        # Окно сделок за сутки сдвигается и у предметов без новых сделок
+        db.refresh_item_summaries()
 
 
 
     def show_history(self):
+        from dialogs import HistoryDialog
+
         try:
             selected = self.table.currentRow()
             if selected == -1:
@@ -1063,37 +1365,55 @@ class PriceTracker(QMainWindow):
             row_data = self.table.item(selected, 0).data(Qt.UserRole)
             if isinstance(row_data, dict):
                 item_id = row_data['item_id']
-                name = self.table.item(selected, 0).text()
+                name = f"{self.table.item(selected, 0).text()} [{row_data['region'].upper()}]"
 
-                dialog = HistoryDialog(item_id, name, self)
+                self.viewed[(item_id, row_data['region'])] = time.time()
+                dialog = HistoryDialog(item_id, name, self, region=row_data['region'])
                 dialog.exec_()
         except Exception as e:
             QMessageBox.critical(self, "Ошибка", f"Не удалось открыть историю: {str(e)}")
             self.log_message(f"Ошибка при открытии истории: {str(e)}")
 
-    def fetch_history_page(self, item_id, offset=0, limit=200):
-        """Загрузить страницу истории цен для предмета"""
-        try:
-            token = self.token_input.text().strip()
-            if not token:
-                return []
+    def show_screener(self):
+        from dialogs import ScreenerDialog
 
-            url = f"https://eapi.stalcraft.net/ru/auction/{item_id}/history"
-            headers = {"Authorization": f"Bearer {token}"}
-            params = {"limit": limit, "offset": offset, "additional": "true"}
+        token = self.token_input.text().strip()
+        if not token:
+            QMessageBox.warning(self, "Ошибка", "Введите токен!")
+            return
+        if not self.catalog:
+            QMessageBox.warning(self, "Ошибка", "База данных предметов ещё не загружена.")
+            return
+        dialog = ScreenerDialog(self.catalog, token, self)
+        dialog.exec_()
 
-            response = requests.get(url, headers=headers, params=params, timeout=15)
+    def show_dashboard(self):
+        from dialogs import CategoryDashboard
 
-            if response.status_code == 200:
-                return response.json().get('prices', [])
-            else:
-                self.log_message(f"Ошибка загрузки истории для {item_id}: {response.status_code}")
-                return []
-        except Exception as e:
-            self.log_message(f"Ошибка при загрузке истории {item_id}: {str(e)}")
-            return []
+        if not self.catalog:
+            QMessageBox.warning(self, "Ошибка", "База данных предметов ещё не загружена.")
+            return
+        CategoryDashboard(self.catalog, self).exec_()
+
+    def fetch_history_page(self, item_id, offset=0, limit=200, region=api.DEFAULT_REGION):
+        """Загрузить страницу истории цен для предмета.
+
+        Ошибка запроса - api.ApiError, а не пустая страница: пустой ответ
+        означает конец истории.
+        """
+        token = self.token_input.text().strip()
+        if not token:
+            raise api.ApiError(api.AUTH, "не указан токен")
 
+        def observe(response):
+            if self.archive is not None:
+                self.archive.record('history', region, item_id, offset, response.status_code, response.content)
 
+        response = api.executor().get(
+            api.history_url(item_id, region), headers=api.auth_headers(token),
+            params={"limit": limit, "offset": offset, "additional": "true"},
+            endpoint=(region, 'history'), observe=observe)
+        return response.json().get('prices', [])
 
     def log_error(self, error_msg):
         self.log_message(f"ОШИБКА: {error_msg}")
@@ -1104,6 +1424,8 @@ class PriceTracker(QMainWindow):
         self.shown_stacks.clear()
 
     def show_quick_hud(self, item):
+        from dialogs import QuickHUD
+
         widget = self.notifications_list.itemWidget(item)
         if widget:
             text = widget.text()
@@ -1114,11 +1436,7 @@ class PriceTracker(QMainWindow):
             message = text.split('] ', 1)[1]
         else:
             message = text
-        # Извлечь название из первой строки
-        name = message.split('\n')[0]
-        # Убрать (x{amount}) если есть
-        if ' (' in name and name.endswith(')'):
-            name = name.split(' (')[0]
+        name = self.notification_item_name(message)
         QApplication.clipboard().setText(name)
         self.log_message(f"Название '{name}' скопировано в буфер обмена")
 
@@ -1150,6 +1468,24 @@ class PriceTracker(QMainWindow):
         else:
             self.log_message("Неверный формат уведомления для HUD")
 
+    def notification_item_name(self, message):
+        """Название предмета из первой строки уведомления, без региона и (x{amount})"""
+        name = message.split('\n')[0]
+        if ' (' in name and name.endswith(')'):
+            name = name.split(' (')[0]
+        if ' [' in name and name.endswith(']'):
+            name = name.rsplit(' [', 1)[0]
+        return name
+
+    def notification_region(self, message):
+        """Регион из первой строки уведомления или None для старого формата"""
+        name = message.split('\n')[0]
+        if ' (' in name and name.endswith(')'):
+            name = name.split(' (')[0]
+        if ' [' in name and name.endswith(']'):
+            return name.rsplit(' [', 1)[1][:-1].lower()
+        return None
+
     def show_notification_context_menu(self, position):
         menu = QMenu()
         buy_action = menu.addAction("✅ Купил")
@@ -1170,12 +1506,12 @@ class PriceTracker(QMainWindow):
                 message = text.split('] ', 1)[1]
             else:
                 message = text
-            name = message.split('\n')[0]
-            if ' (' in name and name.endswith(')'):
-                name = name.split(' (')[0]
+            name = self.notification_item_name(message)
+            region = self.notification_region(message)
             # Find the row with this name and reset color
             for r in range(self.table.rowCount()):
-                if self.table.item(r, 0).text() == name:
+                row_data = self.table.item(r, 0).data(Qt.UserRole)
+                if self.table.item(r, 0).text() == name and (region is None or row_data['region'] == region):
                     self.reset_row_color_by_row(r)
                     break
             self.notifications_list.takeItem(row)
@@ -1183,6 +1519,7 @@ class PriceTracker(QMainWindow):
     def toggle_auto_update(self):
         if self.timer.isActive():
             self.timer.stop()
+            self.stop_price_checks()
             self.btn_start.setText("Автообновление")
             self.log_message("Автообновление остановлено")
         else:
@@ -1196,12 +1533,27 @@ class PriceTracker(QMainWindow):
 
     def closeEvent(self, event):
         self.save_settings()
+        if self.local_api is not None:
+            self.local_api.stop()
+        if self.archive is not None:
+            self.archive.close()
         settings = QSettings("StalcraftTools", "PriceTracker")
         settings.setValue("geometry", self.saveGeometry())
+        self.file_log.close()
         event.accept()
 
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
+    import cli
+
+    # Команды без GUI: python index.py export-history ...
+    if len(sys.argv) > 1 and sys.argv[1] in cli.COMMANDS + ('-h', '--help'):
+        sys.exit(cli.main(sys.argv[1:]))
+
+    # Параметры окна (--profile N ...), остальное - Qt
+    options, qt_args = cli.gui_arguments(sys.argv[1:])
+    app = QApplication(sys.argv[:1] + qt_args)
     window = PriceTracker()
+    if options.profile:
+        window.start_profiling(options.profile, options.profile_interval / 1000, options.profile_dir)
     window.show()
     sys.exit(app.exec_())
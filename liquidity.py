@@ -0,0 +1,106 @@
+"""Продажи и глубина рынка по разнице снимков лотов между циклами.
+
+Снимок предмета - отпечатки лотов с выкупом (цена, количество, редкость,
+время выставления) и время окончания каждого. Следующий цикл сравнивает
+множества отпечатков:
+    появился    - есть сейчас, не было в прошлом снимке
+    продан      - пропал раньше своего endTime (или снят продавцом)
+    истёк       - пропал к своему endTime
+
+Если в цикле загружены не все страницы, сравнение ограничено ценами не
+выше последнего загруженного лота в обоих снимках.
+
+Счётчики копятся по часам в таблице lot_flow; глубина - штук в пределах
+DEPTH_BAND от минимальной цены за штуку на момент последней проверки.
+"""
+import threading
+
+DEPTH_BAND = 0.1
+# Лот, пропавший позже чем за EXPIRY_GRACE секунд до окончания, считается истёкшим
+EXPIRY_GRACE = 120
+HOUR = 3600
+
+
+class _Snapshot:
+    __slots__ = ('lots', 'ceiling')
+
+    def __init__(self, lots, ceiling):
+        self.lots = lots        # отпечаток -> (qlt, unit_price, amount, end_ts, price)
+        self.ceiling = ceiling  # цена последнего загруженного лота (inf - загружены все)
+
+
+class LotTracker:
+    """Последние снимки лотов по (item_id, регион) и ещё не сохранённые счётчики"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshots = {}
+        self._pending = []
+
+    def observe(self, item_id, region, batch, complete):
+        """Сравнить лоты (rules.LotBatch) с прошлым снимком предмета и запомнить их"""
+        prices = batch.column('price').tolist()
+        amounts = batch.column('amount').tolist()
+        qlts = batch.column('qlt').tolist()
+        units = batch.column('unit').tolist()
+        ends = (batch.column('ends_in') + batch.now).tolist()
+        lots = {}
+        for i, lot in enumerate(batch.lots):
+            if prices[i] > 0:
+                lots[hash((prices[i], amounts[i], qlts[i], lot.get('startTime')))] = (qlts[i], units[i], amounts[i], ends[i], prices[i])
+        ceiling = float('inf') if complete else max(prices, default=0)
+        current = _Snapshot(lots, ceiling)
+
+        with self._lock:
+            previous = self._snapshots.get((item_id, region))
+            self._snapshots[(item_id, region)] = current
+
+        # qlt -> [появилось, продано, штук продано, оборот, истекло, глубина]
+        flows = {}
+        floors = {}
+        for qlt, unit, amount, end_ts, price in lots.values():
+            if qlt not in floors or unit < floors[qlt]:
+                floors[qlt] = unit
+        for qlt, unit, amount, end_ts, price in lots.values():
+            if unit <= floors[qlt] * (1 + DEPTH_BAND):
+                flows.setdefault(qlt, [0, 0, 0, 0, 0, 0])[5] += amount
+
+        if previous is not None:
+            covered = min(previous.ceiling, current.ceiling)
+            for key in lots.keys() - previous.lots.keys():
+                qlt, unit, amount, end_ts, price = lots[key]
+                if price <= covered:
+                    flows.setdefault(qlt, [0, 0, 0, 0, 0, 0])[0] += 1
+            for key in previous.lots.keys() - lots.keys():
+                qlt, unit, amount, end_ts, price = previous.lots[key]
+                if price > covered:
+                    continue
+                flow = flows.setdefault(qlt, [0, 0, 0, 0, 0, 0])
+                if end_ts - batch.now > EXPIRY_GRACE:
+                    flow[1] += 1
+                    flow[2] += amount
+                    flow[3] += price
+                else:
+                    flow[4] += 1
+
+        bucket = int(batch.now) // HOUR * HOUR
+        rows = [(region, item_id, qlt, bucket, *flow) for qlt, flow in flows.items()]
+        with self._lock:
+            self._pending.extend(rows)
+        return rows
+
+    def forget(self, item_id, region):
+        with self._lock:
+            self._snapshots.pop((item_id, region), None)
+
+    def drain(self):
+        """Накопленные строки для db.add_lot_flow"""
+        with self._lock:
+            rows, self._pending = self._pending, []
+        return rows
+
+
+def flow_values(flow):
+    """sold (штук продано за период) и depth для правил из строки db.get_lot_flow"""
+    if flow is None:
+        return {}
+    return {'sold': flow[2], 'depth': flow[5]}
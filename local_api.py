@@ -0,0 +1,163 @@
+"""Локальный HTTP API только для чтения: цены, оповещения и история трекера.
+
+Другие программы получают результаты одного сканера без своих запросов к
+API Stalcraft. Сервер слушает только 127.0.0.1.
+
+    GET /prices                 последние минимальные цены отслеживаемых строк
+    GET /alerts                 последние оповещения (не больше MAX_ALERTS)
+    GET /history/<item_id>      ряд цен из базы: ?region=ru&since=&until=&bucket=3600&qlt=
+
+Ответы /prices и /alerts несут ETag (эпоха состояния и версия данных; эпоха
+новая при каждом запуске API, поэтому старый ETag не совпадёт с новым
+счётчиком). Версия растёт только при изменении данных. Запрос с If-None-Match
+и параметром wait=<секунды> ждёт изменения до wait секунд (long-poll):
+при изменении приходит новый ответ, иначе 304.
+"""
+import collections
+import hashlib
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+from api import DEFAULT_REGION
+from database import db
+
+MAX_ALERTS = 200
+MAX_WAIT = 300  # секунд
+
+
+class ApiState:
+    """Снимки для API; публикуются потоком GUI, читаются потоками сервера"""
+    def __init__(self):
+        self.changed = threading.Condition()
+        self.epoch = os.urandom(4).hex()
+        self.versions = {'prices': 0, 'alerts': 0}
+        self.prices = []
+        self.alerts = collections.deque(maxlen=MAX_ALERTS)
+
+    def etag(self, version):
+        return f'"{self.epoch}-{version}"'
+
+    def publish_prices(self, prices):
+        with self.changed:
+            # Те же цены не будят клиентов long-poll
+            if prices == self.prices:
+                return
+            self.prices = prices
+            self.versions['prices'] += 1
+            self.changed.notify_all()
+
+    def add_alert(self, alert):
+        with self.changed:
+            self.alerts.appendleft(alert)
+            self.versions['alerts'] += 1
+            self.changed.notify_all()
+
+    def snapshot(self, name, etag=None, wait=0):
+        """(версия, данные) ресурса; если версия совпадает с etag - ждать изменения до wait секунд"""
+        deadline = time.monotonic() + min(wait, MAX_WAIT)
+        with self.changed:
+            while etag == self.etag(self.versions[name]):
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                self.changed.wait(left)
+            data = self.prices if name == 'prices' else list(self.alerts)
+            return self.versions[name], data
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "StalcraftPriceTracker"
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            if url.path in ('/prices', '/alerts'):
+                self.send_versioned(url.path[1:], query)
+            elif url.path.startswith('/history/'):
+                self.send_history(unquote(url.path[len('/history/'):]), query)
+            else:
+                self.send_json(404, {'error': "Неизвестный путь", 'paths': ['/prices', '/alerts', '/history/<item_id>']})
+        except ValueError as e:
+            self.send_json(400, {'error': str(e)})
+
+    def do_POST(self):
+        self.send_json(405, {'error': "Только чтение"})
+
+    do_PUT = do_DELETE = do_PATCH = do_POST
+
+    def send_versioned(self, name, query):
+        etag = self.headers.get('If-None-Match')
+        wait = float(query.get('wait', 0))
+        state = self.server.state
+        version, data = state.snapshot(name, etag, wait)
+        if etag == state.etag(version):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self.send_json(200, {'version': version, name: data}, state.etag(version))
+
+    def send_history(self, item_id, query):
+        now = int(time.time())
+        since = int(query.get('since', now - 7 * 86400))
+        until = int(query.get('until', now + 1))
+        bucket = int(query['bucket']) if 'bucket' in query else None
+        qlt = int(query['qlt']) if 'qlt' in query else None
+        rows = db.get_price_series(item_id, since, until, qlt_filter=qlt, bucket=bucket,
+                                   region=query.get('region', DEFAULT_REGION))
+        columns = ('time', 'qlt', 'count', 'volume', 'turnover', 'min_price', 'max_price')
+        body = {'item_id': item_id, 'series': [dict(zip(columns, row)) for row in rows]}
+        # ETag по содержимому: база меняется и без публикации состояния
+        payload = self.encode(body)
+        etag = '"' + hashlib.sha1(payload).hexdigest() + '"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self.send_payload(200, payload, etag)
+
+    def encode(self, body):
+        return json.dumps(body, ensure_ascii=False).encode('utf-8')
+
+    def send_json(self, status, body, etag=None):
+        self.send_payload(status, self.encode(body), etag)
+
+    def send_payload(self, status, payload, etag=None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        if etag:
+            self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        # Без вывода каждого запроса в stderr
+        pass
+
+
+class LocalApiServer:
+    """HTTP-сервер в фоновом потоке"""
+    def __init__(self, state, port, host='127.0.0.1'):
+        self.httpd = ThreadingHTTPServer((host, port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.state = state
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="local-api", daemon=True)
+
+    @property
+    def port(self):
+        return self.httpd.server_address[1]
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
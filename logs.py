@@ -0,0 +1,195 @@
+"""Лог приложения: файл с ротацией через очередь и кольцевой буфер окна.
+
+Запись в файл не блокирует вызывающий поток: строка ставится в очередь
+(QueueHandler), файл пишет отдельный поток QueueListener. Файл
+переключается при превышении MAX_BYTES или со сменой суток, прошлые
+части сжимаются gzip (price_tracker.log.1.gz - самая свежая) и хранятся
+BACKUP_COUNT последних, так что лог прошлых запусков не теряется.
+
+Окно показывает последние VIEW_CAPACITY записей из кольцевого буфера
+(LogView): память не растёт при работе неделями, фильтр по уровню и
+предмету перестраивает вид из буфера.
+"""
+import collections
+import gzip
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import threading
+import time
+from collections import namedtuple
+
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QComboBox, QLineEdit, QPlainTextEdit, QLabel
+
+FILE_NAME = 'price_tracker.log'
+MAX_BYTES = 5 * 2 ** 20
+BACKUP_COUNT = 10
+# Ключ периода для ротации по времени: новый файл со сменой даты
+ROTATE_EVERY = '%Y-%m-%d'
+QUEUE_LIMIT = 10000
+VIEW_CAPACITY = 2000
+LOGGER = 'price_tracker'
+
+# Выгодные лоты и цены: между INFO и WARNING
+ALERT = 25
+logging.addLevelName(ALERT, 'ALERT')
+
+LEVELS = (("Все", logging.DEBUG), ("Сигналы и ошибки", ALERT),
+          ("Предупреждения и ошибки", logging.WARNING), ("Ошибки", logging.ERROR))
+
+# Большинство вызовов log_message уровень не передают - он определяется по началу
+ERROR_PREFIXES = ('Ошибка', 'ОШИБКА', 'Не удалось')
+ALERT_PREFIXES = ('🚀', '💰', '📉')
+
+LogEntry = namedtuple('LogEntry', 'time level item_id text')
+
+
+def guess_level(message):
+    if message.startswith(ERROR_PREFIXES):
+        return logging.ERROR
+    if message.startswith(ALERT_PREFIXES):
+        return ALERT
+    return logging.INFO
+
+
+def compress(source, dest):
+    """rotator: прошлая часть лога сжимается при ротации (в потоке записи)"""
+    with open(source, 'rb') as src, gzip.open(dest, 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+
+class RotatingLogHandler(logging.handlers.RotatingFileHandler):
+    """Ротация по размеру и по смене периода ROTATE_EVERY, части сжаты gzip"""
+    def __init__(self, path, max_bytes=MAX_BYTES, backup_count=BACKUP_COUNT, rotate_every=ROTATE_EVERY):
+        super().__init__(path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8', delay=True)
+        self.rotate_every = rotate_every
+        self.namer = lambda name: name + '.gz'
+        self.rotator = compress
+        # Файл прошлого запуска относится к периоду своей последней записи
+        try:
+            self.period = time.strftime(rotate_every, time.localtime(os.path.getmtime(path)))
+        except OSError:
+            self.period = time.strftime(rotate_every)
+
+    def shouldRollover(self, record):
+        period = time.strftime(self.rotate_every)
+        if period != self.period:
+            self.period = period
+            if os.path.exists(self.baseFilename) and os.path.getsize(self.baseFilename) > 0:
+                return True
+        return super().shouldRollover(record)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """При переполненной очереди (диск не успевает) строка отбрасывается, а не копится"""
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class FileLog:
+    """Файл лога: write() из любого потока, запись и ротация - в потоке QueueListener.
+
+    После close() write() ничего не делает: поздние сигналы потоков при
+    выходе не уходят в logging.lastResort (stderr).
+    """
+    def __init__(self, path, max_bytes=MAX_BYTES, backup_count=BACKUP_COUNT, rotate_every=ROTATE_EVERY):
+        self.path = path
+        self.handler = RotatingLogHandler(path, max_bytes, backup_count, rotate_every)
+        self.handler.setFormatter(logging.Formatter('[%(asctime)s] %(levelname)s %(message)s', '%Y-%m-%d %H:%M:%S'))
+        self.queue_handler = DroppingQueueHandler(queue.Queue(QUEUE_LIMIT))
+        self.logger = logging.getLogger(LOGGER)
+        self.logger.setLevel(logging.DEBUG)
+        self.logger.propagate = False
+        self.logger.addHandler(self.queue_handler)
+        self.listener = logging.handlers.QueueListener(self.queue_handler.queue, self.handler)
+        self.listener.start()
+        self.lock = threading.Lock()
+        self.closed = False
+
+    @property
+    def dropped(self):
+        return self.queue_handler.dropped
+
+    def write(self, level, message):
+        with self.lock:
+            if not self.closed:
+                self.logger.log(level, message)
+
+    def close(self):
+        """Дописать очередь и закрыть файл"""
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.logger.removeHandler(self.queue_handler)
+        self.listener.stop()
+        self.handler.close()
+
+
+def matches(entry, min_level, item_filter):
+    """Фильтр окна: уровень не ниже min_level; предмет - точный item_id или часть текста"""
+    if entry.level < min_level:
+        return False
+    if not item_filter:
+        return True
+    return entry.item_id == item_filter or item_filter.lower() in entry.text.lower()
+
+
+def format_entry(entry):
+    return f"[{time.strftime('%H:%M:%S', time.localtime(entry.time))}] {entry.text}"
+
+
+class LogView(QWidget):
+    """Последние capacity записей лога с фильтром по уровню и предмету"""
+    def __init__(self, capacity=VIEW_CAPACITY, parent=None):
+        super().__init__(parent)
+        self.entries = collections.deque(maxlen=capacity)
+
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        filter_layout = QHBoxLayout()
+        filter_layout.addWidget(QLabel("Лог:"))
+        filter_layout.addStretch()
+        self.level_combo = QComboBox()
+        for name, level in LEVELS:
+            self.level_combo.addItem(name, level)
+        self.level_combo.currentIndexChanged.connect(self.refilter)
+        filter_layout.addWidget(self.level_combo)
+        self.item_filter = QLineEdit()
+        self.item_filter.setPlaceholderText("Предмет или текст")
+        self.item_filter.setClearButtonEnabled(True)
+        self.item_filter.textChanged.connect(self.refilter)
+        filter_layout.addWidget(self.item_filter)
+        layout.addLayout(filter_layout)
+
+        # Документ тоже ограничен: старые блоки удаляются самим Qt
+        self.text = QPlainTextEdit()
+        self.text.setReadOnly(True)
+        self.text.setMaximumBlockCount(capacity)
+        self.text.setMaximumHeight(150)
+        layout.addWidget(self.text)
+        self.setLayout(layout)
+
+    def filters(self):
+        return self.level_combo.currentData(), self.item_filter.text().strip()
+
+    def append(self, entry):
+        self.entries.append(entry)
+        if matches(entry, *self.filters()):
+            self.text.appendPlainText(format_entry(entry))
+
+    def refilter(self):
+        min_level, item_filter = self.filters()
+        self.text.setPlainText('\n'.join(format_entry(entry) for entry in self.entries
+                                         if matches(entry, min_level, item_filter)))
+        self.text.verticalScrollBar().setValue(self.text.verticalScrollBar().maximum())
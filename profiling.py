@@ -0,0 +1,222 @@
+"""Профилирование: постоянные таймеры горячих мест и сэмплирующий профайлер.
+
+Таймеры (timers) включены всегда: замер - два вызова perf_counter и
+короткая блокировка, по каждому месту хранятся число вызовов, сумма,
+максимум и последние RECENT длительностей для p95.
+
+SamplingProfiler раз в interval секунд снимает стеки всех потоков
+процесса (sys._current_frames), включая потоки QThreadPool и пулов
+запросов, и копит одинаковые стеки. Результат - collapsed-стеки
+(flamegraph.pl, speedscope) и файл speedscope JSON по потокам. Профиль
+по времени "на стене": ожидание сети и блокировок тоже видно.
+"""
+import collections
+import functools
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+DIRECTORY = 'profiles'
+DEFAULT_INTERVAL = 0.005
+MAX_DEPTH = 128
+RECENT = 256
+
+
+class TimerStat:
+    __slots__ = ('count', 'total', 'max', 'recent')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = collections.deque(maxlen=RECENT)
+
+
+class _Measure:
+    __slots__ = ('timers', 'name', 'started')
+
+    def __init__(self, timers, name):
+        self.timers = timers
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timers.add(self.name, time.perf_counter() - self.started)
+        return False
+
+
+class Timers:
+    """Потокобезопасная сводка длительностей по именам мест"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def add(self, name, seconds):
+        with self._lock:
+            stat = self._stats.get(name)
+            if stat is None:
+                stat = self._stats[name] = TimerStat()
+            stat.count += 1
+            stat.total += seconds
+            if seconds > stat.max:
+                stat.max = seconds
+            stat.recent.append(seconds)
+
+    def measure(self, name):
+        """with timers.measure('scan.rules'): ..."""
+        return _Measure(self, name)
+
+    def timed(self, name):
+        """Декоратор: замер каждого вызова функции"""
+        def decorate(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.add(name, time.perf_counter() - started)
+            return wrapper
+        return decorate
+
+    def snapshot(self):
+        """[(имя, вызовов, среднее, p95 последних, максимум, сумма)] по убыванию суммы"""
+        with self._lock:
+            items = [(name, stat.count, stat.total, stat.max, sorted(stat.recent)) for name, stat in self._stats.items()]
+        rows = []
+        for name, count, total, longest, recent in items:
+            p95 = recent[min(int(len(recent) * 0.95), len(recent) - 1)] if recent else 0.0
+            rows.append((name, count, total / count if count else 0.0, p95, longest, total))
+        return sorted(rows, key=lambda row: row[5], reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+timers = Timers()
+measure = timers.measure
+timed = timers.timed
+
+
+def thread_group(name):
+    """Имя потока без номера: потоки одного пула сливаются в один корень"""
+    if name is None or name.startswith('Dummy-'):
+        # Потоки QThreadPool не созданы модулем threading
+        return 'qt-pool'
+    return re.sub(r'[_-]\d+$', '', name) or name
+
+
+class SamplingProfiler:
+    """Периодические снимки стеков всех потоков процесса"""
+    def __init__(self, interval=DEFAULT_INTERVAL, max_depth=MAX_DEPTH):
+        self.interval = interval
+        self.max_depth = max_depth
+        # (поток, ((функция, файл, строка), ...)) -> число снимков
+        self.counts = collections.Counter()
+        self.samples = 0
+        self.started = None
+        self.elapsed = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        self._stop.clear()
+        self.started = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="profiler-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.elapsed += time.monotonic() - self.started
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self.sample(exclude=own)
+
+    def sample(self, exclude=None):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == exclude:
+                continue
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                code = frame.f_code
+                stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                frame = frame.f_back
+            stack.reverse()
+            self.counts[(thread_group(names.get(ident)), tuple(stack))] += 1
+        self.samples += 1
+
+    @staticmethod
+    def frame_label(frame):
+        name, filename, line = frame
+        return f"{name} ({os.path.basename(filename)}:{line})"
+
+    def collapsed(self):
+        """Строки 'поток;кадр;кадр N' - формат flamegraph.pl"""
+        lines = []
+        for (thread, stack), count in self.counts.most_common():
+            # ';' - разделитель кадров в этом формате
+            path = ';'.join([thread] + [self.frame_label(frame).replace(';', ',') for frame in stack])
+            lines.append(f"{path} {count}")
+        return lines
+
+    def write_collapsed(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(self.collapsed()) + '\n')
+
+    def write_speedscope(self, path, name="price tracker"):
+        """Файл для https://www.speedscope.app: по профилю на группу потоков"""
+        index = {}
+        shared = []
+        profiles = {}
+        for (thread, stack), count in self.counts.items():
+            ids = []
+            for frame in stack:
+                if frame not in index:
+                    index[frame] = len(shared)
+                    shared.append({'name': frame[0], 'file': frame[1], 'line': frame[2]})
+                ids.append(index[frame])
+            profile = profiles.setdefault(thread, {'samples': [], 'weights': []})
+            profile['samples'].append(ids)
+            profile['weights'].append(count * self.interval)
+        document = {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'name': name,
+            'exporter': 'stalcraft-price-tracker',
+            'activeProfileIndex': 0,
+            'shared': {'frames': shared},
+            'profiles': [{
+                'type': 'sampled', 'name': thread, 'unit': 'seconds',
+                'startValue': 0, 'endValue': sum(profile['weights']),
+                'samples': profile['samples'], 'weights': profile['weights'],
+            } for thread, profile in sorted(profiles.items())],
+        }
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(document, f)
+
+    def save(self, directory, prefix='profile'):
+        """Записать оба формата; возвращает пути (collapsed, speedscope)"""
+        os.makedirs(directory, exist_ok=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        base = os.path.join(directory, f"{prefix}-{stamp}")
+        self.write_collapsed(base + '.collapsed.txt')
+        self.write_speedscope(base + '.speedscope.json')
+        return base + '.collapsed.txt', base + '.speedscope.json'
@@ -0,0 +1,323 @@
+"""Правила оповещений: маленький язык условий над лотами.
+
+Правило хранится текстом в tracked_items.alert_rule, компилируется один раз
+и вычисляется векторно (NumPy) сразу над всеми лотами предмета.
+
+Поля лота: price (цена выкупа), unit (цена за штуку), amount, qlt,
+ends_in (секунд до окончания), position (место в списке по цене).
+Значения строки: target (моя цена), threshold (порог поиска стаков),
+min (минимальная цена выкупа нужной редкости), mean и sigma (недавняя
+норма цены за штуку и её разброс по потоковой статистике сделок), median
+(потоковая оценка медианы), sold и depth (штук продано за сутки по
+исчезнувшим лотам и штук около минимальной цены), pN(период) - N-й
+перцентиль цены за штуку в истории, vwap(период) - средневзвешенная цена.
+Длительности: 30m, 12h, 7d (число без суффикса - секунды).
+
+Примеры:
+    unit <= p10(7d) and amount >= 5
+    unit < mean - 2 * sigma
+    unit <= target and sold >= amount
+    qlt in {3, 4} and unit < vwap(7d) * 0.8
+    ends_in < 30m and price <= target
+
+Если правило не упоминает qlt, проверяются только лоты редкости строки.
+"""
+import datetime
+import functools
+import re
+import time
+
+import numpy as np
+
+import stats
+
+LOT_FIELDS = ('price', 'unit', 'amount', 'qlt', 'ends_in', 'position')
+ROW_VALUES = ('target', 'threshold', 'min')
+STATS_VALUES = ('mean', 'sigma', 'median')
+FLOW_VALUES = ('sold', 'depth')
+DURATIONS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+# Поиск выгодных стаков, как он работал до правил
+STACK_RULE = 'amount > 1 and threshold > 0 and unit <= threshold'
+
+_TOKEN = re.compile(r'\s*(?:(\d+(?:\.\d+)?)([smhd])?(?![\w.])|(<=|>=|==|!=|<|>|[-+*/(){},])|([A-Za-z_]\w*))')
+_COMPARE = {
+    '<': np.less, '<=': np.less_equal, '>': np.greater, '>=': np.greater_equal,
+    '==': np.equal, '!=': np.not_equal,
+}
+
+
+class RuleError(ValueError):
+    """Ошибка в тексте правила"""
+
+
+class LotBatch:
+    """Столбцы лотов предмета; столбцы вычисляются при первом обращении"""
+    def __init__(self, lots, now=None):
+        self.lots = lots
+        self.size = len(lots)
+        self.now = now if now is not None else time.time()
+        self._columns = {}
+
+    def column(self, name):
+        values = self._columns.get(name)
+        if values is None:
+            values = self._columns[name] = getattr(self, '_' + name)()
+        return values
+
+    def _ints(self, getter):
+        return np.fromiter((getter(lot) for lot in self.lots), dtype=np.int64, count=self.size)
+
+    def _price(self):
+        return self._ints(lambda lot: lot.get('buyoutPrice', 0))
+
+    def _amount(self):
+        return self._ints(lambda lot: lot.get('amount', 1))
+
+    def _unit(self):
+        return self.column('price') // np.maximum(self.column('amount'), 1)
+
+    def _qlt(self):
+        return self._ints(lambda lot: (lot.get('additional') or {}).get('qlt', 0))
+
+    def _position(self):
+        return np.arange(self.size, dtype=np.int64)
+
+    def _ends_in(self):
+        return np.fromiter((_timestamp(lot.get('endTime')) - self.now for lot in self.lots),
+                           dtype=np.float64, count=self.size)
+
+
+def _timestamp(value):
+    if not value:
+        return float('inf')
+    try:
+        return datetime.datetime.fromisoformat(str(value).replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        return float('inf')
+
+
+class Rule:
+    """Скомпилированное правило.
+
+    references - значения истории, нужные правилу: ('p', N, секунды) или
+    ('vwap', None, секунды); их передаёт вызывающий в matches().
+    """
+    def __init__(self, text, evaluate, fields, references, uses_stats=False, uses_flow=False):
+        self.text = text
+        self._evaluate = evaluate
+        self.fields = frozenset(fields)
+        self.references = frozenset(references)
+        self.uses_stats = uses_stats
+        self.uses_flow = uses_flow
+
+    def matches(self, batch, rarity, values):
+        """Позиции подходящих лотов. values - {'target', 'threshold', 'min', ссылки истории}"""
+        if not batch.size:
+            return np.empty(0, dtype=np.int64)
+        mask = np.broadcast_to(self._evaluate(batch, values), (batch.size,))
+        # Лоты без цены выкупа не покупаются
+        mask = mask & (batch.column('price') > 0)
+        if 'qlt' not in self.fields:
+            mask = mask & (batch.column('qlt') == rarity)
+        return np.flatnonzero(mask)
+
+    def __repr__(self):
+        return f'Rule({self.text!r})'
+
+
+class _Parser:
+    """Рекурсивный спуск: or -> and -> not -> сравнение -> сумма -> произведение -> атом"""
+    def __init__(self, text):
+        self.tokens = self._tokenize(text)
+        self.pos = 0
+        self.fields = set()
+        self.references = set()
+        self.uses_stats = False
+        self.uses_flow = False
+
+    @staticmethod
+    def _tokenize(text):
+        tokens = []
+        pos = 0
+        text = text.strip()
+        while pos < len(text):
+            match = _TOKEN.match(text, pos)
+            if not match:
+                raise RuleError(f"Непонятный символ в позиции {pos + 1}: {text[pos:pos + 10]!r}")
+            number, unit, op, name = match.groups()
+            if number is not None:
+                tokens.append(('num', float(number) * DURATIONS.get(unit, 1)))
+            elif op is not None:
+                tokens.append(('op', op))
+            else:
+                tokens.append(('name', name.lower()))
+            pos = match.end()
+        return tokens
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def take(self, kind=None, value=None):
+        token = self.peek()
+        if token[0] is None or (kind and token[0] != kind) or (value and token[1] != value):
+            expected = value or kind or "выражение"
+            raise RuleError(f"Ожидалось {expected}, получено {token[1] if token[0] else 'конец правила'}")
+        self.pos += 1
+        return token
+
+    def parse(self):
+        if not self.tokens:
+            raise RuleError("Пустое правило")
+        node = self.parse_or()
+        if self.pos != len(self.tokens):
+            raise RuleError(f"Лишнее в конце правила: {self.peek()[1]}")
+        return node
+
+    def parse_or(self):
+        node = self.parse_and()
+        while self.peek() == ('name', 'or'):
+            self.take()
+            left, right = node, self.parse_and()
+            node = lambda b, v, l=left, r=right: np.logical_or(l(b, v), r(b, v))
+        return node
+
+    def parse_and(self):
+        node = self.parse_not()
+        while self.peek() == ('name', 'and'):
+            self.take()
+            left, right = node, self.parse_not()
+            node = lambda b, v, l=left, r=right: np.logical_and(l(b, v), r(b, v))
+        return node
+
+    def parse_not(self):
+        if self.peek() == ('name', 'not'):
+            self.take()
+            inner = self.parse_not()
+            return lambda b, v: np.logical_not(inner(b, v))
+        return self.parse_compare()
+
+    def parse_compare(self):
+        if self.peek() == ('op', '('):
+            # Скобки вокруг логического выражения; если за ними идёт
+            # арифметика или сравнение - это скобки внутри произведения
+            start = self.pos
+            try:
+                self.take()
+                node = self.parse_or()
+                self.take('op', ')')
+                if self.peek() not in (('name', 'in'), ('op', '+'), ('op', '-'), ('op', '*'), ('op', '/')) and \
+                        (self.peek()[0] != 'op' or self.peek()[1] not in _COMPARE):
+                    return node
+            except RuleError:
+                pass
+            self.pos = start
+        left = self.parse_sum()
+        kind, value = self.peek()
+        if kind == 'name' and value == 'in':
+            self.take()
+            members = self.parse_set()
+            return lambda b, v: np.isin(left(b, v), members)
+        if kind == 'op' and value in _COMPARE:
+            self.take()
+            compare = _COMPARE[value]
+            right = self.parse_sum()
+            return lambda b, v: compare(left(b, v), right(b, v))
+        raise RuleError(f"Ожидалось сравнение, получено {value if kind else 'конец правила'}")
+
+    def parse_set(self):
+        self.take('op', '{')
+        members = [self.take('num')[1]]
+        while self.peek() == ('op', ','):
+            self.take()
+            members.append(self.take('num')[1])
+        self.take('op', '}')
+        return np.array(members)
+
+    def parse_sum(self):
+        node = self.parse_product()
+        while self.peek() in (('op', '+'), ('op', '-')):
+            op = self.take()[1]
+            left, right = node, self.parse_product()
+            if op == '+':
+                node = lambda b, v, l=left, r=right: np.add(l(b, v), r(b, v))
+            else:
+                node = lambda b, v, l=left, r=right: np.subtract(l(b, v), r(b, v))
+        return node
+
+    def parse_product(self):
+        node = self.parse_atom()
+        while self.peek() in (('op', '*'), ('op', '/')):
+            op = self.take()[1]
+            left, right = node, self.parse_atom()
+            if op == '*':
+                node = lambda b, v, l=left, r=right: np.multiply(l(b, v), r(b, v))
+            else:
+                node = lambda b, v, l=left, r=right: np.true_divide(l(b, v), r(b, v))
+        return node
+
+    def parse_atom(self):
+        kind, value = self.take()
+        if kind == 'num':
+            return lambda b, v: value
+        if kind == 'op' and value == '-':
+            inner = self.parse_atom()
+            return lambda b, v: np.negative(inner(b, v))
+        if kind == 'op' and value == '(':
+            node = self.parse_sum()
+            self.take('op', ')')
+            return node
+        if kind != 'name':
+            raise RuleError(f"Неожиданное {value}")
+        if value in LOT_FIELDS:
+            self.fields.add(value)
+            return lambda b, v: b.column(value)
+        if value in ROW_VALUES:
+            return lambda b, v: v[value]
+        if value in STATS_VALUES:
+            self.uses_stats = True
+            return lambda b, v: v.get(value, np.nan)
+        if value in FLOW_VALUES:
+            self.uses_flow = True
+            return lambda b, v: v.get(value, np.nan)
+        percentile = re.fullmatch(r'p(\d{1,2})', value)
+        if percentile or value == 'vwap':
+            self.take('op', '(')
+            seconds = int(self.take('num')[1])
+            self.take('op', ')')
+            key = ('p', int(percentile.group(1)), seconds) if percentile else ('vwap', None, seconds)
+            self.references.add(key)
+            return lambda b, v: v.get(key, np.nan)
+        raise RuleError(f"Неизвестное имя: {value}")
+
+
+@functools.lru_cache(maxsize=256)
+def compile_rule(text):
+    """Разобрать текст правила; результат кешируется по тексту"""
+    parser = _Parser(text)
+    evaluate = parser.parse()
+    return Rule(text.strip(), evaluate, parser.fields, parser.references, parser.uses_stats, parser.uses_flow)
+
+
+def stats_values(price_stats):
+    """mean, sigma и median из stats.PriceStats строки (пусто, пока сделок мало)"""
+    if price_stats is None or price_stats.count < stats.MIN_SAMPLES:
+        return {}
+    return {'mean': price_stats.ewma, 'sigma': price_stats.ew_std, 'median': price_stats.quantile(0.5)}
+
+
+def history_values(rule, item_id, rarity, region, db, now=None):
+    """Значения истории для ссылок правила: {('p', 10, 604800): цена, ...}"""
+    now = int(now if now is not None else time.time())
+    values = {}
+    for key in rule.references:
+        kind, pct, seconds = key
+        if kind == 'p':
+            prices = db.get_unit_prices(item_id, now - seconds, rarity, region=region)
+            if prices:
+                values[key] = float(np.percentile(np.fromiter(prices, dtype=np.float64, count=len(prices)), pct))
+        else:
+            reference = db.get_reference_prices(item_id, now - seconds, now, region=region).get(rarity)
+            if reference:
+                values[key] = reference
+    return values
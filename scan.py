@@ -0,0 +1,175 @@
+"""Циклы проверки цен: отмена, дедлайн и учёт незавершённых задач"""
+import itertools
+import threading
+import time
+from collections import namedtuple
+
+import api
+
+# Снимок строки таблицы на момент запуска цикла; рабочие потоки читают
+# только его и никогда не обращаются к виджетам. rule - скомпилированное
+# правило оповещения строки (rules.Rule) или None
+ScanTarget = namedtuple('ScanTarget', 'row_id item_id rarity threshold mode region rule')
+# Режим поиска, общий для всех строк цикла; anomaly_sigma - порог оповещения
+# о цене ниже нормы в сигмах (0 - выключено)
+ScanMode = namedtuple('ScanMode', 'enable_stacks enable_percentage percentage anomaly_sigma')
+
+
+class ScanCancelled(Exception):
+    """Задача отменена (остановка, удаление строки или истёк дедлайн цикла)"""
+
+
+class CancelToken:
+    """Флаг отмены; отмена родителя отменяет и дочерние токены"""
+    def __init__(self, parent=None, deadline=None):
+        self._event = threading.Event()
+        self.parent = parent
+        self.deadline = deadline
+
+    def cancel(self):
+        self._event.set()
+
+    def cancel_requested(self):
+        """Отменён явно (а не по дедлайну)"""
+        return self._event.is_set() or (self.parent is not None and self.parent.cancel_requested())
+
+    def is_cancelled(self):
+        if self._event.is_set():
+            return True
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            return True
+        return self.parent is not None and self.parent.is_cancelled()
+
+    def check(self):
+        if self.is_cancelled():
+            raise ScanCancelled()
+
+    def sleep(self, seconds):
+        """Пауза, прерываемая отменой"""
+        end = time.monotonic() + seconds
+        while not self.is_cancelled():
+            left = end - time.monotonic()
+            if left <= 0:
+                return
+            self._event.wait(min(left, 0.25))
+        raise ScanCancelled()
+
+
+class MinAccumulator:
+    """Потокобезопасный учёт минимальной цены и числа лотов по строкам.
+
+    Кроме цены лота целиком хранится минимальная цена за штуку (unit) -
+    её получает сводка по предметам наравне с минимумами скринера.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._mins = {}
+        self._lots = {}
+        self._units = {}
+        self._dropped = set()
+
+    def offer(self, row_id, price, lots=0, unit=None):
+        with self._lock:
+            if row_id in self._dropped:
+                return
+            current = self._mins.get(row_id)
+            if current is None or price < current:
+                self._mins[row_id] = price
+                self._lots[row_id] = lots
+            if unit is not None and (row_id not in self._units or unit < self._units[row_id]):
+                self._units[row_id] = unit
+
+    def discard(self, row_id):
+        """Забыть строку; последующие цены для неё игнорируются"""
+        with self._lock:
+            self._dropped.add(row_id)
+            self._mins.pop(row_id, None)
+            self._lots.pop(row_id, None)
+            self._units.pop(row_id, None)
+
+    def items(self):
+        """Строки (row_id, минимальная цена, число лотов)"""
+        with self._lock:
+            return [(row_id, price, self._lots[row_id]) for row_id, price in self._mins.items()]
+
+    def unit_floors(self):
+        """{row_id: минимальная цена за штуку}"""
+        with self._lock:
+            return dict(self._units)
+
+
+def interleave_regions(targets):
+    """Чередовать строки разных регионов, чтобы очередь пула не выстраивала
+    задачи одного региона подряд за задачами другого"""
+    by_region = {}
+    for target in targets:
+        by_region.setdefault(target.region, []).append(target)
+    return [target for group in itertools.zip_longest(*by_region.values()) for target in group if target is not None]
+
+
+class ScanCycle:
+    """Один цикл проверки: неизменяемый снимок строк, токены отмены и минимумы.
+
+    limiters - ограничители частоты по регионам ({регион: RateLimiter}).
+    У цикла свой бюджет повторов: сбой API не растягивает цикл на все
+    оставшиеся запросы. clock - время, по которому судят лоты (ends_in,
+    исчезновения, часы счётчиков); воспроизведение архива подставляет
+    время архивного ответа.
+    """
+    _ids = itertools.count(1)
+
+    def __init__(self, targets, api_token, deadline_seconds, limiters, clock=time.time):
+        self.id = next(self._ids)
+        self.clock = clock
+        self.started = time.monotonic()
+        self.targets = tuple(interleave_regions(targets))
+        self.regions = tuple(sorted({target.region for target in self.targets}))
+        self.limiters = dict(limiters)
+        self.api_token = api_token
+        self.token = CancelToken(deadline=self.started + deadline_seconds)
+        self.row_tokens = {target.row_id: CancelToken(parent=self.token) for target in self.targets}
+        self.mins = MinAccumulator()
+        self.retry_budget = api.RetryBudget()
+        self._reported = set()
+        self._report_lock = threading.Lock()
+        self.total = len(self.targets)
+        # Счётчик меняется только в потоке GUI
+        self.pending = self.total
+
+    def job_finished(self):
+        self.pending -= 1
+        return self.pending == 0
+
+    def cancel(self):
+        self.token.cancel()
+
+    def report_once(self, key):
+        """True при первом обращении с key за цикл - одна запись в лог о сбое, а не по строке"""
+        with self._report_lock:
+            if key in self._reported:
+                return False
+            self._reported.add(key)
+            return True
+
+    def cancel_row(self, row_id):
+        token = self.row_tokens.get(row_id)
+        if token is not None:
+            token.cancel()
+        self.mins.discard(row_id)
+
+    def is_row_cancelled(self, row_id):
+        token = self.row_tokens.get(row_id)
+        return token is None or token.is_cancelled()
+
+    @property
+    def stopped(self):
+        """Цикл остановлен пользователем - его результаты не применяются"""
+        return self.token.cancel_requested()
+
+    @property
+    def finished(self):
+        return self.pending == 0
+
+    def busy_share(self):
+        """Доля задач цикла, которые ещё не завершены"""
+        return self.pending / self.total if self.total else 0.0
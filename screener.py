@@ -0,0 +1,139 @@
+"""Скринер каталога: поиск предметов, чей минимальный лот заметно ниже исторической цены"""
+import heapq
+import time
+from collections import namedtuple
+
+import api
+from database import db
+
+# discount - доля ниже исторической цены (0.25 = на 25% дешевле)
+Candidate = namedtuple('Candidate', 'discount item_id qlt floor reference lots')
+
+DAY = 86400
+
+
+def catalog_types(catalog):
+    """Верхние категории каталога ('weapon/pistol' -> 'weapon')"""
+    return sorted({item_type.split('/')[0] for item_type in set(catalog.types)} - {'', 'None'})
+
+
+def catalog_colors(catalog):
+    return sorted(set(catalog.colors) - {''})
+
+
+def filter_catalog(catalog, item_type=None, color=None, metric_ids=None, require_metric=True):
+    """Отобрать item_id из каталога (catalog.Catalog) по категории, цвету и auctionItemsMetricId"""
+    selected = []
+    for item_id, entry_type, entry_color, metric_id in zip(catalog.ids, catalog.types, catalog.colors, catalog.metric_ids):
+        if require_metric and not metric_id:
+            continue
+        if metric_ids and metric_id not in metric_ids:
+            continue
+        if item_type and entry_type.split('/')[0] != item_type:
+            continue
+        if color and entry_color != color:
+            continue
+        selected.append(item_id)
+    return selected
+
+
+class CatalogScreener:
+    """Обход части каталога с ограничением частоты запросов.
+
+    На предмет тратится один запрос лотов и, если локальной истории нет,
+    один запрос истории. В памяти держится только куча из top_k лучших.
+    """
+    def __init__(self, token, limiter, top_k=50, reference_days=7, min_discount=0.05,
+                 fetch_missing_history=True, max_requests=None, region=api.DEFAULT_REGION):
+        self.token = token
+        self.region = region
+        self.limiter = limiter
+        self.top_k = top_k
+        self.reference_days = reference_days
+        self.min_discount = min_discount
+        self.fetch_missing_history = fetch_missing_history
+        self.max_requests = max_requests
+        self.requests_made = 0
+        self.errors = 0
+        self.heap = []
+
+    def estimate_seconds(self, item_count):
+        """Оценка длительности обхода при полном расходе лимита"""
+        requests_needed = item_count * (2 if self.fetch_missing_history else 1)
+        if self.max_requests:
+            requests_needed = min(requests_needed, self.max_requests)
+        return requests_needed / self.limiter.rate
+
+    def results(self):
+        return sorted(self.heap, reverse=True)
+
+    def sweep(self, item_ids, progress=None, cancelled=None):
+        for done, item_id in enumerate(item_ids, 1):
+            if cancelled is not None and cancelled():
+                break
+            if self.max_requests and self.requests_made >= self.max_requests:
+                break
+            try:
+                self.check_item(item_id, cancelled)
+            except api.RequestCancelled:
+                break
+            except api.ApiError as e:
+                self.errors += 1
+                # API недоступен - дальше обход только тратил бы время
+                if e.kind == api.CIRCUIT_OPEN:
+                    break
+            if progress is not None:
+                progress(done, len(item_ids))
+        return self.results()
+
+    def _get(self, url, kind, cancelled, **kwargs):
+        self.requests_made += 1
+        response = api.executor().get(url, headers=api.auth_headers(self.token), endpoint=(self.region, kind),
+                                      limiter=self.limiter, cancelled=cancelled, **kwargs)
+        return response.json()
+
+    def check_item(self, item_id, cancelled=None):
+        data = self._get(api.lots_url(item_id, region=self.region), 'lots', cancelled)
+        if not data:
+            return
+
+        # Минимальная цена за штуку по редкостям
+        floors = {}
+        counts = {}
+        for lot in data.get('lots', []):
+            buyout_price = lot.get('buyoutPrice', 0)
+            if buyout_price <= 0:
+                continue
+            qlt = (lot.get('additional') or {}).get('qlt', 0)
+            unit_price = buyout_price // max(lot.get('amount', 1), 1)
+            counts[qlt] = counts.get(qlt, 0) + 1
+            if qlt not in floors or unit_price < floors[qlt]:
+                floors[qlt] = unit_price
+        if not floors:
+            return
+        # Минимумы каталога попадают в сводку для обзора категорий
+        now = int(time.time())
+        db.record_floors([(self.region, item_id, qlt, floor, counts[qlt], now) for qlt, floor in floors.items()])
+
+        since = now - self.reference_days * DAY
+        references = db.get_reference_prices(item_id, since, region=self.region)
+        if not references and self.fetch_missing_history and \
+                (not self.max_requests or self.requests_made < self.max_requests):
+            history = self._get(api.history_url(item_id, self.region), 'history', cancelled,
+                                params={"limit": api.HISTORY_PAGE_LIMIT, "offset": 0, "additional": "true"})
+            if history and history.get('prices'):
+                db.add_price_history(item_id, history['prices'], self.region)
+                references = db.get_reference_prices(item_id, since, region=self.region)
+
+        for qlt, floor in floors.items():
+            reference = references.get(qlt)
+            if not reference:
+                continue
+            discount = 1 - floor / reference
+            if discount < self.min_discount:
+                continue
+            candidate = Candidate(discount, item_id, qlt, floor, int(reference), counts[qlt])
+            if len(self.heap) < self.top_k:
+                heapq.heappush(self.heap, candidate)
+            else:
+                heapq.heappushpop(self.heap, candidate)
@@ -0,0 +1,167 @@
+"""Потоковая статистика цен за штуку по (предмет, регион, редкость).
+
+Каждая сделка обновляет оценки за O(1), без повторного чтения истории:
+    Welford  - среднее и дисперсия за всё время
+    EWMA     - экспоненциально сглаженные среднее и дисперсия (недавняя "норма")
+    P²       - оценки квантилей QUANTILES по пяти маркерам (Jain, Chlamtac)
+
+Состояние сериализуется в STATE_SIZE байт и хранится в таблице price_stats.
+"""
+import math
+import struct
+
+QUANTILES = (0.1, 0.5, 0.9)
+# Вес новой сделки в EWMA: память ~ 1 / alpha сделок
+EWMA_ALPHA = 0.05
+# Меньше сделок - оценки считаются ненадёжными, аномалии не ищутся
+MIN_SAMPLES = 30
+
+_HEADER = struct.Struct('<qqdddd')  # count, last_time, mean, m2, ewma, ewvar
+_MARKERS = struct.Struct('<5d5d')   # высоты и позиции маркеров P²
+STATE_SIZE = _HEADER.size + _MARKERS.size * len(QUANTILES)
+
+
+class P2Quantile:
+    """Оценка одного квантиля алгоритмом P²: пять маркеров вместо выборки"""
+    def __init__(self, p):
+        self.p = p
+        self.heights = []
+        self.positions = [1.0, 2.0, 3.0, 4.0, 5.0]
+        self.increments = (0.0, p / 2, p, (1 + p) / 2, 1.0)
+
+    def add(self, x, count):
+        """Добавить наблюдение; count - число наблюдений вместе с этим"""
+        heights = self.heights
+        if count <= 5:
+            heights.append(x)
+            heights.sort()
+            return
+        if x < heights[0]:
+            heights[0] = x
+            k = 0
+        elif x >= heights[4]:
+            heights[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= heights[k + 1]:
+                k += 1
+        positions = self.positions
+        for i in range(k + 1, 5):
+            positions[i] += 1
+        # Желаемые позиции маркеров зависят только от числа наблюдений
+        for i in (1, 2, 3):
+            desired = 1 + (count - 1) * self.increments[i]
+            d = desired - positions[i]
+            if (d >= 1 and positions[i + 1] - positions[i] > 1) or (d <= -1 and positions[i - 1] - positions[i] < -1):
+                d = 1.0 if d > 0 else -1.0
+                height = self._parabolic(i, d)
+                if not heights[i - 1] < height < heights[i + 1]:
+                    j = i + int(d)
+                    height = heights[i] + d * (heights[j] - heights[i]) / (positions[j] - positions[i])
+                heights[i] = height
+                positions[i] += d
+
+    def _parabolic(self, i, d):
+        q, n = self.heights, self.positions
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+
+    def value(self):
+        heights = self.heights
+        if not heights:
+            return math.nan
+        if len(heights) < 5:
+            return heights[min(int(self.p * len(heights)), len(heights) - 1)]
+        return heights[2]
+
+
+class PriceStats:
+    """Оценки распределения цены за штуку одного ряда"""
+    def __init__(self):
+        self.count = 0
+        self.last_time = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.ewma = 0.0
+        self.ewvar = 0.0
+        self.quantiles = [P2Quantile(p) for p in QUANTILES]
+
+    def add(self, value, time=0):
+        value = float(value)
+        self.count += 1
+        self.last_time = max(self.last_time, time)
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if self.count == 1:
+            self.ewma = value
+        else:
+            diff = value - self.ewma
+            step = EWMA_ALPHA * diff
+            self.ewma += step
+            self.ewvar = (1 - EWMA_ALPHA) * (self.ewvar + diff * step)
+        for quantile in self.quantiles:
+            quantile.add(value, self.count)
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else math.nan
+
+    @property
+    def ew_std(self):
+        return math.sqrt(self.ewvar) if self.count > 1 else math.nan
+
+    def quantile(self, p):
+        return self.quantiles[QUANTILES.index(p)].value()
+
+    def zscore(self, value):
+        """На сколько сигм value отличается от недавней нормы (NaN - мало данных)"""
+        if self.count < MIN_SAMPLES or not self.ewvar > 0:
+            return math.nan
+        return (value - self.ewma) / math.sqrt(self.ewvar)
+
+    def summary(self):
+        return {
+            'count': self.count, 'mean': self.mean, 'std': self.std,
+            'ewma': self.ewma, 'ew_std': self.ew_std,
+            **{f'p{round(p * 100)}': quantile.value() for p, quantile in zip(QUANTILES, self.quantiles)},
+        }
+
+    def to_bytes(self):
+        parts = [_HEADER.pack(self.count, self.last_time, self.mean, self.m2, self.ewma, self.ewvar)]
+        for quantile in self.quantiles:
+            heights = quantile.heights + [math.nan] * (5 - len(quantile.heights))
+            parts.append(_MARKERS.pack(*heights, *quantile.positions))
+        return b''.join(parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        stats = cls()
+        if len(data) != STATE_SIZE:
+            # Состояние другого формата - статистика набирается заново
+            return stats
+        stats.count, stats.last_time, stats.mean, stats.m2, stats.ewma, stats.ewvar = _HEADER.unpack_from(data)
+        offset = _HEADER.size
+        for quantile in stats.quantiles:
+            values = _MARKERS.unpack_from(data, offset)
+            quantile.heights = [h for h in values[:5] if not math.isnan(h)]
+            quantile.positions = list(values[5:])
+            offset += _MARKERS.size
+        return stats
+
+
+def fold_sales(stats, sales):
+    """Учесть сделки (time, unit_price) новее stats.last_time; возвращает число учтённых.
+
+    Страницы истории приходят от новых к старым, поэтому всё, что не новее
+    уже учтённого, пропускается - одна сделка не попадает в оценки дважды.
+    """
+    watermark = stats.last_time
+    added = 0
+    for time, unit_price in sorted(sales):
+        if time > watermark:
+            stats.add(unit_price, time)
+            added += 1
+    return added
@@ -0,0 +1,147 @@
+"""Импорт и экспорт списка отслеживаемых строк в CSV и JSON.
+
+Строка файла: item_id или name (русское название из каталога), rarity
+(номер 0-5 или название редкости), target_price, region и rule. Все
+строки файла проверяются до записи в базу, изменения применяются одной
+транзакцией (db.import_tracked_items).
+"""
+import csv
+import json
+import os
+from collections import namedtuple
+
+from api import DEFAULT_REGION, REGIONS
+
+FIELDS = ('item_id', 'name', 'rarity', 'target_price', 'region', 'rule')
+FORMATS = ('csv', 'json')
+RARITY_NAMES = ("Обычный", "Необычный", "Особый", "Редкий", "Исключительный", "Легендарный")
+
+# Разобранная и проверенная строка файла; target_price и rule = None -
+# не указаны (у существующей строки не меняются, новая получает 0 и пусто)
+WatchEntry = namedtuple('WatchEntry', 'item_id rarity target_price region rule')
+
+
+class WatchlistError(ValueError):
+    """Файл не разобран или в нём есть ошибочные строки (errors - по строкам)"""
+    def __init__(self, message, errors=()):
+        super().__init__(message)
+        self.errors = list(errors)
+
+
+def detect_format(path, fmt=None):
+    if fmt:
+        return fmt
+    extension = os.path.splitext(path)[1].lower().lstrip('.')
+    return extension if extension in FORMATS else 'csv'
+
+
+def read_rows(path, fmt=None):
+    """Строки файла как словари; JSON - список объектов или {"items": [...]}"""
+    fmt = detect_format(path, fmt)
+    # utf-8-sig: CSV из Excel начинается с BOM
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        if fmt == 'json':
+            try:
+                data = json.load(f)
+            except ValueError as e:
+                raise WatchlistError(f"Некорректный JSON: {str(e)}")
+            if isinstance(data, dict):
+                data = data.get('items')
+            if not isinstance(data, list) or not all(isinstance(row, dict) for row in data):
+                raise WatchlistError("JSON должен быть списком объектов или {\"items\": [...]}")
+            return data
+        return list(csv.DictReader(f))
+
+
+def name_lookup(catalog):
+    """Название в нижнем регистре -> item_id; неоднозначные названия -> None"""
+    lookup = {}
+    for item_id, name in zip(catalog.ids, catalog.names()):
+        if not name:
+            continue
+        name = name.strip().lower()
+        lookup[name] = item_id if lookup.get(name, item_id) == item_id else None
+    return lookup
+
+
+def _rarity(value):
+    if value in (None, ''):
+        return 0
+    text = str(value).strip()
+    for index, name in enumerate(RARITY_NAMES):
+        if text.lower() == name.lower():
+            return index
+    rarity = int(text)
+    if not 0 <= rarity < len(RARITY_NAMES):
+        raise ValueError(f"редкость вне диапазона 0-{len(RARITY_NAMES) - 1}: {rarity}")
+    return rarity
+
+
+def _price(value):
+    if value in (None, ''):
+        return None
+    # Цены из таблицы приходят и в виде "12 500 руб."
+    text = str(value).replace('руб.', '').replace(' ', '').replace('\xa0', '')
+    price = int(float(text))
+    if price < 0:
+        raise ValueError(f"отрицательная цена: {price}")
+    return price
+
+
+def resolve(rows, catalog):
+    """Проверить строки файла: [WatchEntry] или WatchlistError со всеми ошибками.
+
+    Предмет ищется по item_id, затем по точному названию из каталога; правило
+    разбирается так же, как при вводе в таблицу.
+    """
+    import rules
+
+    names = name_lookup(catalog)
+    entries = []
+    errors = []
+    for number, row in enumerate(rows, 1):
+        row = {str(key).strip().lower(): value for key, value in row.items() if key is not None}
+        try:
+            item_id = str(row.get('item_id') or '').strip()
+            name = str(row.get('name') or '').strip()
+            if not item_id and name:
+                item_id = names.get(name.lower())
+                if item_id is None:
+                    raise ValueError(f"название {name!r} не найдено в каталоге" if name.lower() not in names
+                                     else f"название {name!r} неоднозначно, укажите item_id")
+            if not item_id:
+                raise ValueError("нет item_id и названия")
+            # Без загруженного каталога item_id принимается как есть
+            if len(catalog) and item_id not in catalog:
+                raise ValueError(f"item_id {item_id!r} не найден в каталоге")
+            region = str(row.get('region') or DEFAULT_REGION).strip().lower()
+            if region not in REGIONS:
+                raise ValueError(f"неизвестный регион {region!r}")
+            rule = str(row.get('rule') or '').strip() or None
+            if rule:
+                rules.compile_rule(rule)
+            entries.append(WatchEntry(item_id, _rarity(row.get('rarity')), _price(row.get('target_price')), region, rule))
+        except ValueError as e:
+            # rules.RuleError - тоже ValueError
+            errors.append(f"строка {number}: {str(e)}")
+    if errors:
+        raise WatchlistError(f"Ошибок в файле: {len(errors)}", errors)
+    return entries
+
+
+def write_rows(path, tracked, catalog=None, fmt=None):
+    """Сохранить строки db.get_tracked_items(); возвращает число строк"""
+    rows = []
+    for _, item_id, target_price, rarity, region, rule in tracked:
+        name = catalog.name(item_id, '') if catalog is not None else ''
+        rows.append({'item_id': item_id, 'name': name, 'rarity': rarity,
+                     'target_price': target_price, 'region': region, 'rule': rule or ''})
+    fmt = detect_format(path, fmt)
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        if fmt == 'json':
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+        else:
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+    return len(rows)